@@ -0,0 +1,436 @@
+# Columnar spending analytics: NumPy arrays per user or cohort, extended as new rows arrive
+import sqlite3
+import argparse
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+
+import rollup
+import storage
+
+# Database configuration
+DATABASE = 'budget_management.db'
+
+ROLLING_WINDOWS = (3, 6, 12)
+PERCENTILES = (25, 50, 75, 90)
+
+# Histories kept in memory by HistoryCache
+DEFAULT_CACHE_SIZE = 256
+
+# Rows after a watermark. Every column comes from the (UserID, Date, ...)
+# covering indexes, so one user's rows are read without touching the table.
+EXPENSE_ROWS_SQL = "SELECT ExpenseID, UserID, Date, Amount, Category FROM Expenses"
+TRANSACTION_ROWS_SQL = "SELECT TransactionID, UserID, Date, Amount, TransactionType FROM Transactions"
+USER_ROWS_WHERE = " WHERE UserID = ? AND {key} > ?"
+ALL_ROWS_WHERE = " WHERE {key} > ?"
+
+BASE_INCOME_SQL = "SELECT UserID, OriginalIncome FROM User"
+TOTAL_VERSION_SQL = "SELECT COALESCE(SUM(Version), 0) FROM DataVersion"
+
+
+class Dictionary:
+    """Dictionary encoding: each distinct string gets a small integer code"""
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def encode(self, values):
+        distinct, inverse = np.unique(np.asarray(values, dtype=object), return_inverse=True)
+        codes = np.empty(len(distinct), dtype=np.int32)
+        for i, value in enumerate(distinct):
+            code = self._codes.get(value)
+            if code is None:
+                code = self._codes[value] = len(self.values)
+                self.values.append(value)
+            codes[i] = code
+        return codes[inverse]
+
+    def code(self, value):
+        return self._codes.get(value)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class Columns:
+    """Growable column arrays; append() doubles capacity instead of copying on every batch"""
+
+    def __init__(self, **dtypes):
+        self._arrays = {name: np.empty(0, dtype=dtype) for name, dtype in dtypes.items()}
+        self.size = 0
+
+    def append(self, **batch):
+        n = len(next(iter(batch.values())))
+        needed = self.size + n
+        for name, values in batch.items():
+            array = self._arrays[name]
+            if needed > len(array):
+                grown = np.empty(max(needed, 2 * len(array), 1024), dtype=array.dtype)
+                grown[:self.size] = array[:self.size]
+                array = self._arrays[name] = grown
+            array[self.size:needed] = values
+        self.size = needed
+
+    def __getitem__(self, name):
+        return self._arrays[name][:self.size]
+
+
+def _days(dates):
+    """'YYYY-MM-DD' strings to int32 days since 1970-01-01"""
+    return np.array([d[:10] for d in dates], dtype='datetime64[D]').astype(np.int32)
+
+
+def _month_index(days):
+    """Days since the epoch to months since the epoch"""
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int32)
+
+
+def _month_label(index):
+    return str(np.datetime64(int(index), 'M'))
+
+
+# === Column Store ===
+class SpendingHistory:
+    """One user's (user_id) or every user's (None) expenses and transactions as NumPy columns.
+
+    refresh() reads only rows past the last loaded id. Every expense or
+    transaction insert bumps DataVersion by one, so when the version moved
+    by exactly the number of new rows nothing was edited or deleted and the
+    arrays are extended; otherwise they are reloaded from scratch.
+    """
+
+    def __init__(self, user_id=None):
+        self.user_id = user_id
+        self.lock = threading.Lock()
+        self.metrics = {"refreshes": 0, "appended_rows": 0, "reloads": 0}
+        self._reset()
+
+    def _reset(self):
+        self.users = Dictionary()
+        self.categories = Dictionary()
+        self.expenses = Columns(user=np.int32, day=np.int32, amount=np.float64, category=np.int32)
+        # Signed: received is positive, sent negative
+        self.transactions = Columns(user=np.int32, day=np.int32, amount=np.float64)
+        self.base_income = np.zeros(0)
+        self.version = None
+        self._watermarks = {"expenses": 0, "transactions": 0}
+
+    def _rows(self, conn, sql, key, kind):
+        if self.user_id is None:
+            return conn.execute(sql + ALL_ROWS_WHERE.format(key=key), (self._watermarks[kind],)).fetchall()
+        return conn.execute(sql + USER_ROWS_WHERE.format(key=key),
+                            (self.user_id, self._watermarks[kind])).fetchall()
+
+    def _read(self, conn):
+        """Version, new rows and base incomes from one consistent snapshot"""
+        own_transaction = not conn.in_transaction
+        if own_transaction:
+            conn.execute("BEGIN")
+        try:
+            if self.user_id is None:
+                version = conn.execute(TOTAL_VERSION_SQL).fetchone()[0]
+                incomes = conn.execute(BASE_INCOME_SQL).fetchall()
+            else:
+                version = rollup.data_version(conn, self.user_id)
+                incomes = conn.execute(BASE_INCOME_SQL + " WHERE UserID = ?", (self.user_id,)).fetchall()
+            if version == self.version:
+                return version, None, None, incomes
+            expenses = self._rows(conn, EXPENSE_ROWS_SQL, "ExpenseID", "expenses")
+            transactions = self._rows(conn, TRANSACTION_ROWS_SQL, "TransactionID", "transactions")
+            return version, expenses, transactions, incomes
+        finally:
+            if own_transaction:
+                conn.rollback()  # Read-only; just ends the snapshot
+
+    def refresh(self, conn):
+        """Bring the arrays up to date with the database; returns self"""
+        with self.lock:
+            self.metrics["refreshes"] += 1
+            version, expenses, transactions, incomes = self._read(conn)
+            if expenses is not None:
+                appended = len(expenses) + len(transactions)
+                if self.version is not None and version - self.version != appended:
+                    # Rows were edited or deleted: the appended-only view is no longer valid
+                    self._reset()
+                    self.metrics["reloads"] += 1
+                    version, expenses, transactions, incomes = self._read(conn)
+                    appended = len(expenses) + len(transactions)
+                self._append(expenses, transactions)
+                self.metrics["appended_rows"] += appended
+                self.version = version
+            self._set_incomes(incomes)
+        return self
+
+    def _append(self, expenses, transactions):
+        if expenses:
+            ids, users, dates, amounts, categories = zip(*expenses)
+            self.expenses.append(user=self.users.encode(users), day=_days(dates),
+                                 amount=np.asarray(amounts, dtype=np.float64),
+                                 category=self.categories.encode(categories))
+            self._watermarks["expenses"] = max(self._watermarks["expenses"], max(ids))
+        if transactions:
+            ids, users, dates, amounts, types = zip(*transactions)
+            sign = np.where(np.asarray(types, dtype=object) == "received", 1.0, -1.0)
+            self.transactions.append(user=self.users.encode(users), day=_days(dates),
+                                     amount=sign * np.asarray(amounts, dtype=np.float64))
+            self._watermarks["transactions"] = max(self._watermarks["transactions"], max(ids))
+
+    def _set_incomes(self, incomes):
+        if incomes:
+            self.users.encode([user_id for user_id, _ in incomes])
+        base = np.zeros(len(self.users))
+        for user_id, income in incomes:
+            base[self.users.code(user_id)] = income
+        self.base_income = base
+
+    def stats(self):
+        return {**self.metrics, "users": len(self.users), "categories": len(self.categories),
+                "expense_rows": self.expenses.size, "transaction_rows": self.transactions.size,
+                "version": self.version}
+
+
+def load(paths, user_id=None):
+    """One-off SpendingHistory over several database files, e.g. every shard.
+
+    Shards hold disjoint users, so their rows are simply concatenated. The
+    result is a snapshot: its id watermarks span files, so do not refresh() it.
+    """
+    history = SpendingHistory(user_id)
+    incomes = []
+    for path in paths:
+        conn = sqlite3.connect(path)
+        try:
+            history._watermarks = {"expenses": 0, "transactions": 0}
+            _, expenses, transactions, shard_incomes = history._read(conn)
+        finally:
+            conn.close()
+        history._append(expenses, transactions)
+        incomes += shard_incomes
+    history._set_incomes(incomes)
+    return history
+
+
+# === Vectorized Aggregation ===
+def monthly(history, through=None):
+    """Per-user monthly cubes for every month from the first row through `through` (default: today).
+
+    Returns (first_month, spend[U, M, C], received[U, M], sent[U, M]) with
+    U users, M months and C categories in the history's dictionary order.
+    """
+    through = _month_index(np.array([(through or date.today()).isoformat()],
+                                    dtype='datetime64[D]').astype(np.int32))[0]
+    e_month = _month_index(history.expenses["day"])
+    t_month = _month_index(history.transactions["day"])
+    first = min([through] + [m.min() for m in (e_month, t_month) if m.size])
+    U, M, C = len(history.users), int(through - first) + 1, max(len(history.categories), 1)
+
+    keep = e_month <= through
+    user = history.expenses["user"][keep].astype(np.int64)  # Cell numbers can pass 2**31 for large cohorts
+    cell = (user * M + (e_month[keep] - first)) * C + history.expenses["category"][keep]
+    spend = np.bincount(cell, weights=history.expenses["amount"][keep], minlength=U * M * C).reshape(U, M, C)
+
+    keep = t_month <= through
+    cell = history.transactions["user"][keep].astype(np.int64) * M + (t_month[keep] - first)
+    amount = history.transactions["amount"][keep]
+    received = np.bincount(cell, weights=np.maximum(amount, 0.0), minlength=U * M).reshape(U, M)
+    sent = np.bincount(cell, weights=np.maximum(-amount, 0.0), minlength=U * M).reshape(U, M)
+    return first, spend, received, sent
+
+
+def month_over_month(totals):
+    """(delta, pct) along the last axis; pct is NaN where the previous month was 0"""
+    delta = np.diff(totals, axis=-1)
+    previous = totals[..., :-1]
+    pct = np.divide(delta, previous, out=np.full_like(delta, np.nan), where=previous != 0) * 100
+    return delta, pct
+
+
+def rolling_mean(totals, window):
+    """Trailing mean over the last axis; the first months average what is available"""
+    cs = np.cumsum(totals, axis=-1)
+    sums = cs.copy()
+    sums[..., window:] = cs[..., window:] - cs[..., :-window]
+    return sums / np.minimum(np.arange(1, totals.shape[-1] + 1), window)
+
+
+def savings_rate(base_income, spend_total, received, sent):
+    """(inflow - outflow) / inflow per user and month, with OriginalIncome as monthly income"""
+    inflow = base_income[:, None] + received
+    outflow = spend_total + sent
+    return np.divide(inflow - outflow, inflow, out=np.full_like(inflow, np.nan), where=inflow > 0)
+
+
+def trend(values, months=12):
+    """Least-squares slope per row over the last `months` columns, ignoring NaN"""
+    values = values[..., -months:]
+    valid = ~np.isnan(values)
+    t = np.broadcast_to(np.arange(values.shape[-1], dtype=float), values.shape)
+    n = valid.sum(axis=-1)
+    t_mean = np.where(valid, t, 0).sum(axis=-1) / np.maximum(n, 1)
+    v_mean = np.where(valid, values, 0).sum(axis=-1) / np.maximum(n, 1)
+    dt = np.where(valid, t - t_mean[..., None], 0)
+    dv = np.where(valid, values - v_mean[..., None], 0)
+    denom = (dt * dt).sum(axis=-1)
+    return np.divide((dt * dv).sum(axis=-1), denom, out=np.full(denom.shape, np.nan), where=denom > 0)
+
+
+def category_percentiles(history, user_code=None, q=PERCENTILES):
+    """{category: [percentiles of single expense amounts]}, for one user code or everyone"""
+    category = history.expenses["category"]
+    amount = history.expenses["amount"]
+    if user_code is not None:
+        mine = history.expenses["user"] == user_code
+        category, amount = category[mine], amount[mine]
+    order = np.lexsort((amount, category))
+    category, amount = category[order], amount[order]
+    codes, starts = np.unique(category, return_index=True)
+    bounds = np.append(starts, len(category))
+    return {history.categories.values[code]: np.percentile(amount[bounds[i]:bounds[i + 1]], q)
+            for i, code in enumerate(codes)}
+
+
+# === Reports ===
+def _json(values, digits=2):
+    """Rounded list with NaN as None, for JSON"""
+    return [None if np.isnan(v) else round(float(v), digits) for v in np.asarray(values, dtype=float)]
+
+
+def user_report(history, user_id, months=12, through=None):
+    """Trends for one user over their last `months` months, as JSON-ready data"""
+    code = history.users.code(user_id)
+    if code is None:
+        return None
+    first, spend, received, sent = monthly(history, through)
+    spend, received, sent = spend[code], received[code], sent[code]
+    total = spend.sum(axis=-1)
+    rate = savings_rate(history.base_income[code:code + 1], total[None], received[None], sent[None])[0]
+    delta, pct = month_over_month(total)
+    shown = slice(-months, None)
+    categories = history.categories.values
+
+    return {
+        "months": [_month_label(first + i) for i in range(total.shape[0])][shown],
+        "total": _json(total[shown]),
+        "by_category": {c: _json(spend[shown, i]) for i, c in enumerate(categories) if spend[:, i].any()},
+        "mom_delta": _json(np.append(np.nan, delta)[shown]),
+        "mom_pct": _json(np.append(np.nan, pct)[shown], 1),
+        "rolling": {str(w): _json(rolling_mean(total, w)[shown]) for w in ROLLING_WINDOWS},
+        "percentiles": {c: dict(zip((f"p{q}" for q in PERCENTILES), _json(p)))
+                        for c, p in category_percentiles(history, code).items()},
+        "savings_rate": _json(rate[shown], 4),
+        "savings_trend": _json([trend(rate, months)], 5)[0],
+    }
+
+
+def cohort_report(history, months=12, through=None):
+    """Cohort-wide medians of the same measures, computed for all users at once"""
+    first, spend, received, sent = monthly(history, through)
+    total = spend.sum(axis=-1)
+    rate = savings_rate(history.base_income, total, received, sent)
+    _, pct = month_over_month(total)
+    shown = slice(-months, None)
+    with np.errstate(all='ignore'):
+        return {
+            "users": len(history.users),
+            "months": [_month_label(first + i) for i in range(total.shape[1])][shown],
+            "median_total": _json(np.median(total, axis=0)[shown]),
+            "median_mom_pct": _json(np.append(np.nan, np.nanmedian(pct, axis=0))[shown], 1),
+            "rolling_median": {str(w): _json(np.median(rolling_mean(total, w), axis=0)[shown])
+                               for w in ROLLING_WINDOWS},
+            "median_savings_rate": _json(np.nanmedian(rate, axis=0)[shown], 4),
+            "median_savings_trend": _json([np.nanmedian(trend(rate, months))], 5)[0],
+            "category_monthly_percentiles": {
+                c: dict(zip((f"p{q}" for q in PERCENTILES), _json(np.percentile(spend[:, shown, i], PERCENTILES))))
+                for i, c in enumerate(history.categories.values)
+            },
+        }
+
+
+# === Cache ===
+class HistoryCache:
+    """LRU of SpendingHistory objects keyed by (database path, user_id or None for the cohort)"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, user_id=None):
+        key = (path, user_id)
+        with self._lock:
+            history = self._items.get(key)
+            if history is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return history
+            self.misses += 1
+            history = self._items[key] = SpendingHistory(user_id)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+            return history
+
+    def stats(self):
+        with self._lock:
+            histories = list(self._items.values())
+            stats = {"hits": self.hits, "misses": self.misses, "size": len(histories), "maxsize": self.maxsize}
+        stats["rows"] = sum(h.expenses.size + h.transactions.size for h in histories)
+        stats["appended_rows"] = sum(h.metrics["appended_rows"] for h in histories)
+        stats["reloads"] = sum(h.metrics["reloads"] for h in histories)
+        return stats
+
+
+def print_report(report):
+    """Plain-text rendering of user_report() for the CLI"""
+    print(f"\n{'Month':<9}{'Spent':>12}{'MoM %':>9}" + "".join(f"{f'Avg {w}m':>12}" for w in ROLLING_WINDOWS)
+          + f"{'Savings':>10}")
+    for i, month in enumerate(report["months"]):
+        pct = report["mom_pct"][i]
+        rate = report["savings_rate"][i]
+        print(f"{month:<9}{report['total'][i]:>12.2f}{'' if pct is None else f'{pct:.1f}':>9}"
+              + "".join(f"{report['rolling'][str(w)][i]:>12.2f}" for w in ROLLING_WINDOWS)
+              + f"{'' if rate is None else f'{rate:.1%}':>10}")
+    trend_value = report["savings_trend"]
+    if trend_value is not None:
+        print(f"\nSavings rate trend: {trend_value * 100:+.2f} points per month")
+    print("\nTypical expense size by category (p25 / p50 / p75 / p90):")
+    for category, p in sorted(report["percentiles"].items()):
+        print(f"  {category:<16}" + " / ".join(f"{v:.2f}" for v in p.values()))
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spending trends from in-memory column arrays.")
+    parser.add_argument("--db", default=DATABASE,
+                        help="Path to the SQLite database (ignored when EXPENSE_SHARDS is set)")
+    parser.add_argument("--user", help="Report for one UserID (default: cohort summary of every user)")
+    parser.add_argument("--months", type=int, default=12)
+    args = parser.parse_args()
+
+    backend = storage.from_env(args.db)
+    started = time.perf_counter()
+    history = load([backend.path_for(args.user)] if args.user else backend.paths(), args.user)
+    loaded = time.perf_counter() - started
+
+    if args.user:
+        report = user_report(history, args.user, args.months)
+        if report is None:
+            print(f"[ERROR] User not found: {args.user}")
+            raise SystemExit(1)
+        print_report(report)
+    else:
+        started = time.perf_counter()
+        report = cohort_report(history, args.months)
+        computed = time.perf_counter() - started
+        print(f"[INFO] {report['users']} users, {history.expenses.size} expenses and "
+              f"{history.transactions.size} transactions loaded in {loaded:.2f}s; "
+              f"cohort measures computed in {computed * 1000:.1f} ms.")
+        for i, month in enumerate(report["months"]):
+            rate = report["median_savings_rate"][i]
+            print(f"  {month}  median spent={report['median_total'][i]:<10} "
+                  f"median savings rate={'' if rate is None else f'{rate:.1%}'}")
@@ -1,9 +1,31 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, g
-from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
+from flask import (Flask, render_template, request, redirect, url_for, session, jsonify, g, Response,
+                   stream_with_context, has_request_context)
 from datetime import datetime, timedelta
+import atexit
 import logging
+import os
 from functools import wraps
+import io
+
+import broker
+import budgets
+import analytics
+import bulk_import
+import cache
+import charts
+import forecast
+import hashing
+import history
+import login_guard
+import repository
+import rollup
+import scoring
+import storage
+import writer
+import numpy as np
+from model_store import default_store as model_store
+from training import predict_savings_batch
+from pool import ConnectionPool
 
 # Configure logging
 logging.basicConfig(
@@ -21,72 +43,117 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
 # Database configuration
 DATABASE = 'budget_management.db'
-
-def get_db():
-    db = getattr(g, '_database', None)
+app.config['DB_POOL_SIZE'] = 8
+app.config['DB_POOL_TIMEOUT'] = 5.0
+app.config['CHART_CACHE_SIZE'] = 512
+app.config['DASHBOARD_CACHE_SIZE'] = 1024  # users whose assembled dashboard is kept
+app.config['DASHBOARD_CACHE_TTL'] = 60.0   # seconds; bounds staleness from writes no invalidation sees
+app.config['ANALYTICS_CACHE_SIZE'] = 256   # users whose column arrays stay in memory
+app.config['LOGIN_IP_LIMIT'] = 20        # attempts per IP ...
+app.config['LOGIN_IP_WINDOW'] = 60       # ... per this many seconds
+app.config['LOGIN_USER_LIMIT'] = 5       # attempts per (UserID, IP), cleared on success ...
+app.config['LOGIN_USER_WINDOW'] = 300    # ... per this many seconds
+app.config['GROUP_COMMIT_WINDOW'] = 0.0  # extra seconds the writer waits to coalesce commits
+# Unix socket of a running `python broker.py`; when set, every worker sends its
+# writes to that single writer process instead of committing them itself
+app.config['WRITE_BROKER_ADDRESS'] = os.environ.get('WRITE_BROKER_ADDRESS')
+app.config['WRITE_BROKER_AUTHKEY'] = os.environ.get('WRITE_BROKER_AUTHKEY')  # unset: the key file the broker generated
+# Shard directory from `python storage.py init`; when set, each user's rows live
+# in the shard file their UserID hashes to instead of in DATABASE
+app.config['STORAGE_SHARDS'] = os.environ.get(storage.SHARDS_ENV)
+app.config['HASH_WORKERS'] = None        # worker processes (None: one per CPU, 0: inline)
+app.config['HASH_MAX_PENDING'] = None    # queued + running hashes before 503 (None: 4 per worker)
+app.config['HASH_METHOD'] = None         # werkzeug method and work factor, e.g. 'scrypt:32768:8:1'
+
+backend = storage.open_storage(app.config['STORAGE_SHARDS'], DATABASE)
+
+# Connections are opened once per process, configured with WAL and
+# the other pragmas at creation, and reused across requests (one pool per file)
+pools = storage.PerShard(lambda path: ConnectionPool(
+    path, size=app.config['DB_POOL_SIZE'], timeout=app.config['DB_POOL_TIMEOUT']))
+
+# Rendered chart images, keyed by user, month and the user's data version
+chart_cache = charts.ChartCache(app.config['CHART_CACHE_SIZE'])
+
+# Per-user spending history as NumPy columns, extended with new rows on each request
+spending_histories = analytics.HistoryCache(app.config['ANALYTICS_CACHE_SIZE'])
+
+# Assembled dashboard payloads per user, dropped by cache.invalidate() on every
+# write to the user's data (shared between workers when DASHBOARD_CACHE_ADDRESS is set)
+dashboard_cache = cache.default_cache(app.config['DASHBOARD_CACHE_SIZE'], app.config['DASHBOARD_CACHE_TTL'])
+
+# Brute-force throttling happens in memory before any database work, and login
+# audit rows are written in batches off the request thread
+ip_limiter = login_guard.SlidingWindowLimiter(app.config['LOGIN_IP_LIMIT'], app.config['LOGIN_IP_WINDOW'])
+user_limiter = login_guard.SlidingWindowLimiter(app.config['LOGIN_USER_LIMIT'], app.config['LOGIN_USER_WINDOW'])
+audit_logs = storage.PerShard(login_guard.AuditLogWriter)
+atexit.register(audit_logs.call, 'close')
+
+# Request-path writes go through one connection that commits concurrent
+# requests together instead of one fsync per request (or, in multi-worker
+# deployments, through the shared write broker; reads stay local either way)
+if app.config['WRITE_BROKER_ADDRESS']:
+    if backend.sharded:
+        raise RuntimeError("The write broker serves a single database file; unset WRITE_BROKER_ADDRESS "
+                           f"or {storage.SHARDS_ENV}")
+    authkey = app.config['WRITE_BROKER_AUTHKEY']
+    db_writer = broker.BrokerClient(app.config['WRITE_BROKER_ADDRESS'], authkey.encode() if authkey else None)
+elif backend.sharded:
+    db_writer = storage.ShardedWriter(backend, window=app.config['GROUP_COMMIT_WINDOW'])
+else:
+    db_writer = writer.GroupCommitWriter(DATABASE, window=app.config['GROUP_COMMIT_WINDOW'])
+atexit.register(db_writer.close)
+
+# Password hashing is CPU-bound by design; run it in worker processes so a
+# login storm cannot starve the threads serving every other route
+hasher = hashing.HashingService(app.config['HASH_WORKERS'], app.config['HASH_MAX_PENDING'],
+                                app.config['HASH_METHOD'])
+atexit.register(hasher.shutdown)
+
+def _path_for(user_id=None):
+    """File holding user_id's rows, defaulting to the logged-in user's"""
+    if user_id is None and has_request_context():
+        user_id = session.get('user_id')
+    return backend.path_for(user_id)
+
+def get_db(user_id=None):
+    path = _path_for(user_id)
+    if '_databases' not in g:
+        g._databases, g._repositories = {}, {}
+    db = g._databases.get(path)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
-        db.execute("PRAGMA foreign_keys = ON;")
+        db = g._databases[path] = pools[path].acquire()
     return db
 
+def get_repo(user_id=None):
+    path = _path_for(user_id)
+    db = get_db(user_id)
+    repo = g._repositories.get(path)
+    if repo is None:
+        repo = g._repositories[path] = repository.Repository(db)
+    return repo
+
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_database', None)
-    if db is not None:
-        db.close()
+    g.pop('_repositories', None)
+    for path, db in g.pop('_databases', {}).items():
+        pools[path].release(db)
 
 def init_db():
-    with app.app_context():
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS User (
-                UserID TEXT PRIMARY KEY,
-                Email TEXT UNIQUE NOT NULL,
-                Password TEXT NOT NULL,
-                Income REAL NOT NULL,
-                OriginalIncome REAL NOT NULL,
-                CreatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Expenses (
-                ExpenseID INTEGER PRIMARY KEY AUTOINCREMENT,
-                UserID TEXT NOT NULL,
-                Amount REAL NOT NULL,
-                Category TEXT NOT NULL,
-                Date DATE NOT NULL,
-                Income REAL NOT NULL,
-                FOREIGN KEY (UserID) REFERENCES User(UserID) ON DELETE CASCADE
-            );
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Transactions (
-                TransactionID INTEGER PRIMARY KEY AUTOINCREMENT,
-                UserID TEXT NOT NULL,
-                TransactionType TEXT NOT NULL,
-                Amount REAL NOT NULL,
-                Date DATE NOT NULL,
-                FOREIGN KEY (UserID) REFERENCES User(UserID) ON DELETE CASCADE
-            );
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS LoginAttempts (
-                AttemptID INTEGER PRIMARY KEY AUTOINCREMENT,
-                UserID TEXT,
-                IPAddress TEXT NOT NULL,
-                AttemptTime TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                Success BOOLEAN NOT NULL,
-                FOREIGN KEY (UserID) REFERENCES User(UserID) ON DELETE CASCADE
-            );
-        ''')
-        
-        conn.commit()
+    backend.init()
+
+def _shard_stats(resources):
+    """Stats per database file, or just the one file's when not sharded"""
+    stats = resources.stats()
+    return stats if backend.sharded else stats.get(backend.path_for(), {})
+
+def _hashing_busy(e):
+    """503 with Retry-After when the hashing pool is saturated"""
+    logger.warning(f"{request.path} shed: password hashing saturated")
+    response = jsonify({'success': False, 'message': 'The server is busy. Please try again shortly.'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
 
 def login_required(f):
     @wraps(f)
@@ -112,29 +179,33 @@ def login():
         if not userid or not password:
             return render_template('login.html', error="Please fill in all fields")
 
+        # Attempts count against a UserID only from the IP that sent them, so
+        # nobody can lock an account out just by naming it. The attempt is
+        # reserved before the password check, so concurrent guesses cannot all
+        # pass the limit; a successful login clears the key again.
+        user_key = (userid, ip_address)
+        retry_after = max(ip_limiter.hit(ip_address), user_limiter.hit(user_key))
+        audit_log = audit_logs[backend.path_for(userid)]
+        if retry_after:
+            audit_log.record(userid, ip_address, False)
+            logger.warning(f"Throttled login attempt for user {userid} from IP {ip_address}")
+            response = app.make_response((render_template(
+                'login.html', error="Too many login attempts. Please try again later."), 429))
+            response.headers['Retry-After'] = str(int(retry_after) + 1)
+            return response
+
         try:
-            conn = get_db()
-            
-            conn.execute(
-                'INSERT INTO LoginAttempts (UserID, IPAddress, Success) VALUES (?, ?, ?)',
-                (userid, ip_address, False)
-            )
-            conn.commit()
-
-            user = conn.execute(
-                'SELECT * FROM User WHERE UserID = ?', (userid,)
-            ).fetchone()
-
-            if user and check_password_hash(user['Password'], password):
-                conn.execute(
-                    'UPDATE LoginAttempts SET Success = ? WHERE AttemptID = ?',
-                    (True, conn.execute('SELECT last_insert_rowid()').fetchone()[0])
-                )
-                conn.commit()
+            user = get_repo(userid).get_user(userid, ('UserID', 'Email', 'Password'))
+
+            success = bool(user and hasher.verify(user.Password, password))
+            audit_log.record(userid, ip_address, success)
+
+            if success:
+                user_limiter.reset(user_key)
 
                 session.permanent = True
-                session['user_id'] = user['UserID']
-                session['email'] = user['Email']
+                session['user_id'] = user.UserID
+                session['email'] = user.Email
                 logger.info(f"User {userid} logged in successfully from IP {ip_address}")
                 
                 return redirect(request.args.get('next') or url_for('dashboard'))
@@ -142,6 +213,12 @@ def login():
                 logger.warning(f"Failed login attempt for user {userid} from IP {ip_address}")
                 return render_template('login.html', error="Invalid username or password")
 
+        except hashing.HashingBusy as e:
+            logger.warning(f"Login for user {userid} shed: password hashing saturated")
+            response = app.make_response((render_template(
+                'login.html', error="The server is busy. Please try again shortly."), 503))
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
         except Exception as e:
             logger.error(f"Login error: {str(e)}")
             return render_template('login.html', error="Login failed. Please try again.")
@@ -149,6 +226,10 @@ def login():
     registered = request.args.get('registered') == 'true'
     return render_template('login.html', registered=registered)
 
+def _user_exists(userid, email):
+    """UserID or email already taken on the user's own file"""
+    return get_repo(userid).user_exists(userid, email)
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'GET':
@@ -178,21 +259,20 @@ def register():
         except ValueError:
             return jsonify({'success': False, 'message': 'Invalid income value'})
 
-        conn = get_db()
-        existing_user = conn.execute(
-            'SELECT 1 FROM User WHERE UserID = ? OR Email = ?', (userid, email)
-        ).fetchone()
-        
-        if existing_user:
+        if _user_exists(userid, email):
             logger.warning(f"Registration attempt with existing user: {userid} or email: {email}")
             return jsonify({'success': False, 'message': 'User ID or Email already exists'})
 
-        hashed_pw = generate_password_hash(password)
-        conn.execute(
-            'INSERT INTO User (UserID, Email, Password, Income, OriginalIncome) VALUES (?, ?, ?, ?, ?)',
-            (userid, email, hashed_pw, income, income)
-        )
-        conn.commit()
+        hashed_pw = hasher.hash(password)
+        # Emails must be unique across shards: reserve it before the insert
+        if not backend.claim_email(userid, email):
+            logger.warning(f"Registration attempt with existing email: {email}")
+            return jsonify({'success': False, 'message': 'User ID or Email already exists'})
+        try:
+            db_writer.execute(repository.Repository.create_user, userid, email, hashed_pw, income)
+        except Exception:
+            backend.release_email(userid, email)
+            raise
         logger.info(f"New user registered: {userid}")
 
         return jsonify({
@@ -201,51 +281,76 @@ def register():
             'redirect': url_for('login', registered='true')
         })
         
+    except hashing.HashingBusy as e:
+        return _hashing_busy(e)
     except Exception as e:
         logger.error(f"Registration error: {str(e)}")
         return jsonify({'success': False, 'message': 'Registration failed. Please try again.'})
 
+def _load_dashboard(user_id, today):
+    """Everything the dashboard template shows for one user, or None if the user is gone"""
+    conn = get_db()
+    repo = get_repo()
+    user = repo.get_user(user_id)
+    if not user:
+        return None
+
+    first_day = today.replace(day=1)
+
+    expenses = repo.expenses_between(user_id, first_day.isoformat(), today.isoformat())
+    transactions = repo.transactions_between(user_id, first_day.isoformat(), today.isoformat())
+
+    # Month-level totals come from the maintained rollup, not from raw rows
+    month = today.strftime('%Y-%m')
+    expense_totals = dict(rollup.expense_totals(conn, user_id, month))
+    transaction_totals = dict(rollup.transaction_totals(conn, user_id, month))
+
+    # Convert to dictionaries for the template
+    user_dict = user.as_dict()
+    expenses_list = [e.as_dict() for e in expenses]
+    transactions_list = [t.as_dict() for t in transactions]
+    
+    # Add additional data needed by the dashboard template
+    user_dict['expenses'] = expenses_list
+    user_dict['transactions'] = transactions_list
+    user_dict['expense_totals'] = expense_totals
+    user_dict['transaction_totals'] = transaction_totals
+
+    return {
+        'day': today.isoformat(),
+        'user': user_dict,
+        'expenses': expenses_list,
+        'transactions': transactions_list,
+        'expense_totals': expense_totals,
+        'transaction_totals': transaction_totals,
+    }
+
 @app.route('/dashboard')
 @login_required
 def dashboard():
     user_id = session['user_id']
     
     try:
-        conn = get_db()
-        user = conn.execute(
-            'SELECT * FROM User WHERE UserID = ?', (user_id,)
-        ).fetchone()
-        
-        if not user:
-            session.clear()
-            return redirect(url_for('login'))
-
         today = datetime.today().date()
-        first_day = today.replace(day=1)
-
-        expenses = conn.execute(
-            'SELECT * FROM Expenses WHERE UserID = ? AND Date BETWEEN ? AND ?',
-            (user_id, first_day, today)
-        ).fetchall()
-
-        transactions = conn.execute(
-            'SELECT * FROM Transactions WHERE UserID = ? AND Date BETWEEN ? AND ?',
-            (user_id, first_day, today)
-        ).fetchall()
-
-        # Convert to dictionaries for the template
-        user_dict = dict(user)
-        expenses_list = [dict(e) for e in expenses]
-        transactions_list = [dict(t) for t in transactions]
-        
-        # Add additional data needed by the dashboard template
-        user_dict['expenses'] = expenses_list
-        user_dict['transactions'] = transactions_list
-        
-        return render_template('dashboard.html', 
-            user=user_dict,
-            expenses=expenses_list,
-            transactions=transactions_list)
+        payload, token = dashboard_cache.lookup(user_id)
+        if payload is not None and payload['day'] != today.isoformat():
+            # Month-to-date data from a previous day; start over for today
+            dashboard_cache.invalidate(user_id)
+            payload, token = dashboard_cache.lookup(user_id)
+
+        if payload is None:
+            payload = _load_dashboard(user_id, today)
+            if payload is None:
+                session.clear()
+                return redirect(url_for('login'))
+            dashboard_cache.store(user_id, payload, token)
+
+        return render_template('dashboard.html',
+            user=payload['user'],
+            expenses=payload['expenses'],
+            transactions=payload['transactions'],
+            expense_totals=payload['expense_totals'],
+            transaction_totals=payload['transaction_totals'])
             
     except Exception as e:
         logger.error(f"Dashboard error for user {user_id}: {str(e)}")
@@ -270,29 +375,331 @@ def update_user():
         return jsonify({'success': False, 'message': 'Invalid request'})
     
     try:
-        conn = get_db()
         user_id = session['user_id']
         
         if field == 'income':
-            conn.execute(
-                'UPDATE User SET Income = ? WHERE UserID = ?',
-                (float(value), user_id)
-            )
+            # OriginalIncome is rebased by the same difference so the running
+            # balance stays reconcilable against the user's history
+            db_writer.execute(repository.Repository.set_income, user_id, float(value))
         elif field == 'password':
-            hashed_pw = generate_password_hash(value)
-            conn.execute(
-                'UPDATE User SET Password = ? WHERE UserID = ?',
-                (hashed_pw, user_id)
-            )
+            db_writer.execute(repository.Repository.update_user, user_id, Password=hasher.hash(value))
         # Add other fields as needed
+        cache.invalidate(user_id)
             
-        conn.commit()
         return jsonify({'success': True})
         
+    except hashing.HashingBusy as e:
+        return _hashing_busy(e)
     except Exception as e:
         logger.error(f"Update user error: {str(e)}")
         return jsonify({'success': False, 'message': 'Update failed'})
 
+@app.route('/api/import/<kind>', methods=['POST'])
+@login_required
+def import_records(kind):
+    if kind not in bulk_import.KINDS:
+        return jsonify({'success': False, 'message': 'Unknown import kind'})
+
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'success': False, 'message': 'No file uploaded'})
+
+    fmt = request.form.get('format') or bulk_import.guess_format(upload.filename)
+    if fmt not in bulk_import.FORMATS:
+        return jsonify({'success': False, 'message': 'Format must be csv or jsonl'})
+
+    user_id = session['user_id']
+    try:
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+        # Chunks are written by db_writer like every other request-path write,
+        # so a broker deployment keeps a single writer process
+        report = bulk_import.import_stream(get_db(), user_id, kind, stream, fmt,
+                                           write=lambda *chunk: db_writer.execute(bulk_import.write_chunk, *chunk))
+        logger.info(f"User {user_id} imported {report['imported']} {kind} "
+                    f"({report['rows_per_second']} rows/s, {report['rejected_count']} rejected)")
+        return jsonify({'success': True, **report})
+
+    except Exception as e:
+        logger.error(f"Import error for user {user_id}: {str(e)}")
+        return jsonify({'success': False, 'message': 'Import failed'})
+
+@app.route('/api/predict_savings', methods=['POST'])
+@login_required
+def predict_savings_api():
+    data = request.get_json(silent=True) or {}
+
+    try:
+        theta, expense_cols = model_store.get()
+
+        if 'vectors' in data or 'expenses' in data:
+            # Caller-supplied matrix, either as rows of numbers in column order or as dicts
+            if 'vectors' in data:
+                X = np.asarray(data['vectors'], dtype=float)
+            else:
+                X = np.array([[float(row.get(col, 0.0)) for col in expense_cols]
+                              for row in data['expenses']])
+            if X.ndim != 2 or X.shape[1] != len(expense_cols):
+                return jsonify({'success': False,
+                                'message': f'Each vector needs {len(expense_cols)} values: {expense_cols}'})
+            predictions = predict_savings_batch(X, theta)
+        else:
+            # Score the user's own month from the monthly expense aggregates
+            month = data.get('month') or datetime.today().strftime('%Y-%m')
+            _, X = scoring.category_matrix(get_db(), month, expense_cols, session['user_id'])
+            predictions = predict_savings_batch(X, theta)
+
+        return jsonify({
+            'success': True,
+            'columns': expense_cols,
+            'model_version': model_store.info()['version'],
+            'predictions': [round(float(p), 2) for p in predictions]
+        })
+
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid expense vectors'})
+    except Exception as e:
+        logger.error(f"Savings prediction error: {str(e)}")
+        return jsonify({'success': False, 'message': 'Prediction failed'})
+
+@app.route('/api/charts/<kind>')
+@login_required
+def chart(kind):
+    if kind not in charts.CHART_KINDS:
+        return jsonify({'success': False, 'message': 'Unknown chart kind'}), 404
+
+    fmt = request.args.get('format', 'png')
+    if fmt not in charts.MIME_TYPES:
+        return jsonify({'success': False, 'message': 'Format must be png or svg'}), 400
+
+    month = request.args.get('month') or datetime.today().strftime('%Y-%m')
+    user_id = session['user_id']
+    try:
+        image, version = charts.get_chart(get_db(), chart_cache, user_id, month, kind, fmt)
+        response = Response(image, mimetype=charts.MIME_TYPES[fmt])
+        response.set_etag(f"{user_id}:{month}:{kind}:{fmt}:{version}")
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+
+    except Exception as e:
+        logger.error(f"Chart error for user {user_id}: {str(e)}")
+        return jsonify({'success': False, 'message': 'Could not render chart'}), 500
+
+@app.route('/api/metrics/charts')
+@login_required
+def chart_cache_metrics():
+    return jsonify(chart_cache.stats())
+
+@app.route('/api/analytics')
+@login_required
+def spending_analytics():
+    """Month-over-month, rolling averages, category percentiles and savings rate for the user"""
+    user_id = session['user_id']
+    try:
+        months = int(request.args.get('months', 12))
+        if months < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'success': False, 'message': 'months must be a positive integer'})
+
+    try:
+        spending = spending_histories.get(_path_for(user_id), user_id).refresh(get_db())
+        report = analytics.user_report(spending, user_id, months)
+        if report is None:
+            return jsonify({'success': False, 'message': 'User not found'})
+        return jsonify({'success': True, **report})
+
+    except Exception as e:
+        logger.error(f"Analytics error for user {user_id}: {str(e)}")
+        return jsonify({'success': False, 'message': 'Could not compute analytics'})
+
+@app.route('/api/metrics/analytics')
+@login_required
+def analytics_metrics():
+    return jsonify(spending_histories.stats())
+
+@app.route('/api/forecast')
+@login_required
+def spending_forecast():
+    """The user's per-category forecast for a month (default: this month), from the nightly refresh"""
+    user_id = session['user_id']
+    month = request.args.get('month') or datetime.now().strftime('%Y-%m')
+    try:
+        datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        return jsonify({'success': False, 'message': 'month must be YYYY-MM'})
+
+    try:
+        rows = forecast.user_forecast(get_db(), user_id, month)
+        return jsonify({
+            'success': True,
+            'month': month,
+            'forecast': [{'category': category, 'amount': amount, 'baseline': baseline}
+                         for category, amount, baseline in rows],
+            'total': round(sum(row[1] for row in rows), 2),
+        })
+
+    except Exception as e:
+        logger.error(f"Forecast error for user {user_id}: {str(e)}")
+        return jsonify({'success': False, 'message': 'Could not load forecast'})
+
+@app.route('/api/budgets', methods=['GET', 'POST'])
+@login_required
+def budget_limits():
+    """List the user's limits with this month's spend, or create / change one"""
+    user_id = session['user_id']
+    if request.method == 'GET':
+        try:
+            month = budgets.current_month()
+            return jsonify({'success': True, 'month': month, 'budgets': budgets.status(get_db(), user_id, month)})
+        except Exception as e:
+            logger.error(f"Budget list error for user {user_id}: {str(e)}")
+            return jsonify({'success': False, 'message': 'Could not load budgets'})
+
+    data = request.json or {}
+    category = str(data.get('category') or '').strip()
+    try:
+        limit = float(data.get('limit'))
+        if not category or not limit > 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'A category and a positive limit are required'})
+
+    try:
+        db_writer.execute(repository.Repository.set_budget, user_id, category, limit, budgets.current_month())
+        return jsonify({'success': True})
+    except Exception as e:
+        logger.error(f"Budget update error for user {user_id}: {str(e)}")
+        return jsonify({'success': False, 'message': 'Could not save budget'})
+
+@app.route('/api/budgets/<category>', methods=['DELETE'])
+@login_required
+def delete_budget_limit(category):
+    user_id = session['user_id']
+    try:
+        if not db_writer.execute(repository.Repository.delete_budget, user_id, category):
+            return jsonify({'success': False, 'message': 'No such budget'})
+        return jsonify({'success': True})
+    except Exception as e:
+        logger.error(f"Budget delete error for user {user_id}: {str(e)}")
+        return jsonify({'success': False, 'message': 'Could not delete budget'})
+
+@app.route('/api/budgets/alerts')
+@login_required
+def budget_alerts():
+    """Alerts raised after the `after` cursor; poll again with the returned cursor"""
+    user_id = session['user_id']
+    try:
+        after = int(request.args.get('after', 0))
+        limit = min(int(request.args.get('limit', budgets.DEFAULT_POLL_LIMIT)), budgets.DEFAULT_POLL_LIMIT)
+        if after < 0 or limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'success': False, 'message': 'after and limit must be non-negative integers'})
+
+    try:
+        alerts = budgets.alerts(get_db(), user_id, after, limit)
+        return jsonify({'success': True, 'alerts': alerts, 'cursor': alerts[-1]['id'] if alerts else after})
+    except Exception as e:
+        logger.error(f"Budget alerts error for user {user_id}: {str(e)}")
+        return jsonify({'success': False, 'message': 'Could not load alerts'})
+
+@app.route('/api/metrics/dashboard_cache')
+@login_required
+def dashboard_cache_metrics():
+    return jsonify(dashboard_cache.stats())
+
+def _history_filters(kind, args):
+    return {
+        'start': args.get('start'),
+        'end': args.get('end'),
+        'bucket': args.get('category') if kind == 'expenses' else args.get('type'),
+        'min_amount': float(args['min_amount']) if args.get('min_amount') else None,
+        'max_amount': float(args['max_amount']) if args.get('max_amount') else None,
+    }
+
+def _list_history(kind):
+    args = request.args
+    try:
+        filters = _history_filters(kind, args)
+        limit = int(args.get('limit', history.DEFAULT_PAGE_SIZE))
+        items, next_cursor = history.page(
+            get_db(), kind, session['user_id'], limit, args.get('cursor'), **filters
+        )
+        return jsonify({'success': True, 'items': items, 'next_cursor': next_cursor})
+
+    except (ValueError, history.InvalidCursor):
+        return jsonify({'success': False, 'message': 'Invalid filter or cursor'})
+    except Exception as e:
+        logger.error(f"List {kind} error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Could not load {kind}'})
+
+@app.route('/api/expenses')
+@login_required
+def list_expenses():
+    return _list_history('expenses')
+
+@app.route('/api/transactions')
+@login_required
+def list_transactions():
+    return _list_history('transactions')
+
+@app.route('/api/export/<kind>')
+@login_required
+def export_history(kind):
+    """Stream the user's full history as CSV or JSON lines, optionally gzipped"""
+    if kind not in history.KINDS:
+        return jsonify({'success': False, 'message': 'Unknown export kind'})
+    fmt = request.args.get('format', 'csv')
+    if fmt not in history.EXPORT_FORMATS:
+        return jsonify({'success': False, 'message': 'Format must be csv or jsonl'})
+    try:
+        filters = _history_filters(kind, request.args)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid filter'})
+
+    compress = request.args.get('gzip') in ('1', 'true')
+    user_id = session['user_id']
+    chunks = history.export(get_db(), kind, user_id, fmt, compress, **filters)
+
+    # A .gz file, not a compressed transfer: with Content-Encoding clients would
+    # decompress it on the fly and save plain text under the .gz name
+    mimetype = 'application/gzip' if compress else history.MIME_TYPES[fmt]
+    # stream_with_context keeps the pooled connection checked out until the last chunk
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    filename = f"{kind}.{fmt}" + (".gz" if compress else "")
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    logger.info(f"User {user_id} exporting {kind} as {fmt}")
+    return response
+
+@app.route('/api/metrics/login')
+@login_required
+def login_metrics():
+    return jsonify({
+        'ip_limiter': ip_limiter.stats(),
+        'user_limiter': user_limiter.stats(),
+        'audit_log': _shard_stats(audit_logs),
+    })
+
+@app.route('/api/metrics/hashing')
+@login_required
+def hashing_metrics():
+    return jsonify(hasher.stats())
+
+@app.route('/api/metrics/writer')
+@login_required
+def writer_metrics():
+    return jsonify(db_writer.stats())
+
+@app.route('/api/metrics/db_pool')
+@login_required
+def db_pool_metrics():
+    return jsonify(_shard_stats(pools))
+
+@app.route('/api/metrics/storage')
+@login_required
+def storage_metrics():
+    return jsonify({**backend.describe(), 'shard': _path_for()})
+
 # Initialize database tables
 init_db()
 
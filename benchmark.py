@@ -0,0 +1,477 @@
+# Benchmark harness: database.py CRUD, Flask routes, analysis and training at several data scales
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import matplotlib
+matplotlib.use('Agg')  # Headless: plt.show() becomes a no-op
+import matplotlib.pyplot as plt
+
+from dataset import SyntheticGenerator, DEFAULT_PASSWORD
+
+# Expense rows per scale
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# History length used for every generated database (5 expenses per user-month)
+MONTHS = 24
+
+# Where generated databases are cached between runs
+WORKDIR = 'bench_data'
+
+# A median slower than baseline by more than this fraction is reported as a regression
+DEFAULT_THRESHOLD = 0.20
+
+
+def timed(fn, runs):
+    """Call fn() runs times and return latency statistics in milliseconds"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+
+def summarize(samples):
+    """Latency statistics in milliseconds for a list of samples"""
+    samples = sorted(samples)
+    runs = len(samples)
+    return {
+        "runs": runs,
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def prepare_scale(name, rows, workdir, seed):
+    """Generate (or reuse) the database and training CSV for one scale; returns its directory"""
+    num_users = max(1, rows // (MONTHS * 5))
+    directory = os.path.abspath(os.path.join(workdir, name))
+    marker = os.path.join(directory, 'params.json')
+    params = {"users": num_users, "months": MONTHS, "seed": seed}
+
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == params:
+                return directory, num_users
+
+    os.makedirs(directory, exist_ok=True)
+    for filename in ('budget_management.db', 'budget_management.db-wal', 'budget_management.db-shm'):
+        if os.path.exists(os.path.join(directory, filename)):
+            os.remove(os.path.join(directory, filename))
+
+    print(f"[INFO] Generating {name}: {num_users} users x {MONTHS} months ...")
+    # End the history at the current month so month-to-date views have data
+    today = date.today()
+    first = today.year * 12 + today.month - 1 - (MONTHS - 1)
+    first_month = f"{first // 12:04d}-{first % 12 + 1:02d}"
+    SyntheticGenerator(num_users, MONTHS, first_month, seed, transactions_per_month=1) \
+        .write_sqlite(os.path.join(directory, 'budget_management.db'))
+    SyntheticGenerator(num_users, MONTHS, first_month, seed) \
+        .write_csv(os.path.join(directory, 'synthetic_expense_data.csv'))
+
+    with open(marker, 'w') as f:
+        json.dump(params, f)
+    return directory, num_users
+
+
+@contextmanager
+def scratch_copy(directory):
+    """Throwaway copy of a cached scale's database, removed afterwards.
+
+    The benchmarks insert expenses, transactions and login attempts; run on
+    the cached file they would grow it (and skew the next run's timings).
+    The training CSV is only read, so it is linked rather than copied.
+    """
+    scratch = tempfile.mkdtemp(prefix=os.path.basename(directory) + '-run-', dir=os.path.dirname(directory))
+    src = sqlite3.connect(os.path.join(directory, 'budget_management.db'))
+    dst = sqlite3.connect(os.path.join(scratch, 'budget_management.db'))
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+    for filename in os.listdir(directory):
+        if filename.endswith('.csv'):
+            os.symlink(os.path.join(directory, filename), os.path.join(scratch, filename))
+    try:
+        yield scratch
+    finally:
+        if os.getcwd() == scratch:
+            os.chdir(directory)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def bench_scale(directory, num_users, runs, seed):
+    """Run every benchmark against the database in directory"""
+    # Every module resolves 'budget_management.db' relative to the working directory
+    os.chdir(directory)
+
+    import app as web
+    import analysis
+    import database as db
+    import training
+
+    web.pools.call('close_all')  # Drop connections opened against a previous scale
+    web.audit_logs.call('close')
+    web.db_writer.close()
+    rng = random.Random(seed)
+    user_ids = [f"user_{rng.randint(1, num_users)}" for _ in range(runs)]
+    expense_ids = [rng.randint(1, num_users * MONTHS * 5) for _ in range(runs)]
+    results = {}
+
+    # === database.py CRUD ===
+    with web.app.app_context():
+        users = iter(user_ids)
+        results["database.insert_record"] = timed(lambda: db.insert_record("Expenses", {
+            "UserID": next(users), "Amount": 12.5, "Category": "Food",
+            "Date": date.today().isoformat(), "Income": 0.0,
+        }), runs)
+        users = iter(user_ids)
+        results["database.get_records"] = timed(
+            lambda: db.get_records("Expenses", "UserID = ?", (next(users),)), runs)
+        ids = iter(expense_ids)
+        results["database.update_record"] = timed(
+            lambda: db.update_record("Expenses", {"Amount": 20.0}, "ExpenseID = ?", (next(ids),)), runs)
+        db.close_connection(None)
+
+    # === Flask routes via the test client ===
+    client = web.app.test_client()
+    login_runs = max(1, runs // 10)  # Password hashing dominates; fewer samples suffice
+    users = iter(user_ids)
+    addresses = (f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(login_runs))
+    # One client address per attempt so the per-IP limiter measures the real login path
+    results["route./login"] = timed(lambda: client.post(
+        '/login', data={"userid": next(users), "password": DEFAULT_PASSWORD},
+        base_url='https://localhost', environ_overrides={'REMOTE_ADDR': next(addresses)}), login_runs)
+
+    with client.session_transaction() as session:
+        session['user_id'] = user_ids[0]
+    results["route./dashboard"] = timed(
+        lambda: client.get('/dashboard', base_url='https://localhost'), runs)
+
+    # === Non-auth route latency during a login flood ===
+    results.update(bench_login_flood(web, client, user_ids, runs))
+
+    # === Concurrent balance-changing writes ===
+    results.update(bench_writes(web.db_writer, user_ids, runs))
+
+    # === Analysis (headless) ===
+    users = iter(user_ids)
+
+    def render():
+        analysis.generate_graphs(next(users))
+        plt.close('all')
+    results["analysis.generate_graphs"] = timed(render, max(1, runs // 10))
+
+    # === Training and prediction ===
+    results["training.train_and_return_theta"] = timed(training.train_and_return_theta, 3)
+    theta, cols = training.train_and_return_theta()
+    sample = {col: 250.0 for col in cols}
+    results["training.predict_savings"] = timed(
+        lambda: training.predict_savings(sample, theta, cols), runs * 10)
+
+    return results
+
+
+def bench_login_flood(web, client, user_ids, runs, flood_threads=8):
+    """Time GET /api/expenses idle, during a login flood on the hashing pool, and with inline hashing"""
+    import hashing
+
+    def page():
+        client.get('/api/expenses', base_url='https://localhost')
+
+    def flood(stop, counts):
+        flooder = web.app.test_client()
+        i = 0
+        while not stop.is_set():
+            i += 1
+            response = flooder.post(
+                '/login', data={"userid": user_ids[i % len(user_ids)], "password": DEFAULT_PASSWORD},
+                base_url='https://localhost',
+                environ_overrides={'REMOTE_ADDR': f"172.16.{threading.get_ident() % 256}.{i % 256}"})
+            counts[response.status_code] = counts.get(response.status_code, 0) + 1
+
+    def during_flood(label):
+        stop, counts = threading.Event(), {}
+        threads = [threading.Thread(target=flood, args=(stop, counts)) for _ in range(flood_threads)]
+        for t in threads:
+            t.start()
+        time.sleep(0.5)  # Let the flood saturate the hashing path first
+        started = time.perf_counter()
+        stats = timed(page, runs)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for t in threads:
+            t.join()
+        stats["login_statuses"] = counts
+        stats["logins_per_s"] = round(sum(counts.values()) / elapsed, 1)
+        return {f"flood.{label}./api/expenses": stats}
+
+    # Throttling would turn the flood into cheap 429s; lift it for this scenario
+    limits = (web.ip_limiter.limit, web.user_limiter.limit)
+    web.ip_limiter.limit = web.user_limiter.limit = float('inf')
+    results = {"flood.idle./api/expenses": timed(page, runs)}
+    try:
+        results.update(during_flood("pool"))
+        pooled, web.hasher = web.hasher, hashing.HashingService(workers=0, max_pending=flood_threads)
+        try:
+            results.update(during_flood("inline"))
+        finally:
+            web.hasher = pooled
+    finally:
+        web.ip_limiter.limit, web.user_limiter.limit = limits
+    return results
+
+
+def bench_writes(db_writer, user_ids, runs, threads=8):
+    """Writes/s and latency for transaction+balance units: one commit each vs group commit"""
+    import repository
+
+    def record_transaction(repo, user_id):
+        repo.adjust_income(user_id, -1.0)
+        return repo.add_transaction(user_id, "sent", 1.0, date.today().isoformat())
+
+    def hammer(write):
+        samples, errors = [], []
+
+        def worker(offset):
+            try:
+                for i in range(runs):
+                    started = time.perf_counter()
+                    write(user_ids[(offset + i) % len(user_ids)])
+                    samples.append((time.perf_counter() - started) * 1000)
+            except Exception as e:
+                errors.append(e)
+
+        started = time.perf_counter()
+        pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - started
+        stats = summarize(samples)
+        stats["writes_per_s"] = round(len(samples) / elapsed, 1)
+        stats["errors"] = len(errors)
+        return stats
+
+    local, opened = threading.local(), []
+
+    def commit_each(user_id):
+        if not hasattr(local, "repo"):
+            conn = repository.connect(check_same_thread=False, timeout=30)
+            opened.append(conn)
+            local.repo = repository.Repository(conn)
+        with local.repo.unit_of_work():
+            record_transaction(local.repo, user_id)
+
+    try:
+        results = {"writes.commit_per_unit": hammer(commit_each)}
+    finally:
+        for conn in opened:
+            conn.close()
+    results["writes.group_commit"] = hammer(lambda user_id: db_writer.execute(record_transaction, user_id))
+    return results
+
+
+# === Multi-process write load test (direct writers vs the write broker) ===
+def _serve_broker(directory, address):
+    os.chdir(directory)
+    import broker
+    broker.WriteBroker(address).serve_forever()
+
+
+def _write_worker(directory, address, threads, writes, num_users, seed, out):
+    """One simulated web worker: `threads` request threads each adding `writes` transactions"""
+    os.chdir(directory)
+    import broker
+    import repository
+    import writer
+
+    db_writer = broker.BrokerClient(address) if address else writer.GroupCommitWriter()
+    samples, errors = [], []
+
+    def request_thread(n):
+        rng = random.Random(seed * 1000 + n)
+        for _ in range(writes):
+            user_id = f"user_{rng.randint(1, num_users)}"
+            started = time.perf_counter()
+            try:
+                db_writer.execute(repository.Repository.add_transaction, user_id, "sent", 1.0,
+                                  date.today().isoformat())
+            except Exception as e:
+                errors.append(str(e))
+            samples.append((time.perf_counter() - started) * 1000)
+
+    pool = [threading.Thread(target=request_thread, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    db_writer.close()
+    out.put((samples, errors))
+
+
+def write_load_test(scale, workers, threads, writes, workdir, seed):
+    """p50/p99 write latency with every worker committing directly, then through one broker"""
+    cached, num_users = prepare_scale(scale, SCALES[scale], workdir, seed)
+    ctx = multiprocessing.get_context('spawn')
+    results = {}
+
+    for mode in ("direct", "broker"):
+        # Each mode starts from the same cached data and adds nothing to it
+        with scratch_copy(cached) as directory:
+            address = os.path.join(directory, 'bench-writer.sock')
+            server = None
+            if mode == "broker":
+                server = ctx.Process(target=_serve_broker, args=(directory, address), daemon=True)
+                server.start()
+                deadline = time.monotonic() + 10
+                while not os.path.exists(address) and time.monotonic() < deadline:
+                    time.sleep(0.05)
+
+            out = ctx.Queue()
+            started = time.perf_counter()
+            procs = [ctx.Process(target=_write_worker,
+                                 args=(directory, address if mode == "broker" else None,
+                                       threads, writes, num_users, seed + w, out))
+                     for w in range(workers)]
+            for p in procs:
+                p.start()
+            samples, errors = [], []
+            for _ in procs:
+                s, e = out.get()
+                samples.extend(s)
+                errors.extend(e)
+            for p in procs:
+                p.join()
+            elapsed = time.perf_counter() - started
+            if server is not None:
+                server.terminate()
+                server.join()
+
+            stats = summarize(samples)
+            stats["p99_ms"] = round(sorted(samples)[min(len(samples) - 1, int(len(samples) * 0.99))], 3)
+            stats["writes_per_s"] = round(len(samples) / elapsed, 1)
+            stats["errors"] = len(errors)
+            stats["locked_errors"] = sum(1 for e in errors if "locked" in e)
+            results[f"writers.{mode}"] = stats
+            print(f"[INFO] {mode:>6}: p50 {stats['median_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms, "
+                  f"{stats['writes_per_s']} writes/s, {stats['errors']} errors")
+    return results
+
+
+def run(scales, runs, workdir, seed, out):
+    workdir = os.path.abspath(workdir)
+    out = os.path.abspath(out)
+    cwd = os.getcwd()
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "runs": runs,
+            "seed": seed,
+        },
+        "results": {},
+    }
+    try:
+        for name in scales:
+            directory, num_users = prepare_scale(name, SCALES[name], workdir, seed)
+            print(f"[INFO] Benchmarking {name} ...")
+            with scratch_copy(directory) as scratch:
+                report["results"][name] = bench_scale(scratch, num_users, runs, seed)
+    finally:
+        os.chdir(cwd)
+
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"[SUCCESS] Results written to {out}")
+    return report
+
+
+def compare(baseline_path, current_path, threshold=DEFAULT_THRESHOLD):
+    """Return a list of (scale, benchmark, baseline_ms, current_ms, change) regressions"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    with open(current_path) as f:
+        current = json.load(f)["results"]
+
+    regressions = []
+    for scale, benches in current.items():
+        for name, stats in benches.items():
+            before = baseline.get(scale, {}).get(name)
+            if not before or before["median_ms"] <= 0:
+                continue
+            change = stats["median_ms"] / before["median_ms"] - 1
+            marker = "REGRESSION" if change > threshold else "ok"
+            print(f"{scale:>4} {name:<36} {before['median_ms']:>10.3f} -> "
+                  f"{stats['median_ms']:>10.3f} ms ({change:+.1%}) {marker}")
+            if change > threshold:
+                regressions.append((scale, name, before["median_ms"], stats["median_ms"], change))
+    return regressions
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the expense tracker at several data scales.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Generate databases and record timings")
+    run_parser.add_argument("--scales", default=",".join(SCALES), help="Comma-separated: " + ", ".join(SCALES))
+    run_parser.add_argument("--runs", type=int, default=200, help="Samples per benchmark")
+    run_parser.add_argument("--workdir", default=WORKDIR)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--out", default="benchmark_results.json")
+
+    writers_parser = sub.add_parser("writers", help="Multi-process write latency with and without the broker")
+    writers_parser.add_argument("--scale", default="10k", choices=tuple(SCALES))
+    writers_parser.add_argument("--workers", type=int, default=4, help="Simulated web worker processes")
+    writers_parser.add_argument("--threads", type=int, default=4, help="Request threads per worker")
+    writers_parser.add_argument("--writes", type=int, default=200, help="Writes per thread")
+    writers_parser.add_argument("--workdir", default=WORKDIR)
+    writers_parser.add_argument("--seed", type=int, default=42)
+    writers_parser.add_argument("--out", default="writers_results.json")
+
+    compare_parser = sub.add_parser("compare", help="Flag regressions between two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="Allowed median slowdown as a fraction (default 0.20)")
+    args = parser.parse_args()
+
+    if args.command == "writers":
+        results = write_load_test(args.scale, args.workers, args.threads, args.writes,
+                                  os.path.abspath(args.workdir), args.seed)
+        with open(args.out, 'w') as f:
+            json.dump({"results": {args.scale: results}}, f, indent=2)
+        print(f"[SUCCESS] Results written to {args.out}")
+    elif args.command == "run":
+        scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+        unknown = [s for s in scales if s not in SCALES]
+        if unknown:
+            print(f"[ERROR] Unknown scale(s): {', '.join(unknown)}")
+            sys.exit(2)
+        run(scales, args.runs, args.workdir, args.seed, args.out)
+    else:
+        regressions = compare(args.baseline, args.current, args.threshold)
+        if regressions:
+            print(f"[ERROR] {len(regressions)} regression(s) above {args.threshold:.0%}.")
+            sys.exit(1)
+        print("[SUCCESS] No regressions.")
@@ -0,0 +1,203 @@
+# Single-writer broker: web workers send mutations to one process that owns all writes
+import argparse
+import logging
+import os
+import threading
+
+import bulk_import
+import ipc
+from repository import Repository
+from writer import GroupCommitWriter, DEFAULT_WINDOW
+
+logger = logging.getLogger(__name__)
+
+# Database configuration
+DATABASE = 'budget_management.db'
+
+DEFAULT_ADDRESS = 'expense-writer.sock'
+
+# Shared secret of broker and workers. Without it the broker generates one and
+# saves it next to the socket (ipc.key_path), where workers of the same user read it.
+AUTHKEY_ENV = 'WRITE_BROKER_AUTHKEY'
+
+# Write operations the broker will run, by name. Workers send only the name
+# and arguments; the functions themselves never cross the socket.
+OPS = {}
+
+
+def register_op(name, fn):
+    """Allow fn(repo, *args, **kwargs) to be executed by the broker as `name`"""
+    OPS[name] = fn
+    return fn
+
+
+for _name in ("create_user", "update_user", "set_income", "adjust_income",
+              "add_expense", "update_expense", "delete_expense", "add_transaction",
+              "set_budget", "delete_budget"):
+    register_op(_name, getattr(Repository, _name))
+register_op("import_chunk", bulk_import.write_chunk)
+
+# Reverse lookup so BrokerClient.execute() accepts the same callables as GroupCommitWriter
+_OP_NAMES = {fn: name for name, fn in OPS.items()}
+
+
+class BrokerError(Exception):
+    """Raised for broker failures that are not the operation's own exception"""
+
+
+# === Server ===
+class WriteBroker:
+    """Accept worker connections and funnel their operations into one GroupCommitWriter"""
+
+    def __init__(self, address=DEFAULT_ADDRESS, db_path=DATABASE, authkey=None, window=DEFAULT_WINDOW):
+        self.address = address
+        self.authkey = authkey or ipc.server_authkey(address, AUTHKEY_ENV)
+        self.writer = GroupCommitWriter(db_path, window=window)
+        self.clients = 0
+
+    def serve_forever(self):
+        # Requests are unpickled, so only authenticated processes of this user may connect
+        with ipc.listen(self.address, self.authkey) as listener:
+            logger.info(f"Write broker listening on {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except ipc.ACCEPT_ERRORS as e:
+                    logger.warning(f"Rejected broker connection: {e}")
+                    continue
+                self.clients += 1
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        """Serve one worker connection: one request, one reply, in order"""
+        with conn:
+            while True:
+                try:
+                    name, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if name == "__stats__":
+                        reply = ("ok", {**self.writer.stats(), "clients": self.clients})
+                    elif name not in OPS:
+                        reply = ("error", BrokerError(f"Unknown write operation: {name}"))
+                    else:
+                        reply = ("ok", self.writer.execute(OPS[name], *args, **kwargs))
+                except Exception as e:
+                    reply = ("error", e)
+                try:
+                    conn.send(reply)
+                except (TypeError, AttributeError):
+                    conn.send(("error", BrokerError(repr(reply[1]))))  # Unpicklable exception or result
+                except (EOFError, OSError):
+                    return
+
+
+# === Client ===
+class BrokerClient:
+    """Drop-in for GroupCommitWriter.execute() that forwards writes to the broker.
+
+    Each thread keeps its own socket, so requests from concurrent threads in a
+    worker are in flight at the same time and can share one broker commit.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._metrics = {"calls": 0, "errors": 0, "reconnects": 0}
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Without a configured authkey, read the one the running broker generated
+            authkey = self.authkey or ipc.client_authkey(self.address, AUTHKEY_ENV)
+            conn = self._local.conn = ipc.connect(self.address, authkey)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def call(self, name, *args, **kwargs):
+        """Run a registered operation in the broker and return its committed result"""
+        for attempt in range(2):
+            try:
+                conn = self._conn()
+                conn.send((name, args, kwargs))
+            except OSError as e:
+                # Nothing was delivered, so reconnecting and resending once is safe
+                self._drop()
+                if attempt:
+                    self._count("errors")
+                    raise BrokerError(f"Write broker unavailable: {e}") from e
+                self._count("reconnects")
+                continue
+            try:
+                status, value = conn.recv()
+            except (EOFError, OSError) as e:
+                # The write may have been applied; never resend it
+                self._drop()
+                self._count("errors")
+                raise BrokerError(f"Write broker connection lost: {e}") from e
+            break
+
+        self._count("calls")
+        if status != "ok":
+            self._count("errors")
+            raise value
+        return value
+
+    def _count(self, metric):
+        with self._lock:
+            self._metrics[metric] += 1
+
+    def execute(self, fn, *args, **kwargs):
+        name = _OP_NAMES.get(fn)
+        if name is None:
+            raise BrokerError(f"{getattr(fn, '__qualname__', fn)} is not a registered broker operation")
+        return self.call(name, *args, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            local = dict(self._metrics)
+        try:
+            return {**local, "broker": self.call("__stats__")}
+        except BrokerError:
+            return {**local, "broker": None}
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Run the single-writer broker for multi-worker deployments.")
+    parser.add_argument("--address", default=os.environ.get("WRITE_BROKER_ADDRESS", DEFAULT_ADDRESS),
+                        help="Unix socket path")
+    parser.add_argument("--db", default=DATABASE)
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW,
+                        help="Extra seconds to wait to coalesce commits")
+    args = parser.parse_args()
+
+    broker = WriteBroker(args.address, args.db, window=args.window)
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[INFO] Write broker stopped.")
+    finally:
+        broker.writer.close()
+        ipc.cleanup(args.address)
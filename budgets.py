@@ -0,0 +1,220 @@
+# Per-user, per-category monthly budget limits with alerts raised by triggers on write
+import sqlite3
+import argparse
+from datetime import date
+
+import repository
+import rollup
+import storage
+
+# Database configuration
+DATABASE = 'budget_management.db'
+
+# Percent of a limit at which an alert is raised, once per month and limit value
+ALERT_THRESHOLDS = (80, 100)
+
+# A limit applies to every month from StartMonth on (the month it was created)
+BUDGET_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS BudgetLimits (
+        UserID TEXT NOT NULL,
+        Category TEXT NOT NULL,
+        MonthlyLimit REAL NOT NULL CHECK (MonthlyLimit > 0),
+        StartMonth TEXT NOT NULL,
+        UpdatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (UserID, Category),
+        FOREIGN KEY (UserID) REFERENCES User(UserID) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+'''
+
+# Outbox of crossed thresholds. Each crossing is recorded once per month; the
+# key includes the limit so raising a limit re-arms its alerts.
+ALERT_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS BudgetAlerts (
+        AlertID INTEGER PRIMARY KEY AUTOINCREMENT,
+        UserID TEXT NOT NULL,
+        Month TEXT NOT NULL,
+        Category TEXT NOT NULL,
+        Threshold INTEGER NOT NULL,
+        Spent REAL NOT NULL,
+        MonthlyLimit REAL NOT NULL,
+        CreatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (UserID, Month, Category, Threshold, MonthlyLimit),
+        FOREIGN KEY (UserID) REFERENCES User(UserID) ON DELETE CASCADE
+    );
+'''
+
+# Polling a user's outbox past a cursor is one index seek
+ALERT_INDEX_SQL = '''
+    CREATE INDEX IF NOT EXISTS idx_budget_alerts_user
+    ON BudgetAlerts (UserID, AlertID);
+'''
+
+_THRESHOLDS = " UNION ALL ".join(f"SELECT {t} AS Pct" for t in ALERT_THRESHOLDS)
+
+# Probe of the outbox's unique key. An explicit check rather than INSERT OR
+# IGNORE, whose conflict policy the statement firing the trigger overrides.
+_RAISED = (
+    "SELECT 1 FROM BudgetAlerts a WHERE a.UserID = NEW.UserID AND a.Month = {month} "
+    "AND a.Category = {category} AND a.Threshold = t.Pct AND a.MonthlyLimit = {limit}"
+)
+
+# Runs after the rollup triggers have updated a (user, month, category) total:
+# one primary-key read of the limit and a unique-index probe per threshold, whatever the
+# number of expenses in the month
+_CHECK_ROLLUP_SQL = f'''
+    INSERT INTO BudgetAlerts (UserID, Month, Category, Threshold, Spent, MonthlyLimit)
+    SELECT b.UserID, NEW.Month, b.Category, t.Pct, NEW.Total, b.MonthlyLimit
+    FROM BudgetLimits b, ({_THRESHOLDS}) t
+    WHERE b.UserID = NEW.UserID AND b.Category = NEW.Bucket AND NEW.Month >= b.StartMonth
+      AND NEW.Total * 100 >= b.MonthlyLimit * t.Pct
+      AND NOT EXISTS ({_RAISED.format(month="NEW.Month", category="b.Category", limit="b.MonthlyLimit")});
+'''
+
+# A new or lowered limit can already be exceeded by the months it covers
+_CHECK_LIMIT_SQL = f'''
+    INSERT INTO BudgetAlerts (UserID, Month, Category, Threshold, Spent, MonthlyLimit)
+    SELECT NEW.UserID, r.Month, NEW.Category, t.Pct, r.Total, NEW.MonthlyLimit
+    FROM MonthlyRollup r, ({_THRESHOLDS}) t
+    WHERE r.UserID = NEW.UserID AND r.Month >= NEW.StartMonth AND r.Kind = 'expense'
+      AND r.Bucket = NEW.Category AND r.Total * 100 >= NEW.MonthlyLimit * t.Pct
+      AND NOT EXISTS ({_RAISED.format(month="r.Month", category="NEW.Category", limit="NEW.MonthlyLimit")});
+'''
+
+TRIGGER_SQL = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_budget_rollup_insert
+        AFTER INSERT ON MonthlyRollup WHEN NEW.Kind = 'expense'
+        BEGIN {_CHECK_ROLLUP_SQL} END;''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_budget_rollup_update
+        AFTER UPDATE OF Total ON MonthlyRollup WHEN NEW.Kind = 'expense' AND NEW.Total > OLD.Total
+        BEGIN {_CHECK_ROLLUP_SQL} END;''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_budget_limit_insert
+        AFTER INSERT ON BudgetLimits
+        BEGIN {_CHECK_LIMIT_SQL} END;''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_budget_limit_update
+        AFTER UPDATE OF MonthlyLimit ON BudgetLimits
+        BEGIN {_CHECK_LIMIT_SQL} END;''',
+]
+
+LIMITS_SQL = '''
+    SELECT Category, MonthlyLimit, StartMonth FROM BudgetLimits
+    WHERE UserID = ? ORDER BY Category
+'''
+
+ALERTS_SQL = '''
+    SELECT AlertID, Month, Category, Threshold, Spent, MonthlyLimit, CreatedAt FROM BudgetAlerts
+    WHERE UserID = ? AND AlertID > ? ORDER BY AlertID LIMIT ?
+'''
+
+LATEST_ALERT_SQL = "SELECT MAX(AlertID) FROM BudgetAlerts WHERE UserID = ?"
+
+# Alerts returned per poll at most; the caller continues from the last AlertID
+DEFAULT_POLL_LIMIT = 100
+
+
+def init_schema(conn):
+    """Create the budget tables and alert triggers (needs MonthlyRollup to exist)"""
+    conn.execute(BUDGET_TABLE_SQL)
+    conn.execute(ALERT_TABLE_SQL)
+    conn.execute(ALERT_INDEX_SQL)
+    for sql in TRIGGER_SQL:
+        conn.execute(sql)
+    conn.commit()
+
+
+def current_month():
+    return date.today().strftime('%Y-%m')
+
+
+def status(conn, user_id, month=None):
+    """Each limit with the month's spend, read from the rollup rather than Expenses"""
+    month = month or current_month()
+    spent = dict(rollup.expense_totals(conn, user_id, month))
+    result = []
+    for category, limit, start_month in conn.execute(LIMITS_SQL, (user_id,)):
+        total = round(spent.get(category, 0.0), 2)
+        result.append({
+            "category": category,
+            "limit": limit,
+            "start_month": start_month,
+            "spent": total,
+            "percent": round(100 * total / limit, 1),
+            "remaining": round(limit - total, 2),
+        })
+    return result
+
+
+def latest_alert_id(conn, user_id):
+    """Cursor past every alert the user has so far (0 if none)"""
+    return conn.execute(LATEST_ALERT_SQL, (user_id,)).fetchone()[0] or 0
+
+
+def alerts(conn, user_id, after=0, limit=DEFAULT_POLL_LIMIT):
+    """The user's alerts with AlertID > after, oldest first"""
+    # Alerts are never deleted, so a cursor past the newest one predates a
+    # move to another shard, which gave the user's alerts new (smaller) ids
+    if after and after > latest_alert_id(conn, user_id):
+        after = 0
+    columns = ("id", "month", "category", "threshold", "spent", "limit", "created_at")
+    return [dict(zip(columns, row)) for row in conn.execute(ALERTS_SQL, (user_id, after, limit))]
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage per-category monthly budget limits.")
+    parser.add_argument("--db", default=DATABASE,
+                        help="Path to the SQLite database (ignored when EXPENSE_SHARDS is set)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    show_parser = sub.add_parser("show", help="Print a user's limits and this month's spend")
+    show_parser.add_argument("user_id")
+    show_parser.add_argument("--month", help="'YYYY-MM' (default: this month)")
+
+    set_parser = sub.add_parser("set", help="Create or change a limit")
+    set_parser.add_argument("user_id")
+    set_parser.add_argument("category")
+    set_parser.add_argument("limit", type=float)
+
+    delete_parser = sub.add_parser("delete", help="Remove a limit")
+    delete_parser.add_argument("user_id")
+    delete_parser.add_argument("category")
+
+    alerts_parser = sub.add_parser("alerts", help="Print a user's alerts")
+    alerts_parser.add_argument("user_id")
+    alerts_parser.add_argument("--after", type=int, default=0, help="Only alerts after this AlertID")
+    args = parser.parse_args()
+
+    conn = repository.connect(storage.from_env(args.db).path_for(args.user_id))
+    conn.execute("PRAGMA busy_timeout = 5000;")
+    repo = repository.Repository(conn)
+
+    try:
+        if args.command == "show":
+            rows = status(conn, args.user_id, args.month)
+            if not rows:
+                print("[INFO] No budget limits set.")
+            for row in rows:
+                print(f"  {row['category']:<16} {row['spent']:>10.2f} / {row['limit']:<10.2f} ({row['percent']}%)")
+        elif args.command == "set":
+            if args.limit <= 0:
+                print("[ERROR] The limit must be positive.")
+            elif not repo.user_exists(args.user_id):
+                print("[ERROR] User not found.")
+            else:
+                repo.set_budget(args.user_id, args.category, args.limit, current_month())
+                print(f"[SUCCESS] {args.category} limit set to {args.limit:.2f}.")
+        elif args.command == "delete":
+            if repo.delete_budget(args.user_id, args.category):
+                print(f"[SUCCESS] {args.category} limit removed.")
+            else:
+                print("[ERROR] No such limit.")
+        else:
+            rows = alerts(conn, args.user_id, args.after)
+            if not rows:
+                print("[INFO] No alerts.")
+            for row in rows:
+                print(f"  #{row['id']} {row['month']} {row['category']}: {row['threshold']}% of "
+                      f"{row['limit']:.2f} reached ({row['spent']:.2f} spent)")
+    except sqlite3.Error as e:
+        print(f"[ERROR] {e}")
+    finally:
+        conn.close()
@@ -0,0 +1,224 @@
+# Bulk import of expenses and transactions from CSV or JSON-lines files
+import sqlite3
+import csv
+import json
+import math
+import sys
+import time
+import argparse
+from datetime import date
+
+import cache
+import repository
+import storage
+
+# Database configuration
+DATABASE = 'budget_management.db'
+
+# Rows inserted per executemany / commit
+DEFAULT_CHUNK_SIZE = 5000
+
+# Cap on rejected rows echoed back in a report (the count is always exact)
+MAX_REPORTED_REJECTS = 1000
+
+KINDS = ("expenses", "transactions")
+FORMATS = ("csv", "jsonl")
+
+
+class RowError(ValueError):
+    """Raised when an input row fails validation"""
+
+
+# === Reading ===
+def read_rows(stream, fmt):
+    """Yield (line_number, row_dict) pairs from a text stream without loading it whole"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, {(k or "").strip().lower(): v for k, v in row.items()}
+    elif fmt == "jsonl":
+        for line_no, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, RowError(f"invalid JSON: {e}")
+                continue
+            if not isinstance(row, dict):
+                yield line_no, RowError("expected a JSON object")
+                continue
+            yield line_no, {str(k).strip().lower(): v for k, v in row.items()}
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+# === Validation ===
+def _amount(row):
+    try:
+        amount = float(row.get("amount"))
+    except (TypeError, ValueError):
+        raise RowError("invalid amount")
+    if not math.isfinite(amount) or amount <= 0:
+        raise RowError("amount must be a positive number")
+    return amount
+
+
+def _date(row):
+    value = str(row.get("date") or "").strip()
+    if not value:
+        return date.today().isoformat()
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise RowError("invalid date, expected YYYY-MM-DD")
+
+
+def validate_expense(row):
+    """Return (Amount, Category, Date) for a valid expense row"""
+    category = str(row.get("category") or "").strip()
+    if not category:
+        raise RowError("missing category")
+    return _amount(row), category, _date(row)
+
+
+def validate_transaction(row):
+    """Return (TransactionType, Amount, Date) for a valid transaction row"""
+    transaction_type = str(row.get("transactiontype") or row.get("type") or "").strip().lower()
+    if transaction_type not in ("sent", "received"):
+        raise RowError("transaction type must be 'sent' or 'received'")
+    return transaction_type, _amount(row), _date(row)
+
+
+# === Writing ===
+def _insert_expenses(conn, user_id, chunk):
+    # import_rows() checked the user, but they can be deleted or moved before a later chunk
+    row = conn.execute(repository.INCOME_SQL, (user_id,)).fetchone()
+    if row is None:
+        raise ValueError(f"User not found: {user_id}")
+    income = row[0]
+    conn.executemany(
+        "INSERT INTO Expenses (UserID, Amount, Category, Date, Income) VALUES (?, ?, ?, ?, ?)",
+        [(user_id, amount, category, day, income) for amount, category, day in chunk]
+    )
+    return -sum(amount for amount, _, _ in chunk)
+
+
+def _insert_transactions(conn, user_id, chunk):
+    conn.executemany(
+        "INSERT INTO Transactions (UserID, TransactionType, Amount, Date) VALUES (?, ?, ?, ?)",
+        [(user_id, transaction_type, amount, day) for transaction_type, amount, day in chunk]
+    )
+    return sum(amount if transaction_type == "received" else -amount
+               for transaction_type, amount, _ in chunk)
+
+
+def _apply(conn, user_id, kind, chunk):
+    insert = _insert_expenses if kind == "expenses" else _insert_transactions
+    delta = insert(conn, user_id, chunk)
+    conn.execute(repository.ADJUST_INCOME_SQL, (delta, user_id))
+
+
+def write_chunk(repo, user_id, kind, chunk):
+    """Writer job for one validated chunk and its balance change; the writer
+    (GroupCommitWriter, ShardedWriter or the write broker) commits it"""
+    _apply(repo.conn, user_id, kind, chunk)
+    return len(chunk)
+
+
+def _flush(conn, user_id, kind, chunk):
+    """Insert one chunk and apply its net balance change in a single transaction"""
+    with conn:
+        _apply(conn, user_id, kind, chunk)
+
+
+def import_rows(conn, user_id, kind, rows, chunk_size=DEFAULT_CHUNK_SIZE, write=None):
+    """Validate and insert (line_number, row) pairs chunk by chunk and return a report dict.
+
+    write(user_id, kind, chunk) stores each chunk; by default it is committed on conn.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unsupported kind: {kind}")
+    if conn.execute(repository.USER_EXISTS_SQL, (user_id,)).fetchone() is None:
+        raise ValueError(f"User not found: {user_id}")
+
+    validate = validate_expense if kind == "expenses" else validate_transaction
+    write = write or (lambda *chunk_args: _flush(conn, *chunk_args))
+    started = time.perf_counter()
+    imported = 0
+    rejected_count = 0
+    rejected = []
+    chunk = []
+
+    for line_no, row in rows:
+        try:
+            if isinstance(row, RowError):
+                raise row
+            chunk.append(validate(row))
+        except RowError as e:
+            rejected_count += 1
+            if len(rejected) < MAX_REPORTED_REJECTS:
+                rejected.append({"line": line_no, "error": str(e)})
+            continue
+
+        if len(chunk) >= chunk_size:
+            write(user_id, kind, chunk)
+            cache.invalidate(user_id)
+            imported += len(chunk)
+            chunk = []
+
+    if chunk:
+        write(user_id, kind, chunk)
+        cache.invalidate(user_id)
+        imported += len(chunk)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "kind": kind,
+        "imported": imported,
+        "rejected_count": rejected_count,
+        "rejected": rejected,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(imported / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+def import_stream(conn, user_id, kind, stream, fmt, chunk_size=DEFAULT_CHUNK_SIZE, write=None):
+    """Import a CSV or JSON-lines text stream for a user"""
+    return import_rows(conn, user_id, kind, read_rows(stream, fmt), chunk_size, write)
+
+
+def guess_format(filename):
+    """Pick csv or jsonl from a file name"""
+    return "jsonl" if filename.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import expenses or transactions for a user.")
+    parser.add_argument("user_id", help="UserID that owns the imported rows")
+    parser.add_argument("kind", choices=KINDS)
+    parser.add_argument("path", help="CSV or JSON-lines file")
+    parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--db", default=DATABASE,
+                        help="Path to the SQLite database (ignored when EXPENSE_SHARDS is set)")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(storage.from_env(args.db).path_for(args.user_id))
+    conn.execute("PRAGMA foreign_keys = ON;")
+    try:
+        with open(args.path, newline="", encoding="utf-8") as f:
+            report = import_stream(conn, args.user_id, args.kind, f,
+                                   args.format or guess_format(args.path), args.chunk_size)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    for reject in report["rejected"]:
+        print(f"[ERROR] line {reject['line']}: {reject['error']}")
+    print(f"[SUCCESS] Imported {report['imported']} {args.kind} "
+          f"({report['rows_per_second']} rows/s), rejected {report['rejected_count']}.")
@@ -0,0 +1,241 @@
+# Per-user dashboard cache: in-process LRU with TTL, or one shared over a local socket
+import argparse
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import ipc
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAXSIZE = 1024
+
+# Upper bound on staleness for writes no invalidate() call sees (e.g. manual SQL)
+DEFAULT_TTL = 60.0
+
+# Unix socket of a running `python cache.py`; when set, web workers and the CLI
+# managers share that one cache, so a write anywhere invalidates it everywhere.
+# Without the authkey variable the server generates one next to the socket.
+ADDRESS_ENV = 'DASHBOARD_CACHE_ADDRESS'
+AUTHKEY_ENV = 'DASHBOARD_CACHE_AUTHKEY'
+DEFAULT_ADDRESS = 'dashboard-cache.sock'
+
+
+class DashboardCache:
+    """Thread-safe LRU of assembled dashboard payloads, one entry per user.
+
+    lookup() returns a token with every miss; store() only accepts the payload
+    if the user was not invalidated after that token was issued, so a request
+    that read the database just before a write cannot put the old data back.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()      # user_id -> (expires_at, payload)
+        self._invalidated = OrderedDict()  # user_id -> clock of the last invalidation
+        self._floor = 0                  # Newest invalidation clock forgotten from _invalidated
+        self._clock = 0
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "misses": 0, "expired": 0, "stores": 0,
+                         "stale_stores": 0, "invalidations": 0, "evictions": 0}
+
+    def lookup(self, user_id):
+        """(payload, None) on a hit, (None, token) on a miss"""
+        with self._lock:
+            entry = self._items.get(user_id)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._items.move_to_end(user_id)
+                    self._metrics["hits"] += 1
+                    return entry[1], None
+                del self._items[user_id]
+                self._metrics["expired"] += 1
+            self._metrics["misses"] += 1
+            return None, self._clock
+
+    def store(self, user_id, payload, token):
+        """Cache payload read after lookup() returned token; returns False if it is already stale"""
+        with self._lock:
+            if token < self._invalidated.get(user_id, self._floor):
+                self._metrics["stale_stores"] += 1
+                return False
+            self._items[user_id] = (time.monotonic() + self.ttl, payload)
+            self._items.move_to_end(user_id)
+            self._metrics["stores"] += 1
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self._metrics["evictions"] += 1
+            return True
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._clock += 1
+            self._items.pop(user_id, None)
+            self._invalidated[user_id] = self._clock
+            self._invalidated.move_to_end(user_id)
+            self._metrics["invalidations"] += 1
+            # Remember only recent invalidations; tokens older than a forgotten one are refused
+            while len(self._invalidated) > self.maxsize:
+                _, clock = self._invalidated.popitem(last=False)
+                self._floor = max(self._floor, clock)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._metrics["hits"] + self._metrics["misses"]
+            return {
+                **self._metrics,
+                "size": len(self._items),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hit_ratio": round(self._metrics["hits"] / lookups, 4) if lookups else 0.0,
+                "miss_ratio": round(self._metrics["misses"] / lookups, 4) if lookups else 0.0,
+            }
+
+
+# === Shared Cache over a Local Socket ===
+class CacheServer:
+    """Serve one DashboardCache to every worker process over a Unix socket"""
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        self.address = address
+        self.authkey = authkey or ipc.server_authkey(address, AUTHKEY_ENV)
+        self.cache = DashboardCache(maxsize, ttl)
+
+    def serve_forever(self):
+        # Requests are unpickled, so only authenticated processes of this user may connect
+        with ipc.listen(self.address, self.authkey) as listener:
+            logger.info(f"Dashboard cache listening on {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except ipc.ACCEPT_ERRORS as e:
+                    logger.warning(f"Rejected cache connection: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        ops = {"lookup": self.cache.lookup, "store": self.cache.store,
+               "invalidate": self.cache.invalidate, "stats": self.cache.stats}
+        with conn:
+            while True:
+                try:
+                    name, args = conn.recv()
+                    conn.send(ops[name](*args))
+                except (EOFError, OSError):
+                    return
+                except Exception as e:
+                    logger.warning(f"Bad cache request: {e}")
+                    return
+
+
+class CacheClient:
+    """DashboardCache interface backed by a CacheServer.
+
+    The cache is an optimisation, so an unreachable server behaves like an
+    empty cache: lookups miss and stores are dropped. Invalidations that
+    cannot be delivered are logged; the server's TTL bounds the staleness.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._errors = 0
+
+    def _call(self, name, *args, default=None):
+        for attempt in range(2):
+            try:
+                conn = getattr(self._local, "conn", None)
+                if conn is None:
+                    # Without a configured authkey, read the one the running server generated
+                    authkey = self.authkey or ipc.client_authkey(self.address, AUTHKEY_ENV)
+                    conn = self._local.conn = ipc.connect(self.address, authkey)
+                conn.send((name, args))
+                return conn.recv()
+            except (OSError, EOFError) as e:
+                conn, self._local.conn = getattr(self._local, "conn", None), None
+                if conn is not None:
+                    conn.close()
+                if attempt:
+                    with self._lock:
+                        self._errors += 1
+                    logger.warning(f"Dashboard cache {name} failed: {e}")
+        return default
+
+    def lookup(self, user_id):
+        # An impossible token: with the server down nothing is stored
+        return self._call("lookup", user_id, default=(None, -1))
+
+    def store(self, user_id, payload, token):
+        return self._call("store", user_id, payload, token, default=False)
+
+    def invalidate(self, user_id):
+        self._call("invalidate", user_id)
+
+    def stats(self):
+        with self._lock:
+            errors = self._errors
+        return {**(self._call("stats") or {}), "client_errors": errors}
+
+
+# === Process-Wide Invalidation ===
+# Every cache this process reads through; invalidate() reaches all of them
+_caches = []
+_caches_lock = threading.Lock()
+
+
+def register(cache):
+    with _caches_lock:
+        if cache not in _caches:
+            _caches.append(cache)
+    return cache
+
+
+def shared_client():
+    """The CacheClient for DASHBOARD_CACHE_ADDRESS (None when unset), registered once"""
+    address = os.environ.get(ADDRESS_ENV)
+    if not address:
+        return None
+    with _caches_lock:
+        for cache in _caches:
+            if isinstance(cache, CacheClient) and cache.address == address:
+                return cache
+    authkey = os.environ.get(AUTHKEY_ENV)
+    return register(CacheClient(address, authkey.encode() if authkey else None))
+
+
+def default_cache(maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+    """The shared cache when DASHBOARD_CACHE_ADDRESS is set, else a new in-process one"""
+    return shared_client() or register(DashboardCache(maxsize, ttl))
+
+
+def invalidate(user_id):
+    """Drop user_id's dashboard from every cache; call after any committed write to their data"""
+    shared_client()  # CLI processes have no cache of their own but must reach the shared one
+    with _caches_lock:
+        caches = list(_caches)
+    for cache in caches:
+        cache.invalidate(user_id)
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Run the shared dashboard cache for multi-worker deployments.")
+    parser.add_argument("--address", default=os.environ.get(ADDRESS_ENV, DEFAULT_ADDRESS),
+                        help="Unix socket path")
+    parser.add_argument("--size", type=int, default=DEFAULT_MAXSIZE, help="Users kept at most")
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL, help="Seconds an entry stays valid")
+    args = parser.parse_args()
+
+    server = CacheServer(args.address, maxsize=args.size, ttl=args.ttl)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[INFO] Dashboard cache stopped.")
+    finally:
+        ipc.cleanup(args.address)
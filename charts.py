@@ -0,0 +1,115 @@
+# Headless chart rendering with a per-user, data-versioned image cache
+import io
+import threading
+from collections import OrderedDict
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import rollup
+
+CHART_KINDS = ("pie", "bar")
+MIME_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+# === Drawing (shared with analysis.py's interactive view) ===
+def draw_expense_pie(ax, expenses):
+    """Pie chart of [(Category, Total)] for one month"""
+    if expenses:
+        ax.pie(
+            [item[1] for item in expenses],
+            labels=[item[0] for item in expenses],
+            autopct='%1.1f%%',
+            startangle=90
+        )
+        ax.set_title('Expense Distribution by Category (This Month)')
+        ax.axis('equal')  # Keep aspect ratio equal for a circular pie
+    else:
+        # Show placeholder if no expense data
+        ax.text(0.5, 0.5, 'No Expenses Found', ha='center', va='center', fontsize=12)
+        ax.set_title('Expense Distribution')
+
+
+def draw_transaction_bar(ax, transactions):
+    """Bar chart of [(TransactionType, Total)] for one month"""
+    if transactions:
+        ax.bar(
+            [item[0] for item in transactions],
+            [item[1] for item in transactions],
+            color=['orange', 'green']   # Bar colors
+        )
+        ax.set_title('Transaction Summary (This Month)')
+        ax.set_xlabel('Transaction Type')
+        ax.set_ylabel('Amount')
+    else:
+        # Show placeholder if no transaction data
+        ax.text(0.5, 0.5, 'No Transactions Found', ha='center', va='center', fontsize=12)
+        ax.set_title('Transaction Summary')
+
+
+def render(kind, rows, fmt="png"):
+    """Render one chart to PNG or SVG bytes without touching pyplot's global state"""
+    fig = Figure(figsize=(7, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    if kind == "pie":
+        draw_expense_pie(ax, rows)
+    else:
+        draw_transaction_bar(ax, rows)
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt)
+    return buf.getvalue()
+
+
+# === Cache ===
+class ChartCache:
+    """Thread-safe LRU of rendered images.
+
+    Keys include the user's DataVersion, so any expense or transaction write
+    makes older entries unreachable; they age out through LRU eviction.
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            image = self._items.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        with self._lock:
+            self._items[key] = image
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._items), "maxsize": self.maxsize,
+                    "hits": self.hits, "misses": self.misses}
+
+
+def get_chart(conn, cache, user_id, month, kind, fmt="png"):
+    """Return (image_bytes, version) for a user's month, rendering only on a cache miss"""
+    version = rollup.data_version(conn, user_id)
+    key = (user_id, month, kind, fmt, version)
+    image = cache.get(key)
+    if image is None:
+        if kind == "pie":
+            rows = rollup.expense_totals(conn, user_id, month)
+        else:
+            rows = rollup.transaction_totals(conn, user_id, month)
+        image = render(kind, rows, fmt)
+        cache.put(key, image)
+    return image, version
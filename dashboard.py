@@ -1,34 +1,48 @@
+import sqlite3
+
+import cache
 import database as db
 from records import ExpenseManager
 from transactions import TransactionManager
 import analysis
 
-# Import model training and prediction functions
-from training import train_and_return_theta, predict_savings
+# Import model loading and prediction functions
+from model_store import load_model
+from training import predict_savings
+
+
+# Update the user's own row; a taken UserID or email, or a rename the
+# foreign keys refuse, is reported instead of ending the session
+def update_user(repo, user_id, **fields):
+    try:
+        if repo.update_user(user_id, **fields):
+            return True
+        print("[ERROR] User not found.")
+    except sqlite3.IntegrityError as e:
+        print(f"[ERROR] Update rejected: {e}")
+    except sqlite3.Error as e:
+        print(f"[UPDATE ERROR] {e}")
+    return False
 
 
 # ======================= Dashboard Entry ========================
 def dashboard(user_id):
-    # Load the linear regression model (weights) and expense columns once at dashboard entry
-    theta, expense_cols = train_and_return_theta()
-
     while True:
         print("\n=== User Dashboard ===")
 
         # Fetch current user's record from the database
-        user_record = db.get_records("User", "UserID = ?", (user_id,))
-        if not user_record:
+        repo = db.get_repository(user_id)
+        user = repo.get_user(user_id)
+        if not user:
             print("[ERROR] User not found.")
             return
 
-        user = user_record[0]
-
         # Display user info and dashboard options
         print(f"\nYour current details:\n")
-        print(f"1. User ID         : {user[0]}")
-        print(f"2. Email           : {user[1]}")
-        print(f"3. Password        : {user[2]}")
-        print(f"4. Original Income : {user[4]}")
+        print(f"1. User ID         : {user.UserID}")
+        print(f"2. Email           : {user.Email}")
+        print(f"3. Password        : {user.Password}")
+        print(f"4. Original Income : {user.OriginalIncome}")
         print("5. Manage Expenses")
         print("6. Manage Transactions")
         print("7. View Graphical Analysis")
@@ -47,14 +61,26 @@ def dashboard(user_id):
             if not new_user_id.isalnum():
                 print("[ERROR] User ID must be alphanumeric.")
                 continue
-            db.update_record("User", {"UserID": new_user_id}, "UserID = ?", (user_id,))
+            if not update_user(repo, user_id, UserID=new_user_id):
+                continue
+            db.backend.follow_rename(user_id, new_user_id)
+            cache.invalidate(user_id)
             user_id = new_user_id
             print("[SUCCESS] User ID updated.")
 
         # ================= Update Email =================
         elif choice == "2":
             new_email = input("Enter new email: ")
-            db.update_record("User", {"Email": new_email}, "UserID = ?", (user_id,))
+            if not db.backend.claim_email(user_id, new_email):
+                print("[ERROR] Update rejected: email already registered.")
+                continue
+            if not update_user(repo, user_id, Email=new_email):
+                if new_email != user.Email:
+                    db.backend.release_email(user_id, new_email)
+                continue
+            if new_email != user.Email:
+                db.backend.release_email(user_id, user.Email)
+            cache.invalidate(user_id)
             print("[SUCCESS] Email updated.")
 
         # ================= Update Password =================
@@ -63,7 +89,9 @@ def dashboard(user_id):
             if len(new_password) != 8:
                 print("[ERROR] Password must be exactly 8 characters.")
                 continue
-            db.update_record("User", {"Password": new_password}, "UserID = ?", (user_id,))
+            if not update_user(repo, user_id, Password=new_password):
+                continue
+            cache.invalidate(user_id)
             print("[SUCCESS] Password updated.")
 
         # ================= Income Editing Disabled =================
@@ -86,6 +114,7 @@ def dashboard(user_id):
         elif choice == "7":
             print("\n=== Generating Graphical Analysis ===")
             analysis.generate_graphs(user_id)
+            analysis.show_trends(db.get_db(user_id), user_id)
             print("[INFO] Analysis completed.")
 
         # ================= AI-Based Savings Prediction =================
@@ -94,6 +123,9 @@ def dashboard(user_id):
             print("Enter your estimated monthly expenses:")
 
             try:
+                # Load the saved model (weights) and expense columns; trains only if the data changed
+                theta, expense_cols = load_model()
+
                 # Collect user-input expenses for each relevant category
                 user_expenses = {}
                 for col in expense_cols:
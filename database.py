@@ -1,72 +1,73 @@
 import sqlite3
+import threading
 from datetime import date
-from flask import g
+from flask import g, has_app_context
+
+import repository
+import storage
 
 # Database configuration
 DATABASE = 'budget_management.db'
 
-def get_db():
-    """Get a database connection with Row factory"""
-    db = getattr(g, '_database', None)
+# Single file, or shard files when EXPENSE_SHARDS names a shard directory.
+# Every helper takes an optional user_id that picks the user's file.
+backend = storage.from_env(DATABASE)
+
+# Connections for code running outside Flask (the CLI managers), per thread and file
+_local = threading.local()
+
+def _connections():
+    """This thread's (or app context's) {path: connection} map"""
+    if not has_app_context():
+        if not hasattr(_local, 'dbs'):
+            _local.dbs, _local.repos = {}, {}
+        return _local.dbs, _local.repos
+    # Kept apart from app.py's pooled connections so teardown never mixes the two
+    if '_records_databases' not in g:
+        g._records_databases, g._records_repositories = {}, {}
+    return g._records_databases, g._records_repositories
+
+def get_db(user_id=None):
+    """Get a database connection with Row factory to the file holding user_id"""
+    path = backend.path_for(user_id)
+    dbs, _ = _connections()
+    db = dbs.get(path)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
+        db = dbs[path] = repository.connect(path)
         db.row_factory = sqlite3.Row
-        db.execute("PRAGMA foreign_keys = ON;")
     return db
 
+def get_repository(user_id=None):
+    """Repository over this module's connection for user_id's file.
+
+    Call it per operation rather than keeping the result: a move to another
+    shard changes which file holds user_id.
+    """
+    path = backend.path_for(user_id)
+    _, repos = _connections()
+    repo = repos.get(path)
+    if repo is None:
+        repo = repos[path] = repository.Repository(get_db(user_id))
+    return repo
+
+def unit_of_work(user_id=None):
+    """Context manager: the repository writes inside it commit together or not at all"""
+    return get_repository(user_id).unit_of_work()
+
 def init_db():
     """Initialize database tables"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # User table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS User (
-                UserID TEXT PRIMARY KEY,
-                Email TEXT UNIQUE NOT NULL,
-                Password TEXT NOT NULL,
-                Income REAL NOT NULL,
-                OriginalIncome REAL NOT NULL
-            );
-        ''')
-        
-        # Expenses table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Expenses (
-                ExpenseID INTEGER PRIMARY KEY AUTOINCREMENT,
-                UserID TEXT NOT NULL,
-                Amount REAL NOT NULL,
-                Category TEXT NOT NULL,
-                Date DATE NOT NULL,
-                Income REAL NOT NULL,
-                FOREIGN KEY (UserID) REFERENCES User(UserID) ON DELETE CASCADE
-            );
-        ''')
-        
-        # Transactions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Transactions (
-                TransactionID INTEGER PRIMARY KEY AUTOINCREMENT,
-                UserID TEXT NOT NULL,
-                TransactionType TEXT NOT NULL,
-                Amount REAL NOT NULL,
-                Date DATE NOT NULL,
-                FOREIGN KEY (UserID) REFERENCES User(UserID) ON DELETE CASCADE
-            );
-        ''')
-        
-        conn.commit()
+    backend.init()
 
 def close_connection(exception):
-    """Close database connection"""
-    db = getattr(g, '_database', None)
-    if db is not None:
+    """Close database connections"""
+    g.pop('_records_repositories', None)
+    for db in g.pop('_records_databases', {}).values():
         db.close()
 
-def insert_record(table_name, data_dict):
+def insert_record(table_name, data_dict, user_id=None):
     """Insert a new record into the specified table"""
     try:
-        with get_db() as conn:
+        with get_db(user_id) as conn:
             cursor = conn.cursor()
             columns = ', '.join(data_dict.keys())
             placeholders = ', '.join(['?'] * len(data_dict))
@@ -80,10 +81,10 @@ def insert_record(table_name, data_dict):
         print(f"[INSERT ERROR] {e}")
         return False
 
-def get_records(table_name, where_clause=None, where_values=()):
+def get_records(table_name, where_clause=None, where_values=(), user_id=None):
     """Fetch records from the specified table"""
     try:
-        with get_db() as conn:
+        with get_db(user_id) as conn:
             cursor = conn.cursor()
             query = f"SELECT * FROM {table_name}"
             if where_clause:
@@ -94,10 +95,10 @@ def get_records(table_name, where_clause=None, where_values=()):
         print(f"[FETCH ERROR] {e}")
         return []
 
-def get_record(table_name, where_clause=None, where_values=()):
+def get_record(table_name, where_clause=None, where_values=(), user_id=None):
     """Fetch a single record"""
     try:
-        with get_db() as conn:
+        with get_db(user_id) as conn:
             cursor = conn.cursor()
             query = f"SELECT * FROM {table_name}"
             if where_clause:
@@ -108,10 +109,10 @@ def get_record(table_name, where_clause=None, where_values=()):
         print(f"[FETCH ERROR] {e}")
         return None
 
-def update_record(table_name, update_dict, where_clause, where_values):
+def update_record(table_name, update_dict, where_clause, where_values, user_id=None):
     """Update records in the specified table"""
     try:
-        with get_db() as conn:
+        with get_db(user_id) as conn:
             cursor = conn.cursor()
             set_clause = ', '.join([f"{key} = ?" for key in update_dict.keys()])
             values = tuple(update_dict.values()) + tuple(where_values)
@@ -124,10 +125,18 @@ def update_record(table_name, update_dict, where_clause, where_values):
         print(f"[UPDATE ERROR] {e}")
         return False
 
-def delete_record(table_name, where_clause, where_values):
+def adjust_income(user_id, delta):
+    """Apply a balance change to a user's running Income without re-reading their history"""
+    try:
+        return get_repository(user_id).adjust_income(user_id, delta)
+    except sqlite3.Error as e:
+        print(f"[UPDATE ERROR] {e}")
+        return False
+
+def delete_record(table_name, where_clause, where_values, user_id=None):
     """Delete records from the specified table"""
     try:
-        with get_db() as conn:
+        with get_db(user_id) as conn:
             cursor = conn.cursor()
             query = f"DELETE FROM {table_name} WHERE {where_clause};"
             cursor.execute(query, where_values)
@@ -137,10 +146,84 @@ def delete_record(table_name, where_clause, where_values):
         print(f"[DELETE ERROR] {e}")
         return False
 
-def execute_query(query, params=()):
+# === Aggregates: computed in SQLite so only result-sized data reaches Python ===
+def _where(where_clause):
+    return f" WHERE {where_clause}" if where_clause else ""
+
+def aggregate(table_name, expression, where_clause=None, where_values=(), default=None, user_id=None):
+    """Single aggregate value, e.g. aggregate("Expenses", "MAX(Date)", "UserID = ?", (uid,))"""
+    try:
+        with get_db(user_id) as conn:
+            query = f"SELECT {expression} FROM {table_name}{_where(where_clause)}"
+            row = conn.execute(query, where_values).fetchone()
+            return default if row is None or row[0] is None else row[0]
+    except sqlite3.Error as e:
+        print(f"[FETCH ERROR] {e}")
+        return default
+
+def sum_column(table_name, column, where_clause=None, where_values=(), user_id=None):
+    """SUM of one column (0.0 when no rows match)"""
+    return aggregate(table_name, f"SUM({column})", where_clause, where_values, default=0.0, user_id=user_id)
+
+def count_records(table_name, where_clause=None, where_values=(), user_id=None):
+    """Number of matching rows"""
+    return aggregate(table_name, "COUNT(*)", where_clause, where_values, default=0, user_id=user_id)
+
+def group_totals(table_name, group_column, value_column, where_clause=None, where_values=(), user_id=None):
+    """[(group, total, count, grand_total)] ordered by group; grand_total repeats the overall sum"""
+    try:
+        with get_db(user_id) as conn:
+            query = (f"SELECT {group_column}, SUM({value_column}) AS Total, COUNT(*) AS Count, "
+                     f"SUM(SUM({value_column})) OVER () AS GrandTotal "
+                     f"FROM {table_name}{_where(where_clause)} "
+                     f"GROUP BY {group_column} ORDER BY {group_column}")
+            return conn.execute(query, where_values).fetchall()
+    except sqlite3.Error as e:
+        print(f"[FETCH ERROR] {e}")
+        return []
+
+def group_totals_sql(table_name, columns, group_column, value_column, where_clause=None, order_by=None):
+    order = f"{group_column}, {order_by}" if order_by else group_column
+    # The window is ordered like the result, so SQLite sorts (or walks an index) only once
+    window = (f"PARTITION BY {group_column} ORDER BY {order_by} "
+              f"ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING"
+              if order_by else f"PARTITION BY {group_column}")
+    return (f"SELECT {columns}, "
+            f"SUM({value_column}) OVER w AS GroupTotal, COUNT(*) OVER w AS GroupCount "
+            f"FROM {table_name}{_where(where_clause)} "
+            f"WINDOW w AS ({window}) ORDER BY {order}")
+
+def records_with_group_totals(table_name, columns, group_column, value_column,
+                              where_clause=None, where_values=(), order_by=None, user_id=None):
+    """Rows ordered by group, each carrying its group's GroupTotal and GroupCount"""
+    try:
+        with get_db(user_id) as conn:
+            query = group_totals_sql(table_name, columns, group_column, value_column, where_clause, order_by)
+            return conn.execute(query, where_values).fetchall()
+    except sqlite3.Error as e:
+        print(f"[FETCH ERROR] {e}")
+        return []
+
+def running_balance_sql(table_name, columns, amount_expression, order_by, where_clause=None):
+    return (f"SELECT {columns}, SUM({amount_expression}) OVER "
+            f"(ORDER BY {order_by} ROWS UNBOUNDED PRECEDING) AS RunningBalance "
+            f"FROM {table_name}{_where(where_clause)} ORDER BY {order_by}")
+
+def running_balance(table_name, columns, amount_expression, order_by, where_clause=None, where_values=(),
+                    user_id=None):
+    """Rows in order_by order, each with the cumulative SUM(amount_expression) as RunningBalance"""
+    try:
+        with get_db(user_id) as conn:
+            query = running_balance_sql(table_name, columns, amount_expression, order_by, where_clause)
+            return conn.execute(query, where_values).fetchall()
+    except sqlite3.Error as e:
+        print(f"[FETCH ERROR] {e}")
+        return []
+
+def execute_query(query, params=(), user_id=None):
     """Execute a custom SQL query"""
     try:
-        with get_db() as conn:
+        with get_db(user_id) as conn:
             cursor = conn.cursor()
             cursor.execute(query, params)
             conn.commit()
@@ -149,6 +232,7 @@ def execute_query(query, params=()):
         print(f"[QUERY ERROR] {e}")
         return None
 
-# Initialize database tables when this module is imported
-with app.app_context():
+# Initialize database tables when this module is imported inside an app context
+# (there is no Flask app object in this module to open one with)
+if has_app_context():
     init_db()
\ No newline at end of file
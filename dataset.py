@@ -1,46 +1,206 @@
+import argparse
+import json
+import os
+import sqlite3
+from datetime import date
+
+import numpy as np
 import pandas as pd
-import random
-from datetime import datetime, timedelta
 
 # Configuration
-num_users = 20
-num_months = 12
 categories = ['Food', 'Transport', 'Entertainment', 'Housing', 'Others']
-records = []
-
-user_ids = [f"user_{i+1}" for i in range(num_users)]
-start_date = datetime(2023, 1, 1)
-
-for user in user_ids:
-    for month_offset in range(num_months):
-        date = start_date + timedelta(days=30 * month_offset)
-        income = random.randint(3000, 7000)
-        for category in categories:
-            amount = round(random.uniform(50, 900), 2)
-            records.append({
-                "UserID": user,
-                "Amount": amount,
-                "Category": category,
-                "Date": date.strftime('%Y-%m-%d'),
-                "Income": income
-            })
-
-# Create DataFrame
-df = pd.DataFrame(records)
-
-# Pivot into feature matrix
-df['Month'] = pd.to_datetime(df['Date']).dt.to_period('M')
-pivot_df = df.pivot_table(index=['UserID', 'Month', 'Income'],
-                          columns='Category',
-                          values='Amount',
-                          aggfunc='sum',
-                          fill_value=0).reset_index()
-
-pivot_df['Total_Expenses'] = pivot_df[categories].sum(axis=1)
-pivot_df['Savings'] = pivot_df['Income'] - pivot_df['Total_Expenses']
-
-# Save to CSV
-pivot_df.to_csv("synthetic_expense_data.csv", index=False)
-print("Dataset saved as 'synthetic_expense_data.csv'")
-
-print(pd.read_csv("synthetic_expense_data.csv").columns)
+
+# Every generated user can log in with this password (exactly 8 characters)
+DEFAULT_PASSWORD = 'password'
+
+# Income and spending ranges per user-month
+INCOME_RANGE = (3000, 7000)
+EXPENSE_RANGE = (50, 900)
+TRANSACTION_RANGE = (10, 500)
+
+
+def month_labels(start, num_months):
+    """['YYYY-MM', ...] for num_months consecutive months from start ('YYYY-MM')"""
+    year, month = (int(part) for part in start.split('-'))
+    labels = []
+    for offset in range(num_months):
+        y, m = divmod(month - 1 + offset, 12)
+        labels.append(f"{year + y:04d}-{m + 1:02d}")
+    return labels
+
+
+class SyntheticGenerator:
+    """Vectorized, seeded generator of user-month income and per-category spending.
+
+    Users are produced in chunks so memory stays bounded for millions of users.
+    Income, expense and transaction draws use independent streams, so the same
+    seed yields the same data for any chunk size.
+    """
+
+    def __init__(self, num_users=20, num_months=12, start='2023-01', seed=42,
+                 transactions_per_month=0, chunk_users=10000):
+        self.num_users = num_users
+        self.num_months = num_months
+        self.months = month_labels(start, num_months)
+        self.transactions_per_month = transactions_per_month
+        self.chunk_users = chunk_users
+        streams = np.random.SeedSequence(seed).spawn(6)
+        (self._income_rng, self._amount_rng, self._day_rng,
+         self._txn_amount_rng, self._txn_type_rng, self._txn_day_rng) = (np.random.default_rng(s) for s in streams)
+
+        # Lookup table of 'YYYY-MM-DD' strings, indexed by [month, day - 1]
+        self._dates = np.array([[f"{m}-{d:02d}" for d in range(1, 29)] for m in self.months], dtype=object)
+
+    def chunks(self):
+        """Yield dicts of arrays for each block of users"""
+        for first in range(0, self.num_users, self.chunk_users):
+            n = min(self.chunk_users, self.num_users - first)
+            shape = (n, self.num_months)
+            chunk = {
+                "user_ids": np.array([f"user_{i + 1}" for i in range(first, first + n)], dtype=object),
+                "income": self._income_rng.integers(INCOME_RANGE[0], INCOME_RANGE[1] + 1, size=shape),
+                "amounts": np.round(self._amount_rng.uniform(*EXPENSE_RANGE, size=shape + (len(categories),)), 2),
+                "days": self._day_rng.integers(1, 29, size=shape + (len(categories),)),
+            }
+            if self.transactions_per_month:
+                tshape = shape + (self.transactions_per_month,)
+                chunk["txn_amounts"] = np.round(self._txn_amount_rng.uniform(*TRANSACTION_RANGE, size=tshape), 2)
+                chunk["txn_received"] = self._txn_type_rng.random(size=tshape) < 0.5
+                chunk["txn_days"] = self._txn_day_rng.integers(1, 29, size=tshape)
+            yield chunk
+
+    # === CSV: one row per user-month, same layout as the original pivoted dataset ===
+    def write_csv(self, path):
+        order = sorted(categories)  # pivot_table sorted the category columns
+        cat_pos = [categories.index(c) for c in order]
+        with open(path, 'w', newline='') as f:
+            for i, chunk in enumerate(self.chunks()):
+                n = len(chunk["user_ids"])
+                amounts = chunk["amounts"].reshape(n * self.num_months, len(categories))
+                df = pd.DataFrame(amounts[:, cat_pos], columns=order)
+                df.insert(0, 'UserID', np.repeat(chunk["user_ids"], self.num_months))
+                df.insert(1, 'Month', np.tile(np.array(self.months, dtype=object), n))
+                df.insert(2, 'Income', chunk["income"].ravel())
+                df['Total_Expenses'] = amounts.sum(axis=1)
+                df['Savings'] = df['Income'] - df['Total_Expenses']
+                df.to_csv(f, index=False, header=(i == 0))
+
+    # === Binary arrays: memory-mapped .npy files plus a small JSON manifest ===
+    def write_npy(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        open_memmap = np.lib.format.open_memmap
+        income = open_memmap(os.path.join(directory, 'income.npy'), mode='w+',
+                             dtype=np.int32, shape=(self.num_users, self.num_months))
+        amounts = open_memmap(os.path.join(directory, 'amounts.npy'), mode='w+',
+                              dtype=np.float32, shape=(self.num_users, self.num_months, len(categories)))
+        first = 0
+        for chunk in self.chunks():
+            n = len(chunk["user_ids"])
+            income[first:first + n] = chunk["income"]
+            amounts[first:first + n] = chunk["amounts"]
+            first += n
+        income.flush()
+        amounts.flush()
+        with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+            json.dump({"users": self.num_users, "months": self.months, "categories": categories,
+                       "user_id_format": "user_{index + 1}"}, f, indent=2)
+
+    # === SQLite: straight into the app's User / Expenses / Transactions schema ===
+    def write_sqlite(self, path):
+        import rollup
+        import schema
+        from werkzeug.security import generate_password_hash
+
+        conn = sqlite3.connect(path)
+        schema.create_schema(conn)
+
+        # Load without per-row trigger and index maintenance, then rebuild both once
+        conn.execute("PRAGMA journal_mode = OFF;")
+        conn.execute("PRAGMA synchronous = OFF;")
+        rollup.drop_triggers(conn)
+        indexes = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+            "AND tbl_name IN ('Expenses', 'Transactions', 'MonthlyRollup')"
+        ).fetchall()
+        for (name,) in indexes:
+            conn.execute(f"DROP INDEX {name}")
+
+        password_hash = generate_password_hash(DEFAULT_PASSWORD)  # Hashing is slow; do it once
+        cat_names = np.array(categories, dtype=object)
+        month_idx = np.arange(self.num_months)
+
+        for chunk in self.chunks():
+            users = chunk["user_ids"]
+            original_income = chunk["income"].mean(axis=1).round(2)
+            spent = chunk["amounts"].sum(axis=(1, 2))
+            balance = original_income - spent
+
+            # Expenses: one row per user, month and category
+            shape = chunk["amounts"].shape
+            e_users = np.broadcast_to(users[:, None, None], shape).ravel()
+            e_dates = self._dates[np.broadcast_to(month_idx[None, :, None], shape), chunk["days"] - 1].ravel()
+            e_cats = np.broadcast_to(cat_names[None, None, :], shape).ravel()
+            e_income = np.broadcast_to(chunk["income"][:, :, None], shape).ravel()
+            expenses = zip(e_users.tolist(), chunk["amounts"].ravel().tolist(), e_cats.tolist(),
+                           e_dates.tolist(), e_income.tolist())
+
+            transactions = ()
+            if "txn_amounts" in chunk:
+                tshape = chunk["txn_amounts"].shape
+                signed = np.where(chunk["txn_received"], chunk["txn_amounts"], -chunk["txn_amounts"])
+                balance = balance + signed.sum(axis=(1, 2))
+                t_users = np.broadcast_to(users[:, None, None], tshape).ravel()
+                t_types = np.where(chunk["txn_received"], "received", "sent").ravel()
+                t_dates = self._dates[np.broadcast_to(month_idx[None, :, None], tshape),
+                                      chunk["txn_days"] - 1].ravel()
+                transactions = zip(t_users.tolist(), t_types.tolist(),
+                                   chunk["txn_amounts"].ravel().tolist(), t_dates.tolist())
+
+            with conn:
+                conn.executemany(
+                    "INSERT INTO User (UserID, Email, Password, Income, OriginalIncome) VALUES (?, ?, ?, ?, ?)",
+                    ((uid, f"{uid}@example.com", password_hash, round(float(bal), 2), float(orig))
+                     for uid, bal, orig in zip(users, balance, original_income))
+                )
+                conn.executemany(
+                    "INSERT INTO Expenses (UserID, Amount, Category, Date, Income) VALUES (?, ?, ?, ?, ?)",
+                    expenses
+                )
+                conn.executemany(
+                    "INSERT INTO Transactions (UserID, TransactionType, Amount, Date) VALUES (?, ?, ?, ?)",
+                    transactions
+                )
+
+        # Recreate the dropped indexes and triggers, then backfill the rollup in one pass
+        schema.create_schema(conn)
+        rollup.rebuild(conn)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.close()
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic expense data.")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--start", default="2023-01", help="First month, YYYY-MM")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--transactions", type=int, default=0, help="Transactions per user-month (sqlite only)")
+    parser.add_argument("--chunk-users", type=int, default=10000, help="Users generated per chunk")
+    parser.add_argument("--format", choices=("csv", "npy", "sqlite"), default="csv")
+    parser.add_argument("--out", help="Output file (csv/sqlite) or directory (npy)")
+    args = parser.parse_args()
+
+    generator = SyntheticGenerator(args.users, args.months, args.start, args.seed,
+                                   args.transactions, args.chunk_users)
+    if args.format == "csv":
+        out = args.out or "synthetic_expense_data.csv"
+        generator.write_csv(out)
+    elif args.format == "npy":
+        out = args.out or "synthetic_expense_data"
+        generator.write_npy(out)
+    else:
+        out = args.out or f"synthetic_{date.today():%Y%m%d}.db"
+        generator.write_sqlite(out)
+
+    print(f"Dataset saved as '{out}' ({args.users} users x {args.months} months)")
@@ -0,0 +1,218 @@
+# Query-plan diagnostics: make sure every query the app issues is served by an index
+import re
+import sqlite3
+import sys
+import argparse
+
+import analytics
+import budgets
+import database
+import forecast
+import history
+import ledger
+import login_guard
+import records
+import repository
+import retention
+import rollup
+import schema
+import scoring
+import storage
+import transactions
+
+# Database configuration
+DATABASE = 'budget_management.db'
+
+# === Catalogue of Every Query the App Issues ===
+# Each entry is (name, sql, sample parameters), built from the constants and
+# builders the modules themselves run. Trigger statements are read from the
+# schema by trigger_queries() instead.
+HOT_QUERIES = [
+    # --- app.py ---
+    ("login: user by id",
+     repository.select_sql(repository.User, ('UserID', 'Email', 'Password'), repository.USER_WHERE), ("u",)),
+    ("register: user or email exists", repository.USER_OR_EMAIL_EXISTS_SQL, ("u", "e")),
+    ("dashboard: month-to-date expenses",
+     repository.select_sql(repository.Expense, repository.Expense.columns, repository.DATE_RANGE_WHERE),
+     ("u", "2024-01-01", "2024-01-31")),
+    ("dashboard: month-to-date transactions",
+     repository.select_sql(repository.Transaction, repository.Transaction.columns, repository.DATE_RANGE_WHERE),
+     ("u", "2024-01-01", "2024-01-31")),
+    ("update_user: income", repository.SET_INCOME_SQL, (0.0, 0.0, "u")),
+    ("update_user: password", repository.update_sql(repository.User, ("Password",)), ("p", "u")),
+
+    # --- login_guard.py (batched audit log) ---
+    ("login_guard: audit insert",
+     login_guard.INSERT_ATTEMPT_SQL, ("u", "127.0.0.1", "2024-01-01 00:00:00", False)),
+
+    # --- retention.py (LoginAttempts compaction) ---
+    ("retention: expired attempts batch",
+     retention.EXPIRED_BATCH_SQL, ("2024-01-01 00:00:00", 5000)),
+
+    # --- rollup.py (dashboard, analysis.py and the rollup triggers) ---
+    ("rollup: month totals",
+     rollup.MONTH_TOTALS_SQL, ("u", "2024-01", "expense")),
+    ("rollup: data version",
+     rollup.DATA_VERSION_SQL, ("u",)),
+
+    # --- scoring.py ---
+    ("scoring: month category totals for all users",
+     scoring.MONTH_CATEGORY_SQL, ("2024-01",)),
+    ("scoring: month category totals for one user",
+     scoring.MONTH_CATEGORY_SQL + " AND UserID = ?", ("2024-01", "u")),
+
+    # --- history.py ---
+    ("history: first expenses page",
+     history.page_sql(history.KINDS["expenses"], history.build_filters(history.KINDS["expenses"], "u")[0]),
+     ("u", 51)),
+    ("history: filtered expenses page after cursor",
+     history.page_sql(history.KINDS["expenses"],
+                      history.build_filters(history.KINDS["expenses"], "u", start="2024-01-01", bucket="Food",
+                                            min_amount=1.0)[0]
+                      + [history.SEEK_CLAUSE.format(id=history.KINDS["expenses"]["id"])]),
+     ("u", "2024-01-01", "Food", 1.0, "2024-06-01", 10, 51)),
+    ("history: transactions page after cursor",
+     history.page_sql(history.KINDS["transactions"],
+                      history.build_filters(history.KINDS["transactions"], "u", bucket="sent")[0]
+                      + [history.SEEK_CLAUSE.format(id=history.KINDS["transactions"]["id"])]),
+     ("u", "sent", "2024-06-01", 10, 51)),
+    ("history: full expenses export",
+     history.export_sql(history.KINDS["expenses"], history.build_filters(history.KINDS["expenses"], "u")[0]),
+     ("u",)),
+    ("history: transactions export",
+     history.export_sql(history.KINDS["transactions"],
+                        history.build_filters(history.KINDS["transactions"], "u", start="2024-01-01")[0]),
+     ("u", "2024-01-01")),
+
+    # --- records.py / transactions.py / dashboard.py (via repository.py and database.py) ---
+    ("repository: user by id",
+     repository.select_sql(repository.User, repository.User.columns, repository.USER_WHERE), ("u",)),
+    ("repository: user exists", repository.USER_EXISTS_SQL, ("u",)),
+    ("repository: current income", repository.INCOME_SQL, ("u",)),
+    ("records: expenses with category totals", database.group_totals_sql(**records.GROUPED_EXPENSES), ("u",)),
+    ("repository: expense owned by user",
+     repository.select_sql(repository.Expense, ("Amount",), repository.OWNED_EXPENSE_WHERE), (1, "u")),
+    ("repository: update expense", repository.update_sql(repository.Expense, ("Amount",)), (1.0, 1)),
+    ("repository: delete expense", repository.DELETE_EXPENSE_SQL, (1,)),
+    ("repository: adjust user income", repository.ADJUST_INCOME_SQL, (0.0, "u")),
+    ("repository: one user's budgets",
+     repository.select_sql(repository.Budget, repository.Budget.columns, repository.USER_WHERE,
+                           repository.BUDGET_ORDER), ("u",)),
+    ("repository: set a budget", repository.SET_BUDGET_SQL, ("u", "Food", 1.0, "2024-01")),
+    ("repository: delete a budget", repository.DELETE_BUDGET_SQL, ("u", "Food")),
+    ("transactions: running net balance", database.running_balance_sql(**transactions.RUNNING_BALANCE), ("u",)),
+
+    # --- analytics.py (column arrays extended past a watermark) ---
+    ("analytics: new expenses for one user",
+     analytics.EXPENSE_ROWS_SQL + analytics.USER_ROWS_WHERE.format(key="ExpenseID"), ("u", 0)),
+    ("analytics: new transactions for one user",
+     analytics.TRANSACTION_ROWS_SQL + analytics.USER_ROWS_WHERE.format(key="TransactionID"), ("u", 0)),
+    ("analytics: new expenses for the cohort",
+     analytics.EXPENSE_ROWS_SQL + analytics.ALL_ROWS_WHERE.format(key="ExpenseID"), (0,)),
+    ("analytics: base income",
+     analytics.BASE_INCOME_SQL + " WHERE UserID = ?", ("u",)),
+
+    # --- storage.py (moving users between shards) ---
+    *[(f"storage: copy {table} rows", storage.user_rows_sql(table), ("u",)) for table in storage.USER_TABLES],
+    *[(f"storage: {sql.split(' WHERE')[0].lower()}", sql, ("u",)) for sql in storage.DELETE_USER_SQL],
+    ("storage: latest copied login attempt", storage.LATEST_ATTEMPT_SQL, ("u",)),
+    ("storage: login attempts since the copy", storage.NEW_ATTEMPTS_SQL, ("u", 0)),
+    ("storage: fence a moving user", storage.FENCE_SQL, ("u",)),
+    ("storage: lift a fence", storage.UNFENCE_SQL, ("u",)),
+
+    # --- budgets.py ---
+    ("budgets: one user's limits", budgets.LIMITS_SQL, ("u",)),
+    ("budgets: poll alerts past a cursor", budgets.ALERTS_SQL, ("u", 0, 100)),
+    ("budgets: latest alert", budgets.LATEST_ALERT_SQL, ("u",)),
+
+    # --- forecast.py ---
+    ("forecast: one user's month", forecast.USER_FORECAST_SQL, ("u", "2024-01")),
+
+    # --- ledger.py ---
+    ("ledger: recompute one balance",
+     ledger.EXPECTED_BALANCE_SQL + " WHERE u.UserID = ?", ("u",)),
+]
+
+
+# NEW.col / OLD.col inside a trigger body; bound as parameters when planned on their own
+ROW_REFERENCE = re.compile(r"\b(?:NEW|OLD)\.\w+")
+
+
+def trigger_queries(conn):
+    """(name, sql, parameters) for every statement (and WHEN condition) of the schema's triggers"""
+    queries = []
+    for name, sql in conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' ORDER BY name"):
+        header, _, body = sql.partition("BEGIN")
+        statements = [statement.strip() for statement in body.rsplit("END", 1)[0].split(";")]
+        when = re.search(r"\bWHEN\b(.*)", header, re.S)
+        if when:
+            statements.append(f"SELECT 1 WHERE {when.group(1).strip()}")
+        # RAISE() can only be planned inside a trigger, and reads nothing
+        statements = [s for s in statements if s and not s.upper().startswith("SELECT RAISE")]
+        for number, statement in enumerate(statements, 1):
+            statement, references = ROW_REFERENCE.subn("?", statement)
+            queries.append((f"{name} #{number}", statement, ("x",) * references))
+    return queries
+
+
+def is_full_scan(detail):
+    """Return True if an EXPLAIN QUERY PLAN detail line reads a whole table or index"""
+    # SQLite >= 3.36 prints "SCAN Expenses", older versions "SCAN TABLE Expenses".
+    # "SCAN CONSTANT ROW" is emitted for queries without a FROM clause, and
+    # "SCAN (subquery-N)" reads a window-function co-routine, not a table.
+    return (detail.startswith("SCAN ") and not detail.startswith("SCAN CONSTANT ROW")
+            and not detail.startswith("SCAN (subquery"))
+
+
+def is_unindexed_sort(detail):
+    """Return True if ORDER BY has to sort every matching row instead of reading index order"""
+    return detail.startswith("USE TEMP B-TREE FOR") and "ORDER BY" in detail
+
+
+def explain(conn, sql, params=()):
+    """Return the detail column of EXPLAIN QUERY PLAN for a query"""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def check_query_plans(conn, queries=None):
+    """Run EXPLAIN QUERY PLAN on every catalogued query and collect full scans and sorts"""
+    failures = []
+    for name, sql, params in (queries or HOT_QUERIES):
+        try:
+            details = explain(conn, sql, params)
+        except sqlite3.Error as e:
+            failures.append((name, f"could not be planned: {e}"))
+            continue
+        # Subqueries SQLite builds first (e.g. a list of constants) are scanned by name
+        built = {detail.split(" ", 1)[1] for detail in details if detail.startswith(("MATERIALIZE ", "CO-ROUTINE "))}
+        for detail in details:
+            if (is_full_scan(detail) and detail[len("SCAN "):] not in built) or is_unindexed_sort(detail):
+                failures.append((name, detail))
+    return failures
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if any app query does a full table scan or sort.")
+    parser.add_argument("--db", default=DATABASE, help="Path to the SQLite database")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        # Plans depend on the indexes, so check them against the schema the app creates
+        schema.create_schema(conn)
+    except sqlite3.Error as e:
+        print(f"[ERROR] Could not create the schema in {args.db}: {e}")
+        sys.exit(1)
+    queries = HOT_QUERIES + trigger_queries(conn)
+    failures = check_query_plans(conn, queries)
+    conn.close()
+
+    if failures:
+        for name, detail in failures:
+            print(f"[ERROR] {name}: {detail}")
+        print(f"[ERROR] {len(failures)} query plan problem(s) found.")
+        sys.exit(1)
+
+    print(f"[SUCCESS] All {len(queries)} queries use an index.")
@@ -0,0 +1,310 @@
+# Next-month spend forecasts per user and category, fitted for every user in batched solves
+import sqlite3
+import argparse
+import time
+from datetime import date
+
+import numpy as np
+
+import storage
+
+# Database configuration
+DATABASE = 'budget_management.db'
+
+# Closed months of history each fit looks at
+HISTORY_MONTHS = 24
+
+# Features per series: intercept, the last LAGS months and the trailing 12-month mean
+LAGS = 3
+SEASON = 12
+N_FEATURES = LAGS + 2
+
+# Ridge on the Jacobi-scaled normal equations (scale free; the intercept is not penalized)
+DEFAULT_RIDGE = 0.1
+
+# A user needs this many (category, month) training rows; others get the 3-month mean
+MIN_ROWS = 2 * N_FEATURES
+
+# Users read per history query
+DEFAULT_CHUNK_USERS = 10000
+
+# (user, category) series fitted per batched solve, whole users at a time. Each
+# series costs about 2.5 KB of feature tensors, so this bounds a solve to ~125 MB
+# however many free-text categories the users have.
+DEFAULT_CHUNK_SERIES = 50000
+
+FORECAST_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS Forecasts (
+        UserID TEXT NOT NULL,
+        Month TEXT NOT NULL,
+        Category TEXT NOT NULL,
+        Amount REAL NOT NULL,
+        Baseline REAL NOT NULL,
+        PRIMARY KEY (UserID, Month, Category)
+    ) WITHOUT ROWID;
+'''
+
+# Last closed month each user's forecast was fitted through (the watermark)
+FORECAST_STATE_SQL = '''
+    CREATE TABLE IF NOT EXISTS ForecastState (
+        UserID TEXT PRIMARY KEY,
+        BasisMonth TEXT NOT NULL,
+        FittedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) WITHOUT ROWID;
+'''
+
+# Users whose forecast predates the latest closed month, or who have none yet
+STALE_USERS_SQL = '''
+    SELECT u.UserID FROM User u
+    LEFT JOIN ForecastState s ON s.UserID = u.UserID
+    WHERE s.BasisMonth IS NULL OR s.BasisMonth < ?
+    ORDER BY u.UserID
+'''
+
+# Monthly expense totals for a contiguous range of users, by the rollup's primary key
+CHUNK_HISTORY_SQL = '''
+    SELECT UserID, Month, Bucket, Total FROM MonthlyRollup
+    WHERE UserID BETWEEN ? AND ? AND Month BETWEEN ? AND ? AND Kind = 'expense'
+'''
+
+USER_FORECAST_SQL = '''
+    SELECT Category, Amount, Baseline FROM Forecasts
+    WHERE UserID = ? AND Month = ? ORDER BY Category
+'''
+
+
+def init_schema(conn):
+    conn.execute(FORECAST_TABLE_SQL)
+    conn.execute(FORECAST_STATE_SQL)
+    conn.commit()
+
+
+def _month_number(months):
+    """'YYYY-MM' strings to months since 1970-01"""
+    return np.array(months, dtype='datetime64[M]').astype(np.int64)
+
+
+def _month_label(number):
+    return str(np.datetime64(int(number), 'M'))
+
+
+def _last_closed_month(today=None):
+    return int(np.datetime64(today or date.today(), 'M').astype(np.int64)) - 1
+
+
+# === Batched Fitting ===
+def design(Y, lags=LAGS, season=SEASON):
+    """Feature tensor F[s, t, p] for predicting month t of series s from the months before it, t = 0..M"""
+    S, M = Y.shape
+    F = np.empty((S, M + 1, lags + 2))
+    F[..., 0] = 1.0
+    padded = np.concatenate([np.zeros((S, lags)), Y], axis=-1)
+    for k in range(1, lags + 1):
+        F[..., k] = padded[:, lags - k:lags - k + M + 1]  # Y[t - k], zero before the window
+    cs = np.concatenate([np.zeros((S, 1)), np.cumsum(Y, axis=-1)], axis=-1)
+    t = np.arange(M + 1)
+    lo = np.maximum(t - season, 0)
+    F[..., lags + 1] = (cs[:, t] - cs[:, lo]) / np.maximum(t - lo, 1)
+    return F
+
+
+def fit_predict(Y, owner, users, ridge=DEFAULT_RIDGE):
+    """Fit one ridge regression per user on all of their category series at once.
+
+    Y is (series, months) of closed-month totals and owner the user index
+    (0..users-1) of each series. Only series that exist are stored, so the
+    tensors grow with the data rather than with users x categories. Every
+    user's normal equations are summed from their series' and solved
+    together as a (users, p, p) stack. Returns (forecast, baseline, fitted),
+    the first two per series and fitted a (users,) mask of users with
+    enough history for the regression; the rest get the 3-month mean.
+    """
+    S, M = Y.shape
+    F = design(Y)
+    active = Y.any(axis=-1)                                          # (S,) series with any spend
+    first = np.full(users, M)                                        # first active month per user
+    np.minimum.at(first, owner[active], Y[active].astype(bool).argmax(axis=-1))
+    rows = (np.arange(M)[None, :] > first[owner][:, None]) & active[:, None]  # (S, M)
+
+    X = F[:, :M, :]
+    Xw = X * rows[..., None]
+    A = np.zeros((users, N_FEATURES, N_FEATURES))
+    b = np.zeros((users, N_FEATURES))
+    np.add.at(A, owner, np.einsum('stp,stq->spq', Xw, X))
+    np.add.at(b, owner, np.einsum('stp,st->sp', Xw, Y))
+    n = np.bincount(owner, weights=rows.sum(axis=-1), minlength=users)
+
+    baseline = Y[:, -3:].mean(axis=-1)
+    forecast = baseline.copy()
+    fitted = n >= MIN_ROWS
+    if fitted.any():
+        A, b = A[fitted], b[fitted]
+        scale = np.sqrt(np.einsum('upp->up', A))
+        scale[scale == 0] = 1.0
+        A_s = A / (scale[:, :, None] * scale[:, None, :])
+        penalty = np.full(A.shape[-1], ridge)
+        penalty[0] = 1e-9
+        A_s += np.eye(A.shape[-1]) * penalty
+        theta = np.zeros((users, N_FEATURES))
+        theta[fitted] = np.linalg.solve(A_s, (b / scale)[..., None])[..., 0] / scale
+        series = fitted[owner]
+        forecast[series] = np.einsum('sp,sp->s', F[series, M, :], theta[owner[series]])
+    return np.maximum(forecast, 0.0), baseline, fitted
+
+
+def _history_series(rows, user_ids, first_month, months):
+    """(series, months) totals, owner user index and category of each series, from
+    (UserID, Month, Bucket, Total) rows; series are ordered by user"""
+    if not rows:
+        return np.zeros((0, months)), np.zeros(0, dtype=np.int64), []
+    position = {user_id: i for i, user_id in enumerate(user_ids)}
+    users, month_labels, buckets, totals = zip(*rows)
+    u = np.fromiter((position[user_id] for user_id in users), dtype=np.int64, count=len(users))
+    m = _month_number(month_labels) - first_month
+    categories, c = np.unique(np.asarray(buckets, dtype=object), return_inverse=True)
+    keys, s = np.unique(u * len(categories) + c, return_inverse=True)
+    Y = np.bincount(s * months + m, weights=np.asarray(totals, dtype=float),
+                    minlength=len(keys) * months).reshape(len(keys), months)
+    return Y, keys // len(categories), list(categories[keys % len(categories)])
+
+
+def _user_batches(owner, users, chunk_series):
+    """(first user, end user, first series, end series) batches of whole users,
+    each with at most chunk_series series unless a single user has more"""
+    ends = np.cumsum(np.bincount(owner, minlength=users))
+    start = 0
+    while start < users:
+        offset = int(ends[start - 1]) if start else 0
+        stop = max(int(np.searchsorted(ends, offset + chunk_series, side='right')), start + 1)
+        yield start, stop, offset, int(ends[stop - 1])
+        start = stop
+
+
+# === Refresh ===
+def refresh(conn, today=None, ridge=DEFAULT_RIDGE, chunk_users=DEFAULT_CHUNK_USERS,
+            force=False, chunk_series=DEFAULT_CHUNK_SERIES):
+    """Forecast next month for every user whose forecast predates the last closed month.
+
+    Runs after a month closes refit everyone; runs within a month only pick
+    up users who have no forecast yet, so a nightly schedule is cheap on
+    most nights. Each chunk commits with its watermark, so an interrupted
+    run resumes where it stopped. Returns a summary dict.
+    """
+    basis_number = _last_closed_month(today)
+    basis = _month_label(basis_number)
+    target = _month_label(basis_number + 1)
+    first_month = basis_number - HISTORY_MONTHS + 1
+    window = (_month_label(first_month), basis)
+
+    if force:
+        conn.execute("DELETE FROM ForecastState WHERE BasisMonth >= ?", (basis,))
+        conn.commit()
+    users = [row[0] for row in conn.execute(STALE_USERS_SQL, (basis,))]
+
+    started = time.perf_counter()
+    summary = {"basis_month": basis, "target_month": target, "users": len(users),
+               "fitted": 0, "baseline_only": 0, "forecasts": 0}
+    for start in range(0, len(users), chunk_users):
+        chunk = users[start:start + chunk_users]
+        rows = conn.execute(CHUNK_HISTORY_SQL, (chunk[0], chunk[-1]) + window).fetchall()
+        # The key range can include users that are already up to date; keep only this chunk's
+        wanted = set(chunk)
+        Y, owner, categories = _history_series([r for r in rows if r[0] in wanted], chunk,
+                                               first_month, HISTORY_MONTHS)
+        records = []
+        fitted = np.zeros(len(chunk), dtype=bool)
+        for u0, u1, s0, s1 in _user_batches(owner, len(chunk), chunk_series):
+            forecast, baseline, fitted[u0:u1] = fit_predict(Y[s0:s1], owner[s0:s1] - u0, u1 - u0, ridge)
+            records += [(chunk[owner[s]], target, categories[s], round(float(forecast[s - s0]), 2),
+                         round(float(baseline[s - s0]), 2))
+                        for s in range(s0, s1) if Y[s].any()]
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO Forecasts (UserID, Month, Category, Amount, Baseline) "
+                "VALUES (?, ?, ?, ?, ?)", records)
+            conn.executemany(
+                "INSERT OR REPLACE INTO ForecastState (UserID, BasisMonth) VALUES (?, ?)",
+                [(user_id, basis) for user_id in chunk])
+        summary["fitted"] += int(fitted.sum())
+        summary["baseline_only"] += int((~fitted).sum())
+        summary["forecasts"] += len(records)
+
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def user_forecast(conn, user_id, month=None):
+    """[(Category, Amount, Baseline)] forecast for a user's month (default: the current month)"""
+    month = month or date.today().strftime('%Y-%m')
+    return [(row[0], row[1], row[2]) for row in conn.execute(USER_FORECAST_SQL, (user_id, month))]
+
+
+def evaluate(conn, month):
+    """Mean absolute error of a month's forecasts and baselines against the actual totals"""
+    row = conn.execute('''
+        SELECT COUNT(*), AVG(ABS(f.Amount - COALESCE(r.Total, 0))), AVG(ABS(f.Baseline - COALESCE(r.Total, 0)))
+        FROM Forecasts f
+        LEFT JOIN MonthlyRollup r ON r.UserID = f.UserID AND r.Month = f.Month
+                                 AND r.Kind = 'expense' AND r.Bucket = f.Category
+        WHERE f.Month = ?
+    ''', (month,)).fetchone()
+    return {"month": month, "series": row[0], "forecast_mae": row[1], "baseline_mae": row[2]}
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-user, per-category next-month spend forecasts.")
+    parser.add_argument("--db", default=DATABASE,
+                        help="Path to the SQLite database (ignored when EXPENSE_SHARDS is set)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    refresh_parser = sub.add_parser("refresh", help="Fit users whose forecast predates the last closed month")
+    refresh_parser.add_argument("--force", action="store_true", help="Refit every user")
+    refresh_parser.add_argument("--ridge", type=float, default=DEFAULT_RIDGE)
+    refresh_parser.add_argument("--chunk-users", type=int, default=DEFAULT_CHUNK_USERS)
+    refresh_parser.add_argument("--chunk-series", type=int, default=DEFAULT_CHUNK_SERIES)
+
+    show_parser = sub.add_parser("show", help="Print one user's forecast")
+    show_parser.add_argument("user_id")
+    show_parser.add_argument("--month", help="'YYYY-MM' (default: this month)")
+
+    evaluate_parser = sub.add_parser("evaluate", help="Compare a closed month's forecasts with actuals")
+    evaluate_parser.add_argument("month", help="'YYYY-MM'")
+    args = parser.parse_args()
+
+    # One user's shard for `show`; every shard in turn for the batch commands
+    backend = storage.from_env(args.db)
+    paths = [backend.path_for(args.user_id)] if args.command == "show" else backend.paths()
+    results = []
+    for path in paths:
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA busy_timeout = 5000;")
+        init_schema(conn)
+        if args.command == "refresh":
+            results.append(refresh(conn, ridge=args.ridge, chunk_users=args.chunk_users, force=args.force,
+                                   chunk_series=args.chunk_series))
+        elif args.command == "show":
+            results = user_forecast(conn, args.user_id, args.month)
+        else:
+            results.append(evaluate(conn, args.month))
+        conn.close()
+
+    if args.command == "refresh":
+        total = {key: sum(r[key] for r in results) for key in ("users", "fitted", "baseline_only", "forecasts", "seconds")}
+        print(f"[SUCCESS] Forecast {results[0]['target_month']} for {total['users']} users "
+              f"({total['fitted']} fitted, {total['baseline_only']} baseline only, "
+              f"{total['forecasts']} series) in {total['seconds']:.3f}s.")
+    elif args.command == "show":
+        if not results:
+            print("[INFO] No forecast for that user and month.")
+        for category, amount, baseline in results:
+            print(f"  {category:<16} forecast={amount:<10.2f} 3-month mean={baseline:.2f}")
+    else:
+        series = sum(r["series"] for r in results)
+        if not series:
+            print(f"[INFO] No forecasts stored for {args.month}.")
+        else:
+            forecast_mae = sum(r["forecast_mae"] * r["series"] for r in results if r["series"]) / series
+            baseline_mae = sum(r["baseline_mae"] * r["series"] for r in results if r["series"]) / series
+            print(f"[INFO] {series} series: forecast MAE {forecast_mae:.2f}, "
+                  f"3-month mean MAE {baseline_mae:.2f}.")
@@ -0,0 +1,124 @@
+# Password hashing off the request thread, on a bounded process pool
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    """Raised when the pool already has max_pending hashes in flight"""
+
+    def __init__(self, retry_after=1):
+        super().__init__("Password hashing is saturated")
+        self.retry_after = retry_after
+
+
+def _hash(password, method):
+    if method:
+        return generate_password_hash(password, method=method)
+    return generate_password_hash(password)
+
+
+class HashingService:
+    """Run werkzeug hashing and verification in worker processes.
+
+    method is werkzeug's method string and carries the work factor, e.g.
+    'scrypt:32768:8:1' or 'pbkdf2:sha256:600000' (None uses werkzeug's
+    default). At most max_pending calls may be queued or running; beyond
+    that callers get HashingBusy instead of waiting, so a login storm
+    cannot pile up unbounded work. workers=0 hashes inline on the caller's
+    thread, which is useful for scripts and comparisons.
+    """
+
+    def __init__(self, workers=None, max_pending=None, method=None, timeout=30.0):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending or max(1, self.workers) * 4
+        self.method = method
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._metrics = {"submitted": 0, "completed": 0, "rejected": 0, "errors": 0, "timeouts": 0,
+                         "in_flight": 0, "peak_in_flight": 0, "total_seconds": 0.0}
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _finish(self, started, ok):
+        """Free the job's slot once it has really stopped running"""
+        with self._lock:
+            self._metrics["in_flight"] -= 1
+            if ok:
+                self._metrics["completed"] += 1
+                self._metrics["total_seconds"] += time.perf_counter() - started
+            else:
+                self._metrics["errors"] += 1
+        self._slots.release()
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._metrics["rejected"] += 1
+            raise HashingBusy()
+
+        started = time.perf_counter()
+        with self._lock:
+            self._metrics["submitted"] += 1
+            self._metrics["in_flight"] += 1
+            self._metrics["peak_in_flight"] = max(self._metrics["peak_in_flight"], self._metrics["in_flight"])
+        if self.workers == 0:
+            try:
+                result = fn(*args)
+            except Exception:
+                self._finish(started, False)
+                raise
+            self._finish(started, True)
+            return result
+
+        try:
+            future = self._pool().submit(fn, *args)
+        except Exception:
+            self._finish(started, False)
+            raise
+        # A caller that gives up waiting must not free the slot of a hash still
+        # running in a worker, so the slot is released when the job itself ends
+        future.add_done_callback(
+            lambda done: self._finish(started, not done.cancelled() and done.exception() is None))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()  # Only succeeds if it never started
+            with self._lock:
+                self._metrics["timeouts"] += 1
+            raise
+
+    def hash(self, password):
+        """Hash a new password with the configured method and work factor"""
+        return self._run(_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """check_password_hash in a worker process"""
+        return self._run(check_password_hash, pwhash, password)
+
+    def stats(self):
+        with self._lock:
+            completed = self._metrics["completed"]
+            return {
+                **self._metrics,
+                "total_seconds": round(self._metrics["total_seconds"], 3),
+                "avg_ms": round(self._metrics["total_seconds"] / completed * 1000, 3) if completed else 0.0,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "method": self.method or "default",
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,210 @@
+# Read paths over a user's expense and transaction history
+import argparse
+import base64
+import binascii
+import csv
+import io
+import json
+import sqlite3
+import sys
+import zlib
+
+import storage
+
+# Database configuration
+DATABASE = 'budget_management.db'
+
+# Largest page a caller may request
+MAX_PAGE_SIZE = 500
+DEFAULT_PAGE_SIZE = 50
+
+# Rows pulled from the cursor per fetchmany() call during an export
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = ("csv", "jsonl")
+MIME_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+# Per-kind table layout; only these columns are ever selected
+KINDS = {
+    "expenses": {
+        "table": "Expenses",
+        "id": "ExpenseID",
+        "columns": ("ExpenseID", "Amount", "Category", "Date"),
+        "bucket": "Category",
+    },
+    "transactions": {
+        "table": "Transactions",
+        "id": "TransactionID",
+        "columns": ("TransactionID", "TransactionType", "Amount", "Date"),
+        "bucket": "TransactionType",
+    },
+}
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(row_date, row_id):
+    """Opaque cursor pointing just past (Date, ID)"""
+    return base64.urlsafe_b64encode(f"{row_date}|{row_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return (Date, ID) from an encoded cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        row_date, row_id = base64.urlsafe_b64decode(padded.encode()).decode().rsplit("|", 1)
+        return row_date, int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor("Invalid cursor")
+
+
+def build_filters(spec, user_id, start=None, end=None, bucket=None, min_amount=None, max_amount=None):
+    """WHERE clause and parameters for a user's rows; every filter is optional"""
+    clauses = ["UserID = ?"]
+    params = [user_id]
+    if start:
+        clauses.append("Date >= ?")
+        params.append(start)
+    if end:
+        clauses.append("Date <= ?")
+        params.append(end)
+    if bucket:
+        clauses.append(f"{spec['bucket']} = ?")
+        params.append(bucket)
+    if min_amount is not None:
+        clauses.append("Amount >= ?")
+        params.append(min_amount)
+    if max_amount is not None:
+        clauses.append("Amount <= ?")
+        params.append(max_amount)
+    return clauses, params
+
+
+# Keyset predicate: rows strictly older than the cursor's (Date, ID)
+SEEK_CLAUSE = "(Date, {id}) < (?, ?)"
+
+
+def page_sql(spec, clauses):
+    """Newest-first page query over (UserID, Date, ID); the last parameter is the LIMIT"""
+    return (f"SELECT {', '.join(spec['columns'])} FROM {spec['table']} "
+            f"WHERE {' AND '.join(clauses)} "
+            f"ORDER BY Date DESC, {spec['id']} DESC LIMIT ?")
+
+
+def page(conn, kind, user_id, limit=DEFAULT_PAGE_SIZE, cursor=None, **filters):
+    """One page of rows, newest first, using keyset (seek) pagination on (Date, ID).
+
+    Returns (items, next_cursor). next_cursor is None on the last page. The
+    seek predicate lets SQLite start at the cursor within the
+    (UserID, Date, ID) index, so later pages cost the same as the first.
+    """
+    spec = KINDS[kind]
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    clauses, params = build_filters(spec, user_id, **filters)
+    if cursor:
+        clauses.append(SEEK_CLAUSE.format(id=spec['id']))
+        params.extend(decode_cursor(cursor))
+
+    rows = conn.execute(page_sql(spec, clauses), params + [limit + 1]).fetchall()
+
+    items = [dict(zip(spec['columns'], row)) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["Date"], last[spec['id']])
+    return items, next_cursor
+
+
+# === Export ===
+def export_sql(spec, clauses):
+    """Oldest-first query over every matching row"""
+    return (f"SELECT {', '.join(spec['columns'])} FROM {spec['table']} "
+            f"WHERE {' AND '.join(clauses)} "
+            f"ORDER BY Date, {spec['id']}")
+
+
+def iter_batches(conn, kind, user_id, batch_size=EXPORT_BATCH_SIZE, **filters):
+    """Yield lists of row tuples, oldest first, without materializing the full result"""
+    spec = KINDS[kind]
+    clauses, params = build_filters(spec, user_id, **filters)
+    cursor = conn.execute(export_sql(spec, clauses), params)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [tuple(row) for row in rows]
+    finally:
+        cursor.close()
+
+
+def encode_csv(columns, batches):
+    """Header line, then one CSV chunk per batch"""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(columns)
+    yield buf.getvalue().encode()
+    for rows in batches:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+
+
+def encode_jsonl(columns, batches):
+    """One JSON object per line, one chunk per batch"""
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows).encode()
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a byte stream incrementally into a single gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(conn, kind, user_id, fmt="csv", compress=False, batch_size=EXPORT_BATCH_SIZE, **filters):
+    """Generator of encoded bytes for a user's full (optionally filtered) history.
+
+    Memory stays at roughly one batch regardless of how many rows the user has.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    columns = KINDS[kind]["columns"]
+    batches = iter_batches(conn, kind, user_id, batch_size, **filters)
+    chunks = encode_csv(columns, batches) if fmt == "csv" else encode_jsonl(columns, batches)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a user's expense or transaction history.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = sub.add_parser("export", help="Write a user's history as CSV or JSON lines")
+    export_parser.add_argument("user", help="UserID to export")
+    export_parser.add_argument("kind", choices=tuple(KINDS))
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    export_parser.add_argument("--gzip", action="store_true", help="Compress the output")
+    export_parser.add_argument("--start", help="First date, YYYY-MM-DD")
+    export_parser.add_argument("--end", help="Last date, YYYY-MM-DD")
+    export_parser.add_argument("--out", help="Output file (default: stdout)")
+    export_parser.add_argument("--db", default=DATABASE, help="Ignored when EXPENSE_SHARDS is set")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(storage.from_env(args.db).path_for(args.user))
+    out = open(args.out, "wb") if args.out else sys.stdout.buffer
+    try:
+        for chunk in export(conn, args.kind, args.user, args.format, args.gzip,
+                            start=args.start, end=args.end):
+            out.write(chunk)
+    finally:
+        if args.out:
+            out.close()
+        conn.close()
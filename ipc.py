@@ -0,0 +1,85 @@
+# Authenticated, owner-only Unix sockets for the write broker and the shared dashboard cache
+import os
+import secrets
+import stat
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+# Generated authkeys are stored next to the socket, readable by its owner only
+KEY_SUFFIX = '.key'
+
+# What listener.accept() raises for a client that disconnects or fails the
+# handshake; servers log these and keep accepting
+ACCEPT_ERRORS = (OSError, EOFError, AuthenticationError)
+
+
+class AuthkeyError(OSError):
+    """No authkey is configured or readable for a local socket (an OSError, so callers treat it as unreachable)"""
+
+
+def key_path(address):
+    return address + KEY_SUFFIX
+
+
+def _write_private(path, data):
+    if os.path.exists(path):
+        os.remove(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+
+
+def server_authkey(address, env):
+    """The authkey from the env variable, else a fresh random one saved to key_path(address)"""
+    value = os.environ.get(env)
+    if value:
+        return value.encode()
+    authkey = secrets.token_hex(32).encode()
+    _write_private(key_path(address), authkey)
+    return authkey
+
+
+def client_authkey(address, env):
+    """The authkey from the env variable, else the one the running server saved"""
+    value = os.environ.get(env)
+    if value:
+        return value.encode()
+    try:
+        with open(key_path(address), 'rb') as f:
+            authkey = f.read().strip()
+    except OSError as e:
+        raise AuthkeyError(f"Set {env} or start the server first ({e})") from e
+    if not authkey:
+        raise AuthkeyError(f"Empty authkey file {key_path(address)}")
+    return authkey
+
+
+def listen(address, authkey):
+    """Listener on a Unix socket that only its owner can open and only authkey holders can use"""
+    if not authkey:
+        raise AuthkeyError("Refusing to listen without an authkey")
+    if os.path.exists(address):
+        os.remove(address)  # Stale socket from a previous run
+    umask = os.umask(0o177)  # Born 0600, no window where others could connect
+    try:
+        listener = Listener(address, family='AF_UNIX', authkey=authkey)
+    finally:
+        os.umask(umask)
+    os.chmod(address, stat.S_IRUSR | stat.S_IWUSR)
+    return listener
+
+
+def connect(address, authkey):
+    if not authkey:
+        raise AuthkeyError("Refusing to connect without an authkey")
+    try:
+        return Client(address, family='AF_UNIX', authkey=authkey)
+    except AuthenticationError as e:
+        raise AuthkeyError(f"Authkey rejected by {address}: {e}") from e
+
+
+def cleanup(address):
+    """Remove the socket and any generated key file"""
+    for path in (address, key_path(address)):
+        if os.path.exists(path):
+            os.remove(path)
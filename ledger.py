@@ -0,0 +1,85 @@
+# Running-balance ledger: reconcile the incremental User.Income against a full recompute
+import sqlite3
+import sys
+import argparse
+
+import cache
+import storage
+
+# Database configuration
+DATABASE = 'budget_management.db'
+
+# Balances are REAL, so allow for floating point drift when comparing
+TOLERANCE = 0.005
+
+# Full recompute of a user's balance from their history:
+# OriginalIncome - all expenses + received transactions - sent transactions
+EXPECTED_BALANCE_SQL = '''
+    SELECT u.UserID, u.Income,
+           u.OriginalIncome
+           - COALESCE((SELECT SUM(e.Amount) FROM Expenses e
+                       WHERE e.UserID = u.UserID), 0)
+           + COALESCE((SELECT SUM(t.Amount) FROM Transactions t
+                       WHERE t.UserID = u.UserID AND t.TransactionType = 'received'), 0)
+           - COALESCE((SELECT SUM(t.Amount) FROM Transactions t
+                       WHERE t.UserID = u.UserID AND t.TransactionType = 'sent'), 0)
+           AS Expected
+    FROM User u
+'''
+
+
+def expected_balances(conn, user_id=None):
+    """Return (UserID, Income, Expected) rows, for one user or for everyone"""
+    if user_id is None:
+        return conn.execute(EXPECTED_BALANCE_SQL).fetchall()
+    return conn.execute(EXPECTED_BALANCE_SQL + " WHERE u.UserID = ?", (user_id,)).fetchall()
+
+
+def reconcile(conn, user_id=None, repair=False):
+    """Compare the incremental balance with a full recompute and return mismatches.
+
+    Each mismatch is (UserID, Income, Expected). With repair=True the stored
+    Income is overwritten with the recomputed value.
+    """
+    mismatches = [
+        (row[0], row[1], row[2])
+        for row in expected_balances(conn, user_id)
+        if abs(row[1] - row[2]) > TOLERANCE
+    ]
+    if repair and mismatches:
+        conn.executemany(
+            "UPDATE User SET Income = ? WHERE UserID = ?",
+            [(expected, uid) for uid, _, expected in mismatches]
+        )
+        conn.commit()
+        for uid, _, _ in mismatches:
+            cache.invalidate(uid)
+    return mismatches
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check incremental balances against a full recompute.")
+    parser.add_argument("--db", default=DATABASE,
+                        help="Path to the SQLite database (ignored when EXPENSE_SHARDS is set)")
+    parser.add_argument("--user", help="Only reconcile this UserID")
+    parser.add_argument("--repair", action="store_true", help="Overwrite drifted balances")
+    args = parser.parse_args()
+
+    backend = storage.from_env(args.db)
+    mismatches = []
+    for path in ([backend.path_for(args.user)] if args.user else backend.paths()):
+        conn = sqlite3.connect(path)
+        mismatches += reconcile(conn, args.user, args.repair)
+        conn.close()
+
+    for uid, income, expected in mismatches:
+        print(f"[ERROR] {uid}: stored {income:.2f}, recomputed {expected:.2f}")
+
+    if mismatches and not args.repair:
+        print(f"[ERROR] {len(mismatches)} balance(s) out of sync.")
+        sys.exit(1)
+    elif mismatches:
+        print(f"[SUCCESS] Repaired {len(mismatches)} balance(s).")
+    else:
+        print("[SUCCESS] All balances match a full recompute.")
@@ -0,0 +1,163 @@
+# Login hot path helpers: in-memory brute-force throttling and a batched audit log
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# The audit row keeps UserID only for accounts that exist (the column has a
+# foreign key to User); attempts against unknown ids are stored with NULL
+INSERT_ATTEMPT_SQL = (
+    "INSERT INTO LoginAttempts (UserID, IPAddress, AttemptTime, Success) "
+    "VALUES ((SELECT UserID FROM User WHERE UserID = ?), ?, ?, ?)"
+)
+
+
+# === Rate Limiting ===
+class SlidingWindowLimiter:
+    """Allow at most `limit` attempts per key within any `window` seconds.
+
+    Keeps a deque of attempt timestamps per key in process memory, so a
+    rejected request costs no database work at all.
+    """
+
+    def __init__(self, limit, window, max_keys=100_000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._hits = {}
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    def _prune(self, hits, now):
+        cutoff = now - self.window
+        while hits and hits[0] <= cutoff:
+            hits.popleft()
+
+    def _sweep(self, now):
+        """Drop keys whose whole history has aged out of the window"""
+        for key in [k for k, hits in self._hits.items() if not hits or hits[-1] <= now - self.window]:
+            del self._hits[key]
+
+    def hit(self, key, now=None):
+        """Record an attempt; returns 0 if allowed, else seconds until the next one would be"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                if len(self._hits) >= self.max_keys:
+                    self._sweep(now)
+                hits = self._hits[key] = deque()
+            self._prune(hits, now)
+            if len(hits) >= self.limit:
+                self.rejected += 1
+                return hits[0] + self.window - now
+            hits.append(now)
+            self.allowed += 1
+            return 0.0
+
+    def reset(self, key):
+        """Forget a key's history (e.g. after a successful login)"""
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"limit": self.limit, "window": self.window, "keys": len(self._hits),
+                    "allowed": self.allowed, "rejected": self.rejected}
+
+
+# === Audit Log ===
+class AuditLogWriter:
+    """Queue login attempts and write them to LoginAttempts from a background thread.
+
+    Each flush inserts up to `batch_size` rows with one executemany and one
+    commit, so login latency no longer includes a disk sync. The thread and
+    its connection are created on first use.
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=0.5, max_queue=10_000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._metrics = {"queued": 0, "written": 0, "batches": 0, "dropped": 0, "errors": 0}
+
+    def record(self, user_id, ip_address, success):
+        """Enqueue one attempt without blocking; drops (and counts) it if the queue is full"""
+        self._ensure_started()
+        attempt_time = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            self._queue.put_nowait((user_id, ip_address, attempt_time, bool(success)))
+            self._metrics["queued"] += 1
+        except queue.Full:
+            self._metrics["dropped"] += 1
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="login-audit", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute("PRAGMA busy_timeout = 5000;")
+        try:
+            while True:
+                try:
+                    first = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                batch = [first]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                stop = None in batch
+                rows = [row for row in batch if row is not None]
+                if rows:
+                    self._write(conn, rows)
+                for _ in batch:
+                    self._queue.task_done()
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _write(self, conn, rows):
+        try:
+            with conn:
+                conn.executemany(INSERT_ATTEMPT_SQL, rows)
+            self._metrics["written"] += len(rows)
+            self._metrics["batches"] += 1
+        except sqlite3.Error as e:
+            self._metrics["errors"] += 1
+            logger.error(f"Audit log flush of {len(rows)} attempts failed: {e}")
+
+    def flush(self):
+        """Block until everything queued so far has been written"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """Write what is queued, then stop the thread (a later record() restarts it)"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
+
+    def stats(self):
+        return {**self._metrics, "pending": self._queue.qsize()}
@@ -0,0 +1,134 @@
+# Persisted, versioned savings model: load lazily, retrain only when the training data changes
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+import training
+
+# Where the trained model is saved
+MODEL_PATH = 'savings_model.json'
+
+
+def data_stat(path):
+    """Cheap change detector for the training file: [size, mtime in ns]"""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def data_fingerprint(path, block_size=1024 * 1024):
+    """SHA-256 of the training file contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ModelStore:
+    """Keeps theta, column order, data fingerprint and metrics on disk.
+
+    The model is read on the first call to get(), and every get() stats the
+    training CSV. The file is only re-hashed when its size or mtime changed,
+    and the model is only retrained when the hash differs from the one it was
+    trained on.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, data_path=training.DATA_PATH):
+        self.model_path = model_path
+        self.data_path = data_path
+        self._model = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return (theta, expense_cols), loading the model on first use and again
+        (retraining if needed) whenever the training file changed"""
+        model = self._model
+        if model is None or not self._is_current(model):
+            with self._lock:
+                if self._model is None or not self._is_current(self._model):
+                    self._model = self._load_or_train()
+                model = self._model
+        return np.array(model["theta"]).reshape(-1, 1), list(model["columns"])
+
+    def _is_current(self, model):
+        try:
+            return model.get("data_stat") == data_stat(self.data_path)
+        except FileNotFoundError:
+            return True  # Keep serving the last model if the training file is gone
+
+    def info(self):
+        """Version, fingerprint and metrics of the current model, without theta"""
+        self.get()
+        return {k: v for k, v in self._model.items() if k != "theta"}
+
+    def retrain(self):
+        """Force a retrain from the current training file"""
+        with self._lock:
+            saved = self._read()
+            self._model = self._train(saved)
+        return self.get()
+
+    def _load_or_train(self):
+        saved = self._read()
+
+        try:
+            stat = data_stat(self.data_path)
+        except FileNotFoundError:
+            if saved is not None:
+                return saved  # Keep serving the last model if the training file is gone
+            raise
+
+        if saved is not None and saved.get("data_stat") == stat:
+            return saved
+
+        fingerprint = data_fingerprint(self.data_path)
+        if saved is not None and saved.get("fingerprint") == fingerprint:
+            # File was touched but its contents are unchanged
+            saved["data_stat"] = stat
+            self._write(saved)
+            return saved
+
+        return self._train(saved, fingerprint)
+
+    def _train(self, previous, fingerprint=None):
+        stat = data_stat(self.data_path)
+        fingerprint = fingerprint or data_fingerprint(self.data_path)
+        theta, expense_cols, metrics = training.train_and_evaluate(self.data_path)
+        model = {
+            "version": (previous or {}).get("version", 0) + 1,
+            "trained_at": datetime.now().isoformat(timespec='seconds'),
+            "fingerprint": fingerprint,
+            "data_stat": stat,
+            "columns": list(expense_cols),
+            "theta": [float(v) for v in np.ravel(theta)],
+            "metrics": metrics,
+        }
+        self._write(model)
+        return model
+
+    def _read(self):
+        try:
+            with open(self.model_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write(self, model):
+        # Write to a temporary file first so a crash never leaves a half-written model
+        tmp_path = f"{self.model_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(model, f, indent=2)
+        os.replace(tmp_path, self.model_path)
+
+
+# Process-wide store used by the CLI dashboard
+default_store = ModelStore()
+
+
+def load_model():
+    """Return (theta, expense_cols) from the default store"""
+    return default_store.get()
@@ -0,0 +1,124 @@
+# Per-process SQLite connection pool with connections configured once at creation
+import sqlite3
+import threading
+import time
+import queue
+from contextlib import contextmanager
+
+from repository import STATEMENT_CACHE_SIZE
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within the checkout timeout"""
+
+
+class ConnectionPool:
+    """A fixed-size pool of WAL-mode SQLite connections shared by request threads"""
+
+    def __init__(self, path, size=8, timeout=5.0, busy_timeout_ms=5000,
+                 mmap_size=256 * 1024 * 1024, cache_size_kib=16 * 1024,
+                 cached_statements=STATEMENT_CACHE_SIZE):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.cached_statements = cached_statements
+
+        self._idle = queue.LifoQueue()  # LIFO keeps the warmest connections in use
+        self._lock = threading.Lock()
+        self._created = 0
+        self._metrics = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+        }
+
+    def _connect(self):
+        """Open a connection and apply every per-connection setting exactly once"""
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)};")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)};")
+        conn.execute(f"PRAGMA cache_size = {-int(self.cache_size_kib)};")
+        conn.execute("PRAGMA foreign_keys = ON;")
+        return conn
+
+    def acquire(self):
+        """Check out a connection, opening a new one while under the size limit"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._metrics["timeouts"] += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                finally:
+                    waited = time.perf_counter() - started
+                    with self._lock:
+                        self._metrics["waits"] += 1
+                        self._metrics["wait_seconds"] += waited
+
+        with self._lock:
+            self._metrics["checkouts"] += 1
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any unfinished transaction"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and always returns it"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        """Snapshot of pool size and checkout/wait counters"""
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["size"] = self.size
+            stats["open"] = self._created
+        stats["idle"] = self._idle.qsize()
+        stats["in_use"] = stats["open"] - stats["idle"]
+        stats["wait_seconds"] = round(stats["wait_seconds"], 6)
+        return stats
+
+    def close_all(self):
+        """Close every idle connection; connections still checked out are left open"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
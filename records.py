@@ -1,27 +1,35 @@
 # Importing required modules
+import sqlite3
+import budgets
+import cache
 import database as db
 from datetime import datetime, date # For handling and formatting dates
 
+# view_expenses(): a user's expenses with per-category totals
+GROUPED_EXPENSES = dict(table_name="Expenses", columns="ExpenseID, Amount, Category, Date",
+                        group_column="Category", value_column="Amount",
+                        where_clause="UserID = ?", order_by="Date, ExpenseID")
+
 # Class to manage user expenses
 class ExpenseManager:
     def __init__(self, user_id):
         self.user_id = user_id  # Store logged-in user's ID
-
-    # Update user's income after any change in expenses
-    def update_income_after_expense_change(self):
-        # Get original income
-        user = db.get_records("User", "UserID = ?", (self.user_id,))
-        if not user:
+        self._repo = None
+
+    # Resolved on every use, since moving the user to another shard changes
+    # their file; an open unit of work keeps its repository until it ends
+    @property
+    def repo(self):
+        if self._repo is None or not self._repo.in_unit_of_work:
+            self._repo = db.get_repository(self.user_id)
+        return self._repo
+
+    # Apply only this change's difference to the user's running income
+    def apply_expense_delta(self, delta):
+        # delta is the change in total spending: positive for new or larger
+        # expenses, negative for deleted or reduced ones
+        if not self.repo.adjust_income(self.user_id, -delta):
             print("[ERROR] User not found.")
-            return
-
-        original_income = user[0][4]  # OriginalIncome column
-        expenses = db.get_records("Expenses", "UserID = ?", (self.user_id,))
-        total_expense = sum(exp[2] for exp in expenses)
-        updated_income = original_income - total_expense
-
-        # Update the current income after expenses are recalculated
-        db.update_record("User", {"Income": updated_income}, "UserID = ?", (self.user_id,))
 
     # Add a new expense entry
     def add_expense(self):
@@ -47,56 +55,50 @@ class ExpenseManager:
                 print("[ERROR] Invalid date format.")
                 return
 
-        # Fetch user record to get current income for the snapshot
-        user = db.get_records("User", "UserID = ?", (self.user_id,))
-        if not user:
-            print("[ERROR] User not found.")
+        # Snapshot, insert and balance change commit together in one transaction
+        try:
+            with self.repo.unit_of_work():
+                # Fetch the user's current income for the snapshot
+                income = self.repo.get_income(self.user_id)
+                if income is None:
+                    print("[ERROR] User not found.")
+                    return
+
+                # Insert into database (Income is needed to satisfy NOT NULL) and update income
+                cursor = budgets.latest_alert_id(self.repo.conn, self.user_id)
+                self.repo.add_expense(self.user_id, amount, category, expense_date, income)
+                self.apply_expense_delta(amount)
+        except sqlite3.Error as e:
+            print(f"[ERROR] Expense not saved: {e}")
             return
-
-        income = user[0][3]  # Current Income
-
-        # Construct expense record
-        expense_data = {
-            "UserID": self.user_id,
-            "Amount": amount,
-            "Category": category,
-            "Date": expense_date,
-            "Income": income  #Needed to satisfy NOT NULL
-        }
-
-        # Insert into database and update income
-        db.insert_record("Expenses", expense_data)
-        self.update_income_after_expense_change()
+        cache.invalidate(self.user_id)
         print("[SUCCESS] Expense added!")
 
+        # The insert triggers raise any budget alerts it caused
+        for alert in budgets.alerts(self.repo.conn, self.user_id, cursor):
+            print(f"[ALERT] {alert['category']} has reached {alert['threshold']}% of its "
+                  f"{alert['limit']:.2f} budget for {alert['month']} ({alert['spent']:.2f} spent).")
+
     # View all expenses grouped by category
     def view_expenses(self):
         print("\n=== Your Expenses Grouped by Category ===")
-        expenses = db.get_records("Expenses", "UserID = ?", (self.user_id,))
+        # Per-category totals are computed by SQLite alongside the rows
+        expenses = db.records_with_group_totals(**GROUPED_EXPENSES, where_values=(self.user_id,),
+                                                user_id=self.user_id)
         if not expenses:
             print("No expenses found.")
             return
         # Show updated income
-        user = db.get_records("User", "UserID = ?", (self.user_id,))
-        current_income = user[0][3] if user else 0
+        current_income = self.repo.get_income(self.user_id) or 0
         print(f"\n[INFO] Your current income after expenses: ₹{current_income:.2f}\n")
 
-        # Group expenses by category
-        categories = {}
-        for exp in expenses:
-            category = exp[3]
-            if category not in categories:
-                categories[category] = []
-            categories[category].append(exp)
-
-        # Display expenses per category
-        for category, exp_list in categories.items():
-            print(f"Category: {category}")
-            total = 0
-            for exp in exp_list:
-                print(f"  ID: {exp[0]} | Amount: {exp[2]}rs | Date: {exp[4]}")
-                total += exp[2]
-            print(f"  Total in {category}: {total:.2f}rs\n")
+        # Display expenses per category; rows arrive grouped by category
+        for i, exp in enumerate(expenses):
+            if i == 0 or exp["Category"] != expenses[i - 1]["Category"]:
+                print(f"Category: {exp['Category']}")
+            print(f"  ID: {exp['ExpenseID']} | Amount: {exp['Amount']}rs | Date: {exp['Date']}")
+            if i == len(expenses) - 1 or exp["Category"] != expenses[i + 1]["Category"]:
+                print(f"  Total in {exp['Category']}: {exp['GroupTotal']:.2f}rs\n")
 
     # Edit an existing expense
     def edit_expense(self):
@@ -104,7 +106,7 @@ class ExpenseManager:
         expense_id = input("Enter ID to edit: ").strip()
 
         # Ensure the expense exists and belongs to the user
-        exp = db.get_records("Expenses", "ExpenseID = ? AND UserID = ?", (expense_id, self.user_id))
+        exp = self.repo.get_expense(self.user_id, expense_id, ("Amount",))
         if not exp:
             print("[ERROR] Expense not found or not yours.")
             return
@@ -134,8 +136,20 @@ class ExpenseManager:
 
         # If any valid updates provided, update the record
         if updates:
-            db.update_record("Expenses", updates, "ExpenseID = ?", (expense_id,))
-            self.update_income_after_expense_change()
+            try:
+                with self.repo.unit_of_work():
+                    # Re-read under the write lock: the amount may have changed while we prompted
+                    exp = self.repo.get_expense(self.user_id, expense_id, ("Amount",))
+                    if not exp:
+                        print("[ERROR] Expense not found or not yours.")
+                        return
+                    self.repo.update_expense(expense_id, **updates)
+                    if "Amount" in updates:
+                        self.apply_expense_delta(updates["Amount"] - exp.Amount)
+            except sqlite3.Error as e:
+                print(f"[ERROR] Expense not updated: {e}")
+                return
+            cache.invalidate(self.user_id)
             print("[SUCCESS] Expense updated.")
         else:
             print("[INFO] No changes made.")
@@ -146,7 +160,7 @@ class ExpenseManager:
         expense_id = input("Enter ID to delete: ").strip()
 
         # Check that the expense belongs to the user
-        exp = db.get_records("Expenses", "ExpenseID = ? AND UserID = ?", (expense_id, self.user_id))
+        exp = self.repo.get_expense(self.user_id, expense_id, ("Amount",))
         if not exp:
             print("[ERROR] Expense not found or not yours.")
             return
@@ -154,8 +168,18 @@ class ExpenseManager:
         # Confirm deletion
         confirm = input("Are you sure you want to delete this expense? (y/n): ").strip().lower()
         if confirm == 'y':
-            db.delete_record("Expenses", "ExpenseID = ?", (expense_id,))
-            self.update_income_after_expense_change()
+            try:
+                with self.repo.unit_of_work():
+                    exp = self.repo.get_expense(self.user_id, expense_id, ("Amount",))
+                    if not exp:
+                        print("[ERROR] Expense not found or not yours.")
+                        return
+                    self.repo.delete_expense(expense_id)
+                    self.apply_expense_delta(-exp.Amount)
+            except sqlite3.Error as e:
+                print(f"[ERROR] Expense not deleted: {e}")
+                return
+            cache.invalidate(self.user_id)
             print("[SUCCESS] Expense deleted.")
         else:
             print("[INFO] Deletion canceled.")
@@ -0,0 +1,273 @@
+# Typed data-access layer: per-entity queries, column projection and __slots__ rows
+import sqlite3
+from contextlib import contextmanager
+from functools import lru_cache
+
+# Database configuration
+DATABASE = 'budget_management.db'
+
+# Prepared statements kept per connection. Every query below is built from a
+# fixed template, so the set of distinct SQL strings is small and stays cached.
+STATEMENT_CACHE_SIZE = 256
+
+
+# === Row Objects ===
+class Record:
+    """Base for lightweight rows: attribute access by column name, no per-row dict"""
+    __slots__ = ()
+    table = None
+    key = None
+    columns = ()
+
+    @classmethod
+    def projection(cls, columns=None):
+        """Validated column tuple; only known column names ever reach the SQL text"""
+        if columns is None:
+            return cls.columns
+        columns = tuple(columns)
+        unknown = [c for c in columns if c not in cls.columns]
+        if unknown:
+            raise ValueError(f"Unknown {cls.table} column(s): {', '.join(unknown)}")
+        return columns
+
+    @classmethod
+    def build(cls, columns, values):
+        row = cls.__new__(cls)
+        for name, value in zip(columns, values):
+            setattr(row, name, value)
+        return row
+
+    def as_dict(self):
+        """Dict of the columns that were loaded (for JSON and templates)"""
+        return {name: getattr(self, name) for name in self.columns if hasattr(self, name)}
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={v!r}" for k, v in self.as_dict().items())
+        return f"{type(self).__name__}({fields})"
+
+
+class User(Record):
+    __slots__ = ("UserID", "Email", "Password", "Income", "OriginalIncome")
+    table = "User"
+    key = "UserID"
+    columns = __slots__
+
+
+class Expense(Record):
+    __slots__ = ("ExpenseID", "UserID", "Amount", "Category", "Date", "Income")
+    table = "Expenses"
+    key = "ExpenseID"
+    columns = __slots__
+
+
+class Transaction(Record):
+    __slots__ = ("TransactionID", "UserID", "TransactionType", "Amount", "Date")
+    table = "Transactions"
+    key = "TransactionID"
+    columns = __slots__
+
+
+class Budget(Record):
+    __slots__ = ("UserID", "Category", "MonthlyLimit", "StartMonth")
+    table = "BudgetLimits"
+    key = None  # (UserID, Category)
+    columns = __slots__
+
+
+# === Connections ===
+def connect(path=DATABASE, **kwargs):
+    """Open a connection with the repository's statement cache size and foreign keys on"""
+    conn = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE, **kwargs)
+    conn.execute("PRAGMA foreign_keys = ON;")
+    return conn
+
+
+# === Repository ===
+@lru_cache(maxsize=None)
+def select_sql(entity, columns, where, suffix=""):
+    """SQL text for one entity, projection and WHERE clause, built once per combination"""
+    return f"SELECT {', '.join(columns)} FROM {entity.table} WHERE {where}{suffix}"
+
+
+@lru_cache(maxsize=None)
+def update_sql(entity, columns):
+    """SQL text updating the given columns of one entity by its key"""
+    assignments = ", ".join(f"{name} = ?" for name in columns)
+    return f"UPDATE {entity.table} SET {assignments} WHERE {entity.key} = ?"
+
+
+# WHERE clauses and statements the methods below issue (diagnostics.py checks their plans)
+USER_WHERE = "UserID = ?"
+DATE_RANGE_WHERE = "UserID = ? AND Date BETWEEN ? AND ?"
+OWNED_EXPENSE_WHERE = "ExpenseID = ? AND UserID = ?"
+USER_EXISTS_SQL = "SELECT 1 FROM User WHERE UserID = ?"
+USER_OR_EMAIL_EXISTS_SQL = "SELECT 1 FROM User WHERE UserID = ? OR Email = ?"
+INCOME_SQL = "SELECT Income FROM User WHERE UserID = ?"
+SET_INCOME_SQL = "UPDATE User SET OriginalIncome = OriginalIncome + (? - Income), Income = ? WHERE UserID = ?"
+ADJUST_INCOME_SQL = "UPDATE User SET Income = Income + ? WHERE UserID = ?"
+DELETE_EXPENSE_SQL = "DELETE FROM Expenses WHERE ExpenseID = ?"
+SET_BUDGET_SQL = ("INSERT INTO BudgetLimits (UserID, Category, MonthlyLimit, StartMonth) VALUES (?, ?, ?, ?) "
+                  "ON CONFLICT (UserID, Category) DO UPDATE SET MonthlyLimit = excluded.MonthlyLimit, "
+                  "UpdatedAt = CURRENT_TIMESTAMP")
+DELETE_BUDGET_SQL = "DELETE FROM BudgetLimits WHERE UserID = ? AND Category = ?"
+BUDGET_ORDER = " ORDER BY Category"
+
+
+class Repository:
+    """Per-entity queries over one connection.
+
+    Reads return User / Expense / Transaction objects (or None); writes
+    commit on success and roll back on error, like database.py's helpers,
+    unless they run inside unit_of_work(), which commits them together.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._unit_depth = 0
+
+    @property
+    def in_unit_of_work(self):
+        return self._unit_depth > 0
+
+    @contextmanager
+    def unit_of_work(self):
+        """Run every write in the block in one BEGIN IMMEDIATE transaction.
+
+        Either all of them commit or none do, so e.g. a balance change is never
+        committed without its matching expense row. Nested blocks join the
+        outermost one.
+        """
+        if self._unit_depth:
+            self._unit_depth += 1
+            try:
+                yield self
+            finally:
+                self._unit_depth -= 1
+            return
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        self._unit_depth = 1
+        try:
+            yield self
+        except BaseException:
+            self.conn.rollback()
+            raise
+        else:
+            self.conn.commit()
+        finally:
+            self._unit_depth = 0
+
+    @contextmanager
+    def _write(self):
+        """Commit a single write on its own, or leave it to the enclosing unit of work"""
+        if self._unit_depth:
+            yield
+        else:
+            with self.conn:
+                yield
+
+    def _one(self, entity, columns, where, params):
+        columns = entity.projection(columns)
+        row = self.conn.execute(select_sql(entity, columns, where), params).fetchone()
+        return None if row is None else entity.build(columns, row)
+
+    def _many(self, entity, columns, where, params, suffix=""):
+        columns = entity.projection(columns)
+        cursor = self.conn.execute(select_sql(entity, columns, where, suffix), params)
+        return [entity.build(columns, row) for row in cursor]
+
+    def _insert(self, entity, values):
+        columns = tuple(values)
+        entity.projection(columns)
+        sql = f"INSERT INTO {entity.table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        with self._write():
+            return self.conn.execute(sql, tuple(values.values())).lastrowid
+
+    def _update(self, entity, key_value, values):
+        if not values:
+            return False
+        entity.projection(tuple(values))
+        sql = update_sql(entity, tuple(values))
+        with self._write():
+            return self.conn.execute(sql, tuple(values.values()) + (key_value,)).rowcount > 0
+
+    # --- Users ---
+    def get_user(self, user_id, columns=None):
+        return self._one(User, columns, USER_WHERE, (user_id,))
+
+    def user_exists(self, user_id, email=None):
+        """True if the UserID (or, when given, the email) is already registered"""
+        if email is None:
+            row = self.conn.execute(USER_EXISTS_SQL, (user_id,)).fetchone()
+        else:
+            row = self.conn.execute(USER_OR_EMAIL_EXISTS_SQL, (user_id, email)).fetchone()
+        return row is not None
+
+    def get_income(self, user_id):
+        """Current running Income, or None for an unknown user"""
+        row = self.conn.execute(INCOME_SQL, (user_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def create_user(self, user_id, email, password_hash, income):
+        self._insert(User, {"UserID": user_id, "Email": email, "Password": password_hash,
+                            "Income": income, "OriginalIncome": income})
+
+    def update_user(self, user_id, **fields):
+        """Update any of UserID, Email or Password; returns True if the user existed"""
+        return self._update(User, user_id, fields)
+
+    def set_income(self, user_id, income):
+        """Set Income, rebasing OriginalIncome by the same difference so the balance stays reconcilable"""
+        with self._write():
+            return self.conn.execute(SET_INCOME_SQL, (income, income, user_id)).rowcount > 0
+
+    def adjust_income(self, user_id, delta):
+        """Apply a balance change without re-reading the user's history"""
+        with self._write():
+            return self.conn.execute(ADJUST_INCOME_SQL, (delta, user_id)).rowcount > 0
+
+    # --- Expenses ---
+    def get_expense(self, user_id, expense_id, columns=None):
+        """One expense, only if it belongs to user_id"""
+        return self._one(Expense, columns, OWNED_EXPENSE_WHERE, (expense_id, user_id))
+
+    def list_expenses(self, user_id, columns=None):
+        return self._many(Expense, columns, USER_WHERE, (user_id,))
+
+    def expenses_between(self, user_id, start, end, columns=None):
+        return self._many(Expense, columns, DATE_RANGE_WHERE, (user_id, start, end))
+
+    def add_expense(self, user_id, amount, category, expense_date, income):
+        return self._insert(Expense, {"UserID": user_id, "Amount": amount, "Category": category,
+                                      "Date": expense_date, "Income": income})
+
+    def update_expense(self, expense_id, **fields):
+        return self._update(Expense, expense_id, fields)
+
+    def delete_expense(self, expense_id):
+        with self._write():
+            return self.conn.execute(DELETE_EXPENSE_SQL, (expense_id,)).rowcount > 0
+
+    # --- Transactions ---
+    def list_transactions(self, user_id, columns=None):
+        return self._many(Transaction, columns, USER_WHERE, (user_id,))
+
+    def transactions_between(self, user_id, start, end, columns=None):
+        return self._many(Transaction, columns, DATE_RANGE_WHERE, (user_id, start, end))
+
+    def add_transaction(self, user_id, transaction_type, amount, transaction_date):
+        return self._insert(Transaction, {"UserID": user_id, "TransactionType": transaction_type,
+                                          "Amount": amount, "Date": transaction_date})
+
+    # --- Budgets ---
+    def list_budgets(self, user_id, columns=None):
+        return self._many(Budget, columns, USER_WHERE, (user_id,), BUDGET_ORDER)
+
+    def set_budget(self, user_id, category, monthly_limit, start_month):
+        """Create a limit starting at start_month, or change an existing one's amount"""
+        with self._write():
+            self.conn.execute(SET_BUDGET_SQL, (user_id, category, monthly_limit, start_month))
+
+    def delete_budget(self, user_id, category):
+        with self._write():
+            return self.conn.execute(DELETE_BUDGET_SQL, (user_id, category)).rowcount > 0
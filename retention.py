@@ -0,0 +1,271 @@
+# LoginAttempts retention: hourly rollups, batched pruning and incremental vacuum
+import argparse
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+import storage
+
+# Database configuration
+DATABASE = 'budget_management.db'
+
+# Raw attempts older than this many days are rolled up and deleted
+DEFAULT_RETENTION_DAYS = 30
+
+# Raw rows rolled up and deleted per transaction; keeps each write lock short
+DEFAULT_BATCH_SIZE = 5000
+
+# One row per (hour, IP, user). UserID is '' for attempts against unknown ids
+# so it can take part in the primary key.
+HOURLY_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS LoginAttemptsHourly (
+        Hour TEXT NOT NULL,
+        IPAddress TEXT NOT NULL,
+        UserID TEXT NOT NULL DEFAULT '',
+        Successes INTEGER NOT NULL DEFAULT 0,
+        Failures INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (Hour, IPAddress, UserID)
+    ) WITHOUT ROWID;
+'''
+
+HOURLY_INDEX_SQL = [
+    "CREATE INDEX IF NOT EXISTS idx_login_hourly_ip ON LoginAttemptsHourly (IPAddress, Hour);",
+    "CREATE INDEX IF NOT EXISTS idx_login_hourly_user ON LoginAttemptsHourly (UserID, Hour);",
+]
+
+# Lets compaction find expired rows, and reports read recent raw rows, by time
+ATTEMPT_TIME_INDEX_SQL = '''
+    CREATE INDEX IF NOT EXISTS idx_login_attempts_time
+    ON LoginAttempts (AttemptTime);
+'''
+
+EXPIRED_BATCH_SQL = '''
+    SELECT AttemptID FROM LoginAttempts
+    WHERE AttemptTime < ? ORDER BY AttemptTime LIMIT ?
+'''
+
+ROLL_UP_BATCH_SQL = '''
+    INSERT INTO LoginAttemptsHourly (Hour, IPAddress, UserID, Successes, Failures)
+    SELECT strftime('%Y-%m-%d %H:00', AttemptTime), IPAddress, COALESCE(UserID, ''),
+           SUM(Success <> 0), SUM(Success = 0)
+    FROM LoginAttempts
+    WHERE AttemptID IN (SELECT AttemptID FROM temp.RetentionBatch)
+    GROUP BY 1, 2, 3
+    ON CONFLICT (Hour, IPAddress, UserID)
+    DO UPDATE SET Successes = Successes + excluded.Successes, Failures = Failures + excluded.Failures
+'''
+
+# Rolled-up hours plus raw attempts that have not been compacted yet, so
+# reports see one continuous history regardless of when compaction last ran
+HOURLY_SQL = '''
+    WITH hourly AS (
+        SELECT Hour, IPAddress, UserID, Successes, Failures
+        FROM LoginAttemptsHourly WHERE Hour >= ? AND Hour < ?
+        UNION ALL
+        SELECT strftime('%Y-%m-%d %H:00', AttemptTime), IPAddress, COALESCE(UserID, ''),
+               SUM(Success <> 0), SUM(Success = 0)
+        FROM LoginAttempts WHERE AttemptTime >= ? AND AttemptTime < ?
+        GROUP BY 1, 2, 3
+    )
+'''
+
+
+def init_schema(conn):
+    """Create the hourly rollup table and its indexes (LoginAttempts must exist)"""
+    conn.execute(HOURLY_TABLE_SQL)
+    for sql in HOURLY_INDEX_SQL:
+        conn.execute(sql)
+    conn.execute(ATTEMPT_TIME_INDEX_SQL)
+    conn.commit()
+
+
+def _timestamp(value):
+    """'YYYY-MM-DD HH:MM:SS' (UTC, the format CURRENT_TIMESTAMP uses) from a datetime or string"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+# === Vacuum ===
+def enable_incremental_vacuum(conn):
+    """Switch the database to auto_vacuum=INCREMENTAL; a one-time full VACUUM if it was off"""
+    if conn.execute("PRAGMA auto_vacuum;").fetchone()[0] == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+    conn.execute("VACUUM;")
+    return True
+
+
+def incremental_vacuum(conn, pages=None):
+    """Return free pages to the OS; pages=None frees them all. Returns pages freed."""
+    if conn.execute("PRAGMA auto_vacuum;").fetchone()[0] != 2:
+        return 0
+    before = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages)});" if pages else "PRAGMA incremental_vacuum;")
+    return before - conn.execute("PRAGMA freelist_count;").fetchone()[0]
+
+
+# === Compaction ===
+def compact(conn, days=DEFAULT_RETENTION_DAYS, batch_size=DEFAULT_BATCH_SIZE, pause=0.0, now=None):
+    """Roll raw attempts older than `days` into hourly counts and delete them.
+
+    Each batch of at most batch_size rows is rolled up and deleted in its own
+    short transaction, so logins and the audit writer are never blocked for
+    long. Returns a summary dict.
+    """
+    now = now or datetime.now(timezone.utc)
+    cutoff = _timestamp(now - timedelta(days=days))
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS RetentionBatch (AttemptID INTEGER PRIMARY KEY)")
+
+    removed = batches = 0
+    started = time.perf_counter()
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM temp.RetentionBatch")
+            conn.execute(f"INSERT INTO temp.RetentionBatch {EXPIRED_BATCH_SQL}", (cutoff, batch_size))
+            count = conn.execute("SELECT COUNT(*) FROM temp.RetentionBatch").fetchone()[0]
+            if count:
+                conn.execute(ROLL_UP_BATCH_SQL)
+                conn.execute("DELETE FROM LoginAttempts "
+                             "WHERE AttemptID IN (SELECT AttemptID FROM temp.RetentionBatch)")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if not count:
+            break
+        removed += count
+        batches += 1
+        if pause:
+            time.sleep(pause)  # Give other writers a turn between batches
+
+    return {
+        "cutoff": cutoff,
+        "rows_rolled_up": removed,
+        "batches": batches,
+        "pages_freed": incremental_vacuum(conn),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+# === Security Reporting ===
+def _window(since, until):
+    since = _timestamp(since)
+    if len(since) == 10:  # A bare date means midnight
+        since += ' 00:00:00'
+    until = _timestamp(until) if until else '9999-12-31 23:59:59'
+    return (since[:13] + ':00', until, since, until)
+
+
+def top_failing_ips(conn, since, until=None, limit=20):
+    """[(IPAddress, Failures, Successes, DistinctUsers)] with the most failures in the window (limit=None: all).
+
+    DistinctUsers counts known users only; attempts on unknown UserIDs ('')
+    are not a user.
+    """
+    return conn.execute(HOURLY_SQL + '''
+        SELECT IPAddress, SUM(Failures) AS Failures, SUM(Successes) AS Successes,
+               COUNT(DISTINCT NULLIF(UserID, '')) AS Users
+        FROM hourly GROUP BY IPAddress
+        ORDER BY Failures DESC LIMIT ?
+    ''', _window(since, until) + (-1 if limit is None else limit,)).fetchall()
+
+
+def top_targeted_users(conn, since, until=None, limit=20):
+    """[(UserID, Failures, Successes, DistinctIPs)] for known users with the most failures"""
+    return conn.execute(HOURLY_SQL + '''
+        SELECT UserID, SUM(Failures) AS Failures, SUM(Successes) AS Successes,
+               COUNT(DISTINCT IPAddress) AS IPs
+        FROM hourly WHERE UserID <> '' GROUP BY UserID
+        ORDER BY Failures DESC LIMIT ?
+    ''', _window(since, until) + (limit,)).fetchall()
+
+
+def ip_history(conn, ip_address, since, until=None):
+    """[(Hour, Successes, Failures)] for one IP address"""
+    return conn.execute(HOURLY_SQL + '''
+        SELECT Hour, SUM(Successes), SUM(Failures)
+        FROM hourly WHERE IPAddress = ? GROUP BY Hour ORDER BY Hour
+    ''', _window(since, until) + (ip_address,)).fetchall()
+
+
+def user_history(conn, user_id, since, until=None):
+    """[(Hour, Successes, Failures)] for one UserID"""
+    return conn.execute(HOURLY_SQL + '''
+        SELECT Hour, SUM(Successes), SUM(Failures)
+        FROM hourly WHERE UserID = ? GROUP BY Hour ORDER BY Hour
+    ''', _window(since, until) + (user_id,)).fetchall()
+
+
+def combine(results):
+    """Sum report rows from several shards that share their first column.
+
+    Failures and successes add up. DistinctUsers does too, because it leaves
+    out unknown UserIDs (''), which any shard can hold, and every known user's
+    attempts live on that user's one shard.
+    """
+    totals = {}
+    for rows in results:
+        for key, *counts in rows:
+            totals[key] = [a + b for a, b in zip(totals[key], counts)] if key in totals else list(counts)
+    return [(key, *counts) for key, counts in totals.items()]
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LoginAttempts retention and security reports.")
+    parser.add_argument("--db", default=DATABASE,
+                        help="Path to the SQLite database (ignored when EXPENSE_SHARDS is set)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    compact_parser = sub.add_parser("compact", help="Roll up and delete expired raw attempts")
+    compact_parser.add_argument("--days", type=int, default=DEFAULT_RETENTION_DAYS)
+    compact_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    compact_parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    compact_parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                                help="One-time VACUUM to turn on auto_vacuum=INCREMENTAL")
+
+    report_parser = sub.add_parser("report", help="Failed-login report from the hourly rollups")
+    report_parser.add_argument("--since", required=True, help="UTC start, 'YYYY-MM-DD[ HH:MM:SS]'")
+    report_parser.add_argument("--until", help="UTC end (default: now)")
+    report_parser.add_argument("--ip", help="Hourly history for one IP address")
+    report_parser.add_argument("--user", help="Hourly history for one UserID")
+    report_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    # Attempts live on their user's shard: one shard for --user, every shard otherwise
+    backend = storage.from_env(args.db)
+    user = getattr(args, "user", None)
+    connections = []
+    for path in ([backend.path_for(user)] if user else backend.paths()):
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout = 5000;")
+        init_schema(conn)
+        connections.append(conn)
+
+    if args.command == "compact":
+        for conn in connections:
+            if args.enable_incremental_vacuum and enable_incremental_vacuum(conn):
+                print("[INFO] auto_vacuum set to INCREMENTAL.")
+            summary = compact(conn, args.days, args.batch_size, args.pause)
+            print(f"[SUCCESS] Rolled up {summary['rows_rolled_up']} attempts older than {summary['cutoff']} "
+                  f"in {summary['batches']} batches; freed {summary['pages_freed']} pages.")
+    elif args.ip:
+        hours = combine(ip_history(conn, args.ip, args.since, args.until) for conn in connections)
+        for hour, ok, failed in sorted(hours):
+            print(f"{hour}  ok={ok:<6} failed={failed}")
+    elif args.user:
+        for hour, ok, failed in user_history(connections[0], args.user, args.since, args.until):
+            print(f"{hour}  ok={ok:<6} failed={failed}")
+    else:
+        print("Top failing IPs:")
+        ips = combine(top_failing_ips(conn, args.since, args.until, None) for conn in connections)
+        for ip, failed, ok, users in sorted(ips, key=lambda row: -row[1])[:args.limit]:
+            print(f"  {ip:<40} failed={failed:<6} ok={ok:<6} users={users}")
+        print("Most targeted users:")
+        targeted = [row for conn in connections for row in top_targeted_users(conn, args.since, args.until, args.limit)]
+        for uid, failed, ok, ips in sorted(targeted, key=lambda row: -row[1])[:args.limit]:
+            print(f"  {uid:<40} failed={failed:<6} ok={ok:<6} ips={ips}")
+    for conn in connections:
+        conn.close()
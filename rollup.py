@@ -0,0 +1,173 @@
+# Materialized per-user monthly totals, maintained by triggers on every write
+import sqlite3
+import argparse
+
+# Database configuration
+DATABASE = 'budget_management.db'
+
+# One row per (user, month, kind, bucket). Kind is 'expense' (Bucket = Category)
+# or 'transaction' (Bucket = TransactionType); Month is 'YYYY-MM'.
+ROLLUP_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS MonthlyRollup (
+        UserID TEXT NOT NULL,
+        Month TEXT NOT NULL,
+        Kind TEXT NOT NULL,
+        Bucket TEXT NOT NULL,
+        Total REAL NOT NULL DEFAULT 0,
+        Count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (UserID, Month, Kind, Bucket)
+    ) WITHOUT ROWID;
+'''
+
+# Covering index for month-wide reads across all users (batch scoring, reports)
+ROLLUP_MONTH_INDEX_SQL = '''
+    CREATE INDEX IF NOT EXISTS idx_rollup_month
+    ON MonthlyRollup (Month, Kind, UserID, Bucket, Total);
+'''
+
+
+def _add_sql(row, kind, bucket, amount):
+    """Upsert that adds one row's amount to its rollup bucket"""
+    return f'''
+        INSERT INTO MonthlyRollup (UserID, Month, Kind, Bucket, Total, Count)
+        VALUES ({row}.UserID, substr({row}.Date, 1, 7), '{kind}', {row}.{bucket}, {row}.{amount}, 1)
+        ON CONFLICT (UserID, Month, Kind, Bucket)
+        DO UPDATE SET Total = Total + excluded.Total, Count = Count + 1;
+    '''
+
+
+def _remove_sql(row, kind, bucket, amount):
+    """Subtract one row's amount from its bucket and drop the bucket once empty"""
+    key = (f"UserID = {row}.UserID AND Month = substr({row}.Date, 1, 7) "
+           f"AND Kind = '{kind}' AND Bucket = {row}.{bucket}")
+    return f'''
+        UPDATE MonthlyRollup SET Total = Total - {row}.{amount}, Count = Count - 1 WHERE {key};
+        DELETE FROM MonthlyRollup WHERE {key} AND Count <= 0;
+    '''
+
+
+def _triggers(table, kind, bucket):
+    columns = f"UserID, Amount, {bucket}, Date"
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS trg_rollup_{table.lower()}_insert
+            AFTER INSERT ON {table}
+            BEGIN {_add_sql("NEW", kind, bucket, "Amount")} END;''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_rollup_{table.lower()}_update
+            AFTER UPDATE OF {columns} ON {table}
+            BEGIN {_remove_sql("OLD", kind, bucket, "Amount")} {_add_sql("NEW", kind, bucket, "Amount")} END;''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_rollup_{table.lower()}_delete
+            AFTER DELETE ON {table}
+            BEGIN {_remove_sql("OLD", kind, bucket, "Amount")} END;''',
+    ]
+
+
+TRIGGER_SQL = _triggers("Expenses", "expense", "Category") + _triggers("Transactions", "transaction", "TransactionType")
+
+# Per-user counter bumped by every expense or transaction write; caches of
+# derived data (e.g. rendered charts) key on it instead of re-reading rows
+VERSION_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS DataVersion (
+        UserID TEXT PRIMARY KEY,
+        Version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+'''
+
+
+def _bump_sql(row):
+    return f'''
+        INSERT INTO DataVersion (UserID, Version) VALUES ({row}.UserID, 1)
+        ON CONFLICT (UserID) DO UPDATE SET Version = Version + 1;
+    '''
+
+
+VERSION_TRIGGER_SQL = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_version_{table.lower()}_{event.lower()}
+        AFTER {event} ON {table}
+        BEGIN {"".join(_bump_sql(row) for row in rows)} END;'''
+    for table in ("Expenses", "Transactions")
+    for event, rows in (("INSERT", ("NEW",)), ("UPDATE", ("OLD", "NEW")), ("DELETE", ("OLD",)))
+]
+
+DATA_VERSION_SQL = "SELECT Version FROM DataVersion WHERE UserID = ?"
+
+# Point reads for one user's month, served straight from the primary key
+MONTH_TOTALS_SQL = '''
+    SELECT Bucket, Total FROM MonthlyRollup
+    WHERE UserID = ? AND Month = ? AND Kind = ?
+    ORDER BY Bucket
+'''
+
+
+def init_schema(conn, backfill=True):
+    """Create the rollup table and its triggers, backfilling it on first creation"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'MonthlyRollup'"
+    ).fetchone()
+    conn.execute(ROLLUP_TABLE_SQL)
+    conn.execute(ROLLUP_MONTH_INDEX_SQL)
+    conn.execute(VERSION_TABLE_SQL)
+    for sql in TRIGGER_SQL + VERSION_TRIGGER_SQL:
+        conn.execute(sql)
+    if backfill and not exists:
+        rebuild(conn)
+
+
+def drop_triggers(conn):
+    """Remove the maintenance triggers, e.g. before a bulk load followed by rebuild()"""
+    names = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+        "AND (name LIKE 'trg_rollup_%' OR name LIKE 'trg_version_%')"
+    ).fetchall()
+    for (name,) in names:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def rebuild(conn, user_id=None):
+    """Recompute the rollup from raw Expenses and Transactions, for one user or everyone"""
+    where = "WHERE UserID = ?" if user_id is not None else ""
+    params = (user_id,) if user_id is not None else ()
+    with conn:
+        conn.execute(f"DELETE FROM MonthlyRollup {where}", params)
+        conn.execute(f'''
+            INSERT INTO MonthlyRollup (UserID, Month, Kind, Bucket, Total, Count)
+            SELECT UserID, substr(Date, 1, 7), 'expense', Category, SUM(Amount), COUNT(*)
+            FROM Expenses {where}
+            GROUP BY UserID, substr(Date, 1, 7), Category
+        ''', params)
+        conn.execute(f'''
+            INSERT INTO MonthlyRollup (UserID, Month, Kind, Bucket, Total, Count)
+            SELECT UserID, substr(Date, 1, 7), 'transaction', TransactionType, SUM(Amount), COUNT(*)
+            FROM Transactions {where}
+            GROUP BY UserID, substr(Date, 1, 7), TransactionType
+        ''', params)
+
+
+def expense_totals(conn, user_id, month):
+    """[(Category, Total)] for a user's month ('YYYY-MM')"""
+    return [(row[0], row[1]) for row in conn.execute(MONTH_TOTALS_SQL, (user_id, month, "expense"))]
+
+
+def transaction_totals(conn, user_id, month):
+    """[(TransactionType, Total)] for a user's month ('YYYY-MM')"""
+    return [(row[0], row[1]) for row in conn.execute(MONTH_TOTALS_SQL, (user_id, month, "transaction"))]
+
+
+def data_version(conn, user_id):
+    """Current write counter for a user's expenses and transactions (0 if never written)"""
+    row = conn.execute(DATA_VERSION_SQL, (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the monthly rollup table from raw rows.")
+    parser.add_argument("--db", default=DATABASE, help="Path to the SQLite database")
+    parser.add_argument("--user", help="Only rebuild this UserID")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    init_schema(conn, backfill=False)
+    rebuild(conn, args.user)
+    count = conn.execute("SELECT COUNT(*) FROM MonthlyRollup").fetchone()[0]
+    conn.close()
+    print(f"[SUCCESS] Monthly rollup rebuilt ({count} rows).")
@@ -0,0 +1,132 @@
+# Single definition of the application's SQLite schema
+import budgets
+import forecast
+import retention
+import rollup
+
+# Writes for a user listed in UserFence fail fast with this message while
+# storage.move_user() copies them to another shard; other users are unaffected
+USER_FENCE_MESSAGE = 'user is being moved'
+FENCED_TABLES = ("User", "Expenses", "Transactions", "BudgetLimits")
+
+
+def _fence_trigger(table, event):
+    row = "NEW" if event == "INSERT" else "OLD"
+    return f'''
+        CREATE TRIGGER IF NOT EXISTS trg_fence_{table.lower()}_{event.lower()}
+        BEFORE {event} ON {table}
+        WHEN EXISTS (SELECT 1 FROM UserFence WHERE UserID = {row}.UserID)
+        BEGIN SELECT RAISE(ABORT, '{USER_FENCE_MESSAGE}'); END;
+    '''
+
+
+def create_schema(conn):
+    """Create every table, index and trigger the app needs (idempotent)"""
+    cursor = conn.cursor()
+    
+    # Only takes effect on a new, empty database; existing files can switch
+    # with `python retention.py compact --enable-incremental-vacuum`
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS User (
+            UserID TEXT PRIMARY KEY,
+            Email TEXT UNIQUE NOT NULL,
+            Password TEXT NOT NULL,
+            Income REAL NOT NULL,
+            OriginalIncome REAL NOT NULL,
+            CreatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Expenses (
+            ExpenseID INTEGER PRIMARY KEY AUTOINCREMENT,
+            UserID TEXT NOT NULL,
+            Amount REAL NOT NULL,
+            Category TEXT NOT NULL,
+            Date DATE NOT NULL,
+            Income REAL NOT NULL,
+            FOREIGN KEY (UserID) REFERENCES User(UserID) ON DELETE CASCADE
+        );
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Transactions (
+            TransactionID INTEGER PRIMARY KEY AUTOINCREMENT,
+            UserID TEXT NOT NULL,
+            TransactionType TEXT NOT NULL,
+            Amount REAL NOT NULL,
+            Date DATE NOT NULL,
+            FOREIGN KEY (UserID) REFERENCES User(UserID) ON DELETE CASCADE
+        );
+    ''')
+    
+    # Covering indexes for per-user date-range and per-user category aggregations
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_expenses_user_date
+        ON Expenses (UserID, Date, Category, Amount);
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_expenses_user_category
+        ON Expenses (UserID, Category, Amount);
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_date
+        ON Transactions (UserID, Date, TransactionType, Amount);
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_type
+        ON Transactions (UserID, TransactionType, Amount);
+    ''')
+    
+    # Per-category listing in date order (records.py view_expenses)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_expenses_user_category_date
+        ON Expenses (UserID, Category, Date);
+    ''')
+    
+    # Keyset pagination indexes: (Date, ID) order within each user
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_expenses_user_date_id
+        ON Expenses (UserID, Date, ExpenseID);
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_date_id
+        ON Transactions (UserID, Date, TransactionID);
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS LoginAttempts (
+            AttemptID INTEGER PRIMARY KEY AUTOINCREMENT,
+            UserID TEXT,
+            IPAddress TEXT NOT NULL,
+            AttemptTime TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            Success BOOLEAN NOT NULL,
+            FOREIGN KEY (UserID) REFERENCES User(UserID) ON DELETE CASCADE
+        );
+    ''')
+    
+    # Per-user attempts: moving a user between shards and the User delete cascade
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_login_attempts_user
+        ON LoginAttempts (UserID);
+    ''')
+    
+    retention.init_schema(conn)
+    rollup.init_schema(conn)
+    budgets.init_schema(conn)
+    forecast.init_schema(conn)
+    
+    # Per-user write fence used while moving a user between shards; almost
+    # always empty, so each write pays one primary-key probe
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS UserFence (
+            UserID TEXT PRIMARY KEY
+        ) WITHOUT ROWID;
+    ''')
+    for table in FENCED_TABLES:
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(_fence_trigger(table, event))
+    
+    conn.commit()
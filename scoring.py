@@ -0,0 +1,84 @@
+# Batch savings scoring straight from the monthly expense aggregates
+import sqlite3
+import csv
+import sys
+import argparse
+from datetime import date
+
+import numpy as np
+
+import storage
+from model_store import default_store
+from training import predict_savings_batch
+
+# Database configuration
+DATABASE = 'budget_management.db'
+
+# Expense totals per user and category for one month, from the maintained rollup
+MONTH_CATEGORY_SQL = '''
+    SELECT UserID, Bucket, Total FROM MonthlyRollup
+    WHERE Month = ? AND Kind = 'expense'
+'''
+
+
+def category_index(categories, expense_cols):
+    """Map free-text categories to model column positions; unknown ones go to 'Others'"""
+    positions = {col.lower(): i for i, col in enumerate(expense_cols)}
+    fallback = positions.get("others")
+    return np.array([positions.get(str(c).strip().lower(), fallback if fallback is not None else -1)
+                     for c in categories], dtype=np.intp)
+
+
+def category_matrix(conn, month, expense_cols, user_id=None):
+    """Return (user_ids, X) with one row of category totals per user for a 'YYYY-MM' month"""
+    if user_id is None:
+        rows = conn.execute(MONTH_CATEGORY_SQL, (month,)).fetchall()
+    else:
+        rows = conn.execute(MONTH_CATEGORY_SQL + " AND UserID = ?", (month, user_id)).fetchall()
+    if not rows:
+        return [], np.zeros((0, len(expense_cols)))
+
+    users, categories, totals = zip(*rows)
+    user_ids, user_pos = np.unique(np.array(users, dtype=object), return_inverse=True)
+    distinct = sorted(set(categories))
+    col_lookup = dict(zip(distinct, category_index(distinct, expense_cols)))
+    cols = np.fromiter((col_lookup[c] for c in categories), dtype=np.intp, count=len(categories))
+
+    # Scatter-add every (user, category) total into the matrix in one call
+    keep = cols >= 0
+    X = np.zeros((len(user_ids), len(expense_cols)))
+    np.add.at(X, (user_pos[keep], cols[keep]), np.asarray(totals, dtype=float)[keep])
+    return list(user_ids), X
+
+
+def score_month(conn, month, store=default_store, user_id=None):
+    """Predict savings for every user (or one user) in a month; returns (user_ids, predictions)"""
+    theta, expense_cols = store.get()
+    user_ids, X = category_matrix(conn, month, expense_cols, user_id)
+    return user_ids, predict_savings_batch(X, theta)
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score every user's month in one batch.")
+    parser.add_argument("--db", default=DATABASE,
+                        help="Path to the SQLite database (ignored when EXPENSE_SHARDS is set)")
+    parser.add_argument("--month", default=date.today().strftime('%Y-%m'), help="YYYY-MM, defaults to this month")
+    parser.add_argument("--out", help="Write a CSV report here instead of stdout")
+    args = parser.parse_args()
+
+    user_ids, predictions = [], []
+    for path in storage.from_env(args.db).paths():
+        conn = sqlite3.connect(path)
+        shard_users, shard_predictions = score_month(conn, args.month)
+        conn.close()
+        user_ids += list(shard_users)
+        predictions += list(shard_predictions)
+
+    out = open(args.out, 'w', newline='') if args.out else sys.stdout
+    writer = csv.writer(out)
+    writer.writerow(["UserID", "Month", "PredictedSavings"])
+    writer.writerows((uid, args.month, f"{p:.2f}") for uid, p in zip(user_ids, predictions))
+    if args.out:
+        out.close()
+        print(f"[SUCCESS] Scored {len(user_ids)} users for {args.month}.")
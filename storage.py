@@ -0,0 +1,804 @@
+# Storage backends: one SQLite file, or users spread over N shard files by consistent hash
+import abc
+import argparse
+import bisect
+import fcntl
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import repository
+import schema
+from writer import GroupCommitWriter, DEFAULT_WINDOW
+
+# Database configuration
+DATABASE = 'budget_management.db'
+
+# Directory made by `python storage.py init`; when set, the app and the CLI
+# managers use the sharded backend instead of the single DATABASE file
+SHARDS_ENV = 'EXPENSE_SHARDS'
+
+# Shard list, ring settings and per-user pins, rewritten atomically on change
+MANIFEST = 'shards.json'
+
+# Points per shard on the hash ring; more points give a more even spread
+DEFAULT_VNODES = 128
+
+# Each shard hands out AUTOINCREMENT ids from its own range (shard index
+# << 40). AUTOINCREMENT continues from the largest id in the table, so a
+# moved user's rows get new ids from the target's range instead of keeping
+# theirs; one foreign id would make the shard allocate in another's range.
+ID_SPACE_BITS = 40
+ID_COLUMNS = {"Expenses": "ExpenseID", "Transactions": "TransactionID",
+              "LoginAttempts": "AttemptID", "BudgetAlerts": "AlertID"}
+ID_TABLES = tuple(ID_COLUMNS)
+
+# Copy order of the renumbered rows, so the new ids keep the old ones' order
+# (history pages go by (Date, ID); alert cursors by AlertID)
+ID_ORDER = {"Expenses": "Date, ExpenseID", "Transactions": "Date, TransactionID",
+            "LoginAttempts": "AttemptID", "BudgetAlerts": "AlertID"}
+
+# Tables holding a user's rows, in copy order (parents first). MonthlyRollup
+# and DataVersion are not copied: the target's triggers rebuild them. Budget
+# alerts go before Expenses so the replayed rollup does not raise them again.
+USER_TABLES = ("User", "BudgetLimits", "BudgetAlerts", "Expenses", "Transactions", "LoginAttempts",
+               "LoginAttemptsHourly", "Forecasts", "ForecastState")
+
+# Rows copied per executemany() while moving a user
+COPY_BATCH_SIZE = 1000
+
+# Shards queried at once by fan_out()
+FAN_OUT_WORKERS = 8
+
+# Small per-user tables recopied while the source is locked at the end of a move
+REFRESHED_TABLES = ("LoginAttemptsHourly", "Forecasts", "ForecastState")
+
+# How long a ShardedWriter job waits for a fenced (moving) user, polling every FENCE_POLL seconds
+FENCE_WAIT = 30.0
+FENCE_POLL = 0.05
+
+
+class StorageError(Exception):
+    """Raised for a missing or inconsistent shard layout"""
+
+
+def user_rows_sql(table):
+    """All of one user's rows in a table (used when moving users)"""
+    if table in ID_ORDER:
+        return f"SELECT * FROM {table} WHERE UserID = ? ORDER BY {ID_ORDER[table]}"
+    return f"SELECT * FROM {table} WHERE UserID = ?"
+
+
+def _query(path, sql, params):
+    conn = repository.connect(path)
+    try:
+        conn.execute("PRAGMA query_only = ON;")
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def create_shard(path, index=0):
+    """Create the schema in a shard file and start its id sequences in the shard's own range"""
+    conn = repository.connect(path)
+    try:
+        schema.create_schema(conn)
+        for table in ID_TABLES:
+            raise_sequence(conn, table, index << ID_SPACE_BITS)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def raise_sequence(conn, table, floor):
+    """Make sure the next AUTOINCREMENT id of table is above floor"""
+    conn.execute("INSERT INTO sqlite_sequence (name, seq) SELECT ?, 0 "
+                 "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)", (table, table))
+    conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (floor, table))
+
+
+def id_range_errors(conn, index):
+    """Tables whose sequence or ids left shard index's own id range, as messages"""
+    floor, ceiling = index << ID_SPACE_BITS, (index + 1) << ID_SPACE_BITS
+    errors = []
+    for table, column in ID_COLUMNS.items():
+        seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        if seq is None or not floor <= seq[0] < ceiling:
+            errors.append(f"{table} sequence {seq[0] if seq else None} is outside [{floor}, {ceiling})")
+        stray = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {column} >= ?", (ceiling,)).fetchone()[0]
+        if stray:
+            errors.append(f"{table} has {stray} row(s) with ids from a later shard's range")
+    return errors
+
+
+# === Hash Ring ===
+def _point(key):
+    """Stable 64-bit position on the ring (Python's hash() differs per process)"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hashing: adding a shard only moves the keys that land on its points"""
+
+    def __init__(self, nodes, vnodes=DEFAULT_VNODES):
+        if not nodes:
+            raise StorageError("A hash ring needs at least one shard")
+        points = sorted((_point(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self._points = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def lookup(self, key):
+        i = bisect.bisect(self._points, _point(key))
+        return self._nodes[i % len(self._nodes)]
+
+
+# === Backends ===
+class Storage(abc.ABC):
+    """Where each user's rows live. Subclasses implement path_for() and paths()."""
+    sharded = False
+
+    @abc.abstractmethod
+    def path_for(self, user_id=None):
+        """File holding user_id's rows (None: the default file for global data)"""
+
+    @abc.abstractmethod
+    def paths(self):
+        """Every database file"""
+
+    def connect(self, user_id=None, **kwargs):
+        return repository.connect(self.path_for(user_id), **kwargs)
+
+    def init(self):
+        for path in self.paths():
+            create_shard(path)
+
+    def follow_rename(self, old_user_id, new_user_id):
+        """Keep a renamed user's rows reachable under the new UserID"""
+
+    def claim_email(self, user_id, email):
+        """Reserve email for user_id; False if another user has it.
+
+        One file enforces this itself (User.Email is UNIQUE), so only
+        sharded storage has anything to reserve.
+        """
+        return True
+
+    def release_email(self, user_id, email):
+        """Give up a claim_email() reservation, e.g. when the insert it guarded failed"""
+
+    def fan_out(self, sql, params=(), key=None, limit=None):
+        """Run a read-only query on every file and combine the rows.
+
+        With key, each file's rows must already be sorted by it (ORDER BY in
+        sql) and are merged in that order; limit caps the combined result.
+        """
+        paths = self.paths()
+        if len(paths) == 1:
+            results = [_query(paths[0], sql, params)]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(paths), FAN_OUT_WORKERS)) as executor:
+                results = list(executor.map(lambda path: _query(path, sql, params), paths))
+        rows = heapq.merge(*results, key=key) if key else itertools.chain.from_iterable(results)
+        return list(itertools.islice(rows, limit))
+
+
+class SingleFileStorage(Storage):
+    """Every user in one database file (the default)"""
+
+    def __init__(self, path=DATABASE):
+        self.path = path
+
+    def path_for(self, user_id=None):
+        return self.path
+
+    def paths(self):
+        return [self.path]
+
+    def describe(self):
+        return {"backend": "single", "path": self.path}
+
+
+class ShardedStorage(Storage):
+    """Users routed by consistent hash of their UserID to one of N shard files.
+
+    A pin overrides the ring for one user; pins keep users reachable while
+    they wait to be moved after a shard is added (see rebalance()). The
+    manifest is re-read whenever it changes on disk, so a running app sees
+    moves made by the rebalancing tool on its next lookup.
+    """
+    sharded = True
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST)
+        self._lock = threading.Lock()
+        self._signature = None
+        self._refresh()
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            raise StorageError(f"No shard manifest at {self.manifest_path}; run `python storage.py init`")
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if signature == self._signature:
+            return
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        ring = HashRing(manifest["shards"], manifest["vnodes"])
+        with self._lock:
+            # One attribute, so a lookup never pairs a new manifest with an old ring
+            self._state, self._signature = (manifest, ring), signature
+
+    def _current(self):
+        self._refresh()
+        return self._state
+
+    @property
+    def shards(self):
+        return list(self._current()[0]["shards"])
+
+    @property
+    def pins(self):
+        return dict(self._current()[0]["pins"])
+
+    def shard_for(self, user_id):
+        manifest, ring = self._current()
+        return manifest["pins"].get(user_id) or ring.lookup(user_id)
+
+    def home_shard(self, user_id):
+        """Where the ring places user_id, ignoring pins"""
+        return self._current()[1].lookup(user_id)
+
+    def shard_path(self, shard):
+        return os.path.join(self.directory, shard)
+
+    def path_for(self, user_id=None):
+        if user_id is None:
+            return self.shard_path(self.shards[0])
+        return self.shard_path(self.shard_for(user_id))
+
+    def paths(self):
+        return [self.shard_path(shard) for shard in self.shards]
+
+    def describe(self):
+        manifest = self._current()[0]
+        return {"backend": "sharded", "directory": self.directory, "shards": manifest["shards"],
+                "vnodes": manifest["vnodes"], "pinned_users": len(manifest["pins"])}
+
+    def init(self):
+        for index, shard in enumerate(self.shards):
+            create_shard(self.shard_path(shard), index)
+        self.index_emails()
+
+    def index_emails(self):
+        """Create the email index on the first shard and add every user's email to it"""
+        authority = _open(self.path_for())
+        try:
+            for sql in EMAIL_INDEX_SQL:
+                authority.execute(sql)
+            for path in self.paths():
+                _write(authority, *[(CLAIM_EMAIL_SQL, (email, user_id))
+                                    for user_id, email in _query(path, USER_EMAILS_SQL, ())])
+        finally:
+            authority.close()
+
+    def _index_write(self, sql, params):
+        """One write to the email index; returns the connection, still open"""
+        authority = _open(self.path_for())
+        try:
+            _write(authority, (sql, params))
+        except Exception:
+            authority.close()
+            raise
+        return authority
+
+    def claim_email(self, user_id, email):
+        # One INSERT on one file, so two registrations on different shards
+        # cannot both get the same email
+        authority = self._index_write(CLAIM_EMAIL_SQL, (email, user_id))
+        try:
+            owner = authority.execute(EMAIL_OWNER_SQL, (email,)).fetchone()
+        finally:
+            authority.close()
+        return owner is not None and owner[0] == user_id
+
+    def release_email(self, user_id, email):
+        self._index_write(RELEASE_EMAIL_SQL, (email, user_id)).close()
+
+    def update_manifest(self, change):
+        """Apply change(manifest) under an exclusive lock and publish it atomically"""
+        with open(self.manifest_path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            change(manifest)
+            write_manifest(self.directory, manifest)
+        self._refresh()
+
+    def pin(self, user_id, shard):
+        """Route user_id to shard; dropped again when shard is the user's ring home"""
+        def change(manifest):
+            if HashRing(manifest["shards"], manifest["vnodes"]).lookup(user_id) == shard:
+                manifest["pins"].pop(user_id, None)
+            else:
+                manifest["pins"][user_id] = shard
+        self.update_manifest(change)
+
+    def follow_rename(self, old_user_id, new_user_id):
+        shard = self.shard_for(old_user_id)
+        self.pin(new_user_id, shard)
+        self.pin(old_user_id, self.home_shard(old_user_id))
+        self._index_write(RENAME_EMAIL_OWNER_SQL, (new_user_id, old_user_id)).close()
+
+
+# Emails of every shard's users, kept on the first shard: UNIQUE on
+# User.Email only covers the users of one file
+EMAIL_INDEX_SQL = [
+    "CREATE TABLE IF NOT EXISTS EmailIndex (Email TEXT PRIMARY KEY, UserID TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_email_index_user ON EmailIndex (UserID)",
+]
+USER_EMAILS_SQL = "SELECT UserID, Email FROM User"
+CLAIM_EMAIL_SQL = "INSERT INTO EmailIndex (Email, UserID) VALUES (?, ?) ON CONFLICT (Email) DO NOTHING"
+EMAIL_OWNER_SQL = "SELECT UserID FROM EmailIndex WHERE Email = ?"
+RELEASE_EMAIL_SQL = "DELETE FROM EmailIndex WHERE Email = ? AND UserID = ?"
+RENAME_EMAIL_OWNER_SQL = "UPDATE EmailIndex SET UserID = ? WHERE UserID = ?"
+
+
+def write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def open_storage(shards_dir=None, path=DATABASE):
+    """ShardedStorage for a shard directory, else the single file at path"""
+    return ShardedStorage(shards_dir) if shards_dir else SingleFileStorage(path)
+
+
+def from_env(path=DATABASE):
+    """Backend chosen by the EXPENSE_SHARDS environment variable"""
+    return open_storage(os.environ.get(SHARDS_ENV), path)
+
+
+# === Per-Shard Resources ===
+class PerShard:
+    """One lazily created object per database file (connection pools, audit writers, ...)"""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, path):
+        item = self._items.get(path)
+        if item is None:
+            with self._lock:
+                item = self._items.get(path)
+                if item is None:
+                    item = self._items[path] = self.factory(path)
+        return item
+
+    def values(self):
+        with self._lock:
+            return list(self._items.values())
+
+    def call(self, method):
+        """Call method() on every object created so far"""
+        for item in self.values():
+            getattr(item, method)()
+
+    def stats(self):
+        with self._lock:
+            items = list(self._items.items())
+        return {path: item.stats() for path, item in items}
+
+
+class ShardedWriter:
+    """GroupCommitWriter per shard, picked by each job's first argument, the UserID.
+
+    Same interface as GroupCommitWriter for jobs like Repository.create_user
+    or set_income whose first argument is the user they write for.
+    """
+
+    def __init__(self, storage, window=DEFAULT_WINDOW):
+        self.storage = storage
+        self._writers = PerShard(lambda path: GroupCommitWriter(path, window=window))
+
+    def submit(self, fn, user_id, *args, **kwargs):
+        return self._writers[self.storage.path_for(user_id)].submit(fn, user_id, *args, **kwargs)
+
+    def execute(self, fn, user_id, *args, **kwargs):
+        deadline = time.monotonic() + FENCE_WAIT
+        while True:
+            path = self.storage.path_for(user_id)
+            try:
+                result = self._writers[path].execute(fn, user_id, *args, **kwargs)
+            except sqlite3.IntegrityError as e:
+                # The user is fenced while being moved: wait for their new route
+                if schema.USER_FENCE_MESSAGE in str(e) and time.monotonic() < deadline:
+                    time.sleep(FENCE_POLL)
+                    continue
+                result = False
+                if self.storage.path_for(user_id) == path:
+                    raise
+            # A job that waited on a shard while its user was moved off it wrote
+            # nothing there (the user's rows are gone); run it again where they are now
+            if result is False and self.storage.path_for(user_id) != path:
+                continue
+            return result
+
+    def close(self):
+        self._writers.call('close')
+
+    def stats(self):
+        return self._writers.stats()
+
+
+# === Moving Users ===
+def _batches(src, table, sql, params, batch_size, renumber=False):
+    """(INSERT statement, rows) for each batch of src rows selected by sql.
+
+    With renumber, the id column of ID_TABLES is left out so the target
+    assigns ids from its own range.
+    """
+    cursor = src.execute(sql, params)
+    columns = [d[0] for d in cursor.description]
+    keep = [i for i, column in enumerate(columns) if not (renumber and column == ID_COLUMNS.get(table))]
+    insert = (f"INSERT INTO {table} ({', '.join(columns[i] for i in keep)}) "
+              f"VALUES ({', '.join('?' * len(keep))})")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield insert, (rows if len(keep) == len(columns) else [[row[i] for i in keep] for row in rows])
+
+
+def _bump_version(src, dst, user_id):
+    # The insert triggers restarted the user's DataVersion; move it past the
+    # source's so no cache can mistake the copy for an older version
+    version = src.execute("SELECT Version FROM DataVersion WHERE UserID = ?", (user_id,)).fetchone()
+    dst.execute("INSERT INTO DataVersion (UserID, Version) VALUES (?, ?) "
+                "ON CONFLICT (UserID) DO UPDATE SET Version = Version + excluded.Version",
+                (user_id, (version[0] if version else 0) + 1))
+
+
+def copy_user(src, dst, user_id, batch_size=COPY_BATCH_SIZE):
+    """Replace user_id's rows in dst with those in src in one dst transaction; returns rows copied.
+
+    The rows keep their ids: only for importing a single file, whose ids lie
+    below every later shard's range.
+    """
+    copied = 0
+    dst.execute("BEGIN IMMEDIATE")
+    try:
+        delete_user(dst, user_id)
+        for table in USER_TABLES:
+            for insert, rows in _batches(src, table, user_rows_sql(table), (user_id,), batch_size):
+                dst.executemany(insert, rows)
+                copied += len(rows)
+        _bump_version(src, dst, user_id)
+        dst.execute("COMMIT")
+    except Exception:
+        dst.execute("ROLLBACK")
+        raise
+    return copied
+
+
+# The fence goes first: its triggers would reject deleting a fenced user's rows
+DELETE_USER_SQL = [f"DELETE FROM {table} WHERE UserID = ?" for table in
+                    ("UserFence", "User", "LoginAttempts", "LoginAttemptsHourly", "DataVersion",
+                     "Forecasts", "ForecastState")]
+
+
+def delete_user(conn, user_id):
+    """Delete user_id and (by cascade and triggers) everything derived from them"""
+    for sql in DELETE_USER_SQL:
+        conn.execute(sql, (user_id,))
+
+
+def _open(path):
+    conn = repository.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA busy_timeout = 5000;")
+    return conn
+
+
+def _write(conn, *statements):
+    """Run (sql, params) pairs in one short write transaction"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for sql, params in statements:
+            conn.execute(sql, params)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _copy_batched(src, dst, user_id, batch_size):
+    """Copy the fenced user's rows with one dst transaction per batch.
+
+    Returns the rows copied and the newest source AttemptID they include.
+    """
+    copied = 0
+    src.execute("BEGIN")  # One read snapshot; under WAL it does not hold up writers
+    try:
+        newest = src.execute(LATEST_ATTEMPT_SQL, (user_id,)).fetchone()[0] or 0
+        for table in USER_TABLES:
+            for insert, rows in _batches(src, table, user_rows_sql(table), (user_id,), batch_size, renumber=True):
+                dst.execute("BEGIN IMMEDIATE")
+                try:
+                    dst.executemany(insert, rows)
+                    dst.execute("COMMIT")
+                except Exception:
+                    dst.execute("ROLLBACK")
+                    raise
+                copied += len(rows)
+    finally:
+        src.execute("ROLLBACK")
+    return copied, newest
+
+
+# Login attempts recorded on the source since the batched copy read it
+LATEST_ATTEMPT_SQL = "SELECT MAX(AttemptID) FROM LoginAttempts WHERE UserID = ?"
+NEW_ATTEMPTS_SQL = "SELECT * FROM LoginAttempts WHERE UserID = ? AND AttemptID > ? ORDER BY AttemptID"
+
+FENCE_SQL = "INSERT OR IGNORE INTO UserFence (UserID) VALUES (?)"
+UNFENCE_SQL = "DELETE FROM UserFence WHERE UserID = ?"
+
+
+def _catch_up(src, dst, user_id, newest, batch_size):
+    """Bring over what the fence does not stop (login attempts after newest, hourly counts, forecasts)"""
+    copied = 0
+    for insert, rows in _batches(src, "LoginAttempts", NEW_ATTEMPTS_SQL, (user_id, newest), batch_size,
+                                 renumber=True):
+        dst.executemany(insert, rows)
+        copied += len(rows)
+    for table in REFRESHED_TABLES:
+        dst.execute(f"DELETE FROM {table} WHERE UserID = ?", (user_id,))
+        for insert, rows in _batches(src, table, user_rows_sql(table), (user_id,), batch_size):
+            dst.executemany(insert, rows)
+            copied += len(rows)
+    _bump_version(src, dst, user_id)
+    return copied
+
+
+def move_user(storage, user_id, shard=None, batch_size=COPY_BATCH_SIZE):
+    """Move one user's rows to shard (default: their ring home) while the app keeps serving.
+
+    The user is fenced on the source first: the schema's fence triggers reject
+    writes to their rows (ShardedWriter retries them until the move ends), and
+    other users on the shard are not affected. Their rows are then copied in
+    batches of batch_size, one short destination transaction each, and get new
+    ids from the target's range. Only the final catch-up, the new route and the
+    source delete run with the source write-locked. Fan-out readers may see the
+    user on both shards during the copy. Returns the number of rows moved.
+    """
+    shard = shard or storage.home_shard(user_id)
+    if shard not in storage.shards:
+        raise StorageError(f"Unknown shard: {shard}")
+    source = storage.shard_for(user_id)
+    if not _query(storage.shard_path(source), "SELECT 1 FROM User WHERE UserID = ?", (user_id,)):
+        raise StorageError(f"User {user_id} is not on {source}")
+    if source == shard:
+        storage.pin(user_id, shard)
+        return 0
+
+    src = _open(storage.shard_path(source))
+    dst = _open(storage.shard_path(shard))
+    pinned = False
+    try:
+        _write(src, (FENCE_SQL, (user_id,)))
+        try:
+            _write(dst, *[(sql, (user_id,)) for sql in DELETE_USER_SQL])
+            copied, newest = _copy_batched(src, dst, user_id, batch_size)
+            src.execute("BEGIN IMMEDIATE")
+            try:
+                dst.execute("BEGIN IMMEDIATE")
+                try:
+                    copied += _catch_up(src, dst, user_id, newest, batch_size)
+                    errors = id_range_errors(dst, storage.shards.index(shard))
+                    if errors:
+                        raise StorageError(f"{shard}: " + "; ".join(errors))
+                    dst.execute("COMMIT")
+                except Exception:
+                    dst.execute("ROLLBACK")
+                    raise
+                storage.pin(user_id, shard)
+                pinned = True
+                delete_user(src, user_id)
+                src.execute("COMMIT")
+            except Exception:
+                src.execute("ROLLBACK")
+                raise
+        except Exception:
+            # Until the route changes the source copy is the real one: drop the
+            # partial copy and lift the fence. After that, leave the stale source
+            # rows fenced so nothing writes to them.
+            if not pinned:
+                _write(dst, *[(sql, (user_id,)) for sql in DELETE_USER_SQL])
+                _write(src, (UNFENCE_SQL, (user_id,)))
+            raise
+    finally:
+        src.close()
+        dst.close()
+    return copied
+
+
+def locations(storage):
+    """(shard, UserID) for every user actually stored in each shard"""
+    for shard in storage.shards:
+        for (user_id,) in _query(storage.shard_path(shard), "SELECT UserID FROM User", ()):
+            yield shard, user_id
+
+
+def add_shard(storage):
+    """Append a new empty shard to the ring without moving anyone yet.
+
+    Users the new ring would route elsewhere are pinned to where their rows
+    are, so nothing becomes unreachable; rebalance() then moves them.
+    """
+    shards = storage.shards
+    name = f"shard-{len(shards):03d}.db"
+    create_shard(storage.shard_path(name), len(shards))
+    placed = list(locations(storage))
+
+    def change(manifest):
+        ring = HashRing(manifest["shards"] + [name], manifest["vnodes"])
+        for shard, user_id in placed:
+            if ring.lookup(user_id) != shard:
+                manifest["pins"][user_id] = shard
+        manifest["shards"].append(name)
+    storage.update_manifest(change)
+    pin_strays(storage)  # Users registered while the scan ran
+    return name
+
+
+def pin_strays(storage):
+    """Pin every user whose rows are not where routing points; returns how many"""
+    strays = [(shard, user_id) for shard, user_id in locations(storage) if storage.shard_for(user_id) != shard]
+
+    def change(manifest):
+        for shard, user_id in strays:
+            manifest["pins"][user_id] = shard
+    if strays:
+        storage.update_manifest(change)
+    return len(strays)
+
+
+def rebalance(storage, limit=None, pause=0.0, batch_size=COPY_BATCH_SIZE):
+    """Move pinned users to their ring home one at a time; returns (users moved, rows moved)"""
+    users = rows = 0
+    for user_id, shard in itertools.islice(storage.pins.items(), limit):
+        if storage.home_shard(user_id) == shard:
+            continue
+        rows += move_user(storage, user_id, batch_size=batch_size)
+        users += 1
+        if pause:
+            time.sleep(pause)  # Let queued requests for the shard through between moves
+    return users, rows
+
+
+def create_sharded(directory, count, vnodes=DEFAULT_VNODES, source=None):
+    """Create a shard directory; with source, copy every user of that single file to their shard"""
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(os.path.join(directory, MANIFEST)):
+        raise StorageError(f"{directory} already has a shard manifest")
+    shards = [f"shard-{i:03d}.db" for i in range(count)]
+    write_manifest(directory, {"shards": shards, "vnodes": vnodes, "pins": {}})
+    storage = ShardedStorage(directory)
+    storage.init()
+    if source is None:
+        return storage, 0
+
+    src = _open(source)
+    targets = {shard: _open(storage.shard_path(shard)) for shard in shards}
+    try:
+        users = [user_id for (user_id,) in src.execute("SELECT UserID FROM User")]
+        for user_id in users:
+            copy_user(src, targets[storage.shard_for(user_id)], user_id)
+        # Attempts against unknown UserIDs belong to no user; keep them on the first shard
+        first = targets[shards[0]]
+        for table, where in (("LoginAttempts", "UserID IS NULL"), ("LoginAttemptsHourly", "UserID = ''")):
+            cursor = src.execute(f"SELECT * FROM {table} WHERE {where}")
+            columns = [d[0] for d in cursor.description]
+            first.executemany(f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+                              f"VALUES ({', '.join('?' * len(columns))})", cursor)
+        # Copied ids came from one sequence; keep every shard's new ids above them
+        for table in ID_TABLES:
+            row = src.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+            for index, shard in enumerate(shards):
+                raise_sequence(targets[shard], table, max(index << ID_SPACE_BITS, row[0] if row else 0))
+    finally:
+        src.close()
+        for conn in targets.values():
+            conn.close()
+    storage.index_emails()
+    return storage, len(users)
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the hash-sharded storage backend.")
+    parser.add_argument("--dir", default=os.environ.get(SHARDS_ENV), help="Shard directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    init_parser = sub.add_parser("init", help="Create a shard directory")
+    init_parser.add_argument("--shards", type=int, default=4)
+    init_parser.add_argument("--vnodes", type=int, default=DEFAULT_VNODES)
+    init_parser.add_argument("--import-db", help="Copy every user from this single-file database")
+
+    sub.add_parser("status", help="Users per shard and pending moves")
+    sub.add_parser("check", help="Check that every shard's ids stay in its own range")
+    sub.add_parser("add-shard", help="Add an empty shard and pin the users it would take")
+
+    rebalance_parser = sub.add_parser("rebalance", help="Move pinned users to their ring home")
+    rebalance_parser.add_argument("--limit", type=int, help="Move at most this many users")
+    rebalance_parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between users")
+
+    move_parser = sub.add_parser("move", help="Move one user to a given shard")
+    move_parser.add_argument("user_id")
+    move_parser.add_argument("shard", nargs="?", help="Target shard (default: the user's ring home)")
+
+    query_parser = sub.add_parser("query", help="Run a read-only query on every shard")
+    query_parser.add_argument("sql")
+    query_parser.add_argument("params", nargs="*")
+    query_parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    if not args.dir:
+        parser.error(f"--dir or {SHARDS_ENV} is required")
+
+    try:
+        if args.command == "init":
+            store, imported = create_sharded(args.dir, args.shards, args.vnodes, args.import_db)
+            print(f"[SUCCESS] Created {args.shards} shards in {args.dir}"
+                  + (f"; imported {imported} users." if args.import_db else "."))
+            raise SystemExit(0)
+
+        store = ShardedStorage(args.dir)
+        if args.command == "status":
+            for shard in store.shards:
+                users = _query(store.shard_path(shard), "SELECT COUNT(*) FROM User", ())[0][0]
+                print(f"{shard:<16} users={users}")
+            print(f"[INFO] {len(store.pins)} pinned user(s) awaiting rebalance.")
+        elif args.command == "check":
+            failed = False
+            for index, shard in enumerate(store.shards):
+                conn = repository.connect(store.shard_path(shard))
+                try:
+                    errors = id_range_errors(conn, index)
+                finally:
+                    conn.close()
+                for error in errors:
+                    print(f"[ERROR] {shard}: {error}")
+                failed = failed or bool(errors)
+            if failed:
+                raise SystemExit(1)
+            print(f"[SUCCESS] All {len(store.shards)} shards allocate ids from their own range.")
+        elif args.command == "add-shard":
+            name = add_shard(store)
+            print(f"[SUCCESS] Added {name}; {len(store.pins)} user(s) pinned until `rebalance` moves them.")
+        elif args.command == "rebalance":
+            moved, rows = rebalance(store, args.limit, args.pause)
+            print(f"[SUCCESS] Moved {moved} user(s), {rows} row(s).")
+        elif args.command == "move":
+            rows = move_user(store, args.user_id, args.shard)
+            print(f"[SUCCESS] {args.user_id} is on {store.shard_for(args.user_id)} ({rows} rows moved).")
+        elif args.command == "query":
+            for row in store.fan_out(args.sql, args.params, limit=args.limit):
+                print(tuple(row))
+    except StorageError as e:
+        print(f"[ERROR] {e}")
+        raise SystemExit(1)
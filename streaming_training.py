@@ -0,0 +1,260 @@
+# Out-of-core savings trainer: accumulate XᵀX and Xᵀy chunk by chunk in constant memory
+import json
+import os
+import sqlite3
+import argparse
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import storage
+from scoring import category_index
+from training import DATA_PATH, EXPENSE_COLS
+
+# Database configuration
+DATABASE = 'budget_management.db'
+
+# Where the accumulated statistics and solved weights are kept between runs
+STATS_PATH = 'savings_stats.json'
+
+# Feature vectors (user-months) per chunk
+DEFAULT_CHUNK_ROWS = 50000
+
+# Per user-month expense totals by category, with the user's income as the savings baseline.
+# Ordered by the rollup's primary key so consecutive rows belong to the same user-month.
+USER_MONTH_SQL = '''
+    SELECT r.UserID, r.Month, r.Bucket, r.Total, u.OriginalIncome
+    FROM MonthlyRollup r
+    JOIN User u ON u.UserID = r.UserID
+    WHERE r.Kind = 'expense' AND r.Month > ? AND r.Month < ?
+    ORDER BY r.UserID, r.Month
+'''
+
+
+class SufficientStats:
+    """Running XᵀX, Xᵀy, yᵀy and row count for least squares with an intercept"""
+
+    def __init__(self, n_features):
+        k = n_features + 1
+        self.xtx = np.zeros((k, k))
+        self.xty = np.zeros(k)
+        self.yty = 0.0
+        self.n = 0
+
+    def update(self, X, y):
+        """Fold a chunk of rows into the statistics without materializing an intercept column"""
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float).ravel()
+        col_sums = X.sum(axis=0)
+        self.xtx[0, 0] += len(X)
+        self.xtx[0, 1:] += col_sums
+        self.xtx[1:, 0] += col_sums
+        self.xtx[1:, 1:] += X.T @ X
+        self.xty[0] += y.sum()
+        self.xty[1:] += X.T @ y
+        self.yty += float(y @ y)
+        self.n += len(X)
+
+    def merge(self, other):
+        """Add another set of statistics (e.g. from a parallel worker)"""
+        self.xtx += other.xtx
+        self.xty += other.xty
+        self.yty += other.yty
+        self.n += other.n
+
+    def solve(self, ridge=0.0):
+        """Return theta of shape (k + 1, 1); the intercept is never penalized"""
+        A = self.xtx.copy()
+        A[1:, 1:] += ridge * np.eye(len(A) - 1)
+        b = self.xty
+
+        # Jacobi scaling keeps the system well conditioned when amounts are large
+        scale = np.sqrt(np.diag(A))
+        scale[scale == 0] = 1.0
+        A_s = A / np.outer(scale, scale)
+        b_s = b / scale
+        try:
+            z = np.linalg.solve(A_s, b_s)
+        except np.linalg.LinAlgError:
+            z = np.linalg.lstsq(A_s, b_s, rcond=None)[0]
+        return (z / scale).reshape(-1, 1)
+
+    def mse(self, theta):
+        """Training MSE computed from the statistics alone"""
+        if self.n == 0:
+            return None
+        t = np.ravel(theta)
+        sse = self.yty - 2 * t @ self.xty + t @ self.xtx @ t
+        return float(max(sse, 0.0) / self.n)
+
+    def to_dict(self):
+        return {"xtx": self.xtx.tolist(), "xty": self.xty.tolist(), "yty": self.yty, "n": self.n}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(len(data["xty"]) - 1)
+        stats.xtx = np.array(data["xtx"], dtype=float)
+        stats.xty = np.array(data["xty"], dtype=float)
+        stats.yty = float(data["yty"])
+        stats.n = int(data["n"])
+        return stats
+
+
+# === Chunk Sources ===
+def iter_csv_chunks(path=DATA_PATH, chunk_rows=DEFAULT_CHUNK_ROWS, expense_cols=EXPENSE_COLS):
+    """Yield (X, y) chunks from a dataset.py-style CSV without loading the whole file"""
+    for df in pd.read_csv(path, usecols=list(expense_cols) + ['Income'], chunksize=chunk_rows):
+        X = df[list(expense_cols)].to_numpy(dtype=float)
+        yield X, df['Income'].to_numpy(dtype=float) - X.sum(axis=1)
+
+
+def iter_db_chunks(conn, after_month="", before_month="9999-99",
+                   chunk_rows=DEFAULT_CHUNK_ROWS, expense_cols=EXPENSE_COLS):
+    """Yield (X, y) chunks of per user-month category vectors for months in (after, before)"""
+    cursor = conn.execute(USER_MONTH_SQL, (after_month, before_month))
+    positions = {}
+    X = np.zeros((chunk_rows, len(expense_cols)))
+    income = np.zeros(chunk_rows)
+    row = -1
+    current = None
+
+    while True:
+        batch = cursor.fetchmany(10000)
+        if not batch:
+            break
+        for user_id, month, category, total, original_income in batch:
+            if (user_id, month) != current:
+                if row + 1 == chunk_rows:
+                    yield X, income - X.sum(axis=1)
+                    X = np.zeros((chunk_rows, len(expense_cols)))
+                    income = np.zeros(chunk_rows)
+                    row = -1
+                current = (user_id, month)
+                row += 1
+                income[row] = original_income
+            col = positions.get(category)
+            if col is None:
+                col = positions[category] = category_index([category], expense_cols)[0]
+            if col >= 0:
+                X[row, col] += total
+
+    if row >= 0:
+        X, income = X[:row + 1], income[:row + 1]
+        yield X, income - X.sum(axis=1)
+
+
+def previous_month(today=None):
+    """'YYYY-MM' of the last closed month"""
+    first = (today or date.today()).replace(day=1)
+    return (date.fromordinal(first.toordinal() - 1)).strftime('%Y-%m')
+
+
+# === Trainer ===
+class StreamingTrainer:
+    """Persists sufficient statistics so new closed months can be folded in incrementally"""
+
+    def __init__(self, path=STATS_PATH, source="db", expense_cols=EXPENSE_COLS):
+        self.path = path
+        self.source = source
+        self.expense_cols = list(expense_cols)
+        self.stats = SufficientStats(len(self.expense_cols))
+        self.watermark = ""  # Last month already folded into the statistics
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get("columns") != self.expense_cols or data.get("source") != self.source:
+            return  # Statistics for a different feature layout or source cannot be reused
+        self.stats = SufficientStats.from_dict(data["stats"])
+        self.watermark = data.get("watermark", "")
+
+    def save(self, theta, ridge):
+        data = {
+            "source": self.source,
+            "columns": self.expense_cols,
+            "watermark": self.watermark,
+            "ridge": ridge,
+            "theta": [float(v) for v in np.ravel(theta)],
+            "train_mse": self.stats.mse(theta),
+            "stats": self.stats.to_dict(),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        self.stats = SufficientStats(len(self.expense_cols))
+        self.watermark = ""
+
+    def fit_chunks(self, chunks):
+        for X, y in chunks:
+            self.stats.update(X, y)
+
+    def update_from_db(self, paths, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Fold every closed month after the watermark in each database file (e.g. every shard).
+
+        Each file is read into its own statistics, merged only once all of them
+        are read, so a failure leaves both the statistics and the one shared
+        watermark as they were.
+        """
+        closed = previous_month()
+        if closed <= self.watermark:
+            return 0
+        # Months strictly before the current one are closed and will not change
+        current = date.today().strftime('%Y-%m')
+        shard_stats = []
+        for path in paths:
+            stats = SufficientStats(len(self.expense_cols))
+            conn = sqlite3.connect(path)
+            try:
+                for X, y in iter_db_chunks(conn, self.watermark, current, chunk_rows, self.expense_cols):
+                    stats.update(X, y)
+            finally:
+                conn.close()
+            shard_stats.append(stats)
+        before = self.stats.n
+        for stats in shard_stats:
+            self.stats.merge(stats)
+        self.watermark = closed
+        return self.stats.n - before
+
+    def solve(self, ridge=0.0):
+        return self.stats.solve(ridge)
+
+
+# === Entry Point for Direct Script Execution ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the savings model in constant memory.")
+    parser.add_argument("--source", choices=("db", "csv"), default="db")
+    parser.add_argument("--db", default=DATABASE,
+                        help="Path to the SQLite database (ignored when EXPENSE_SHARDS is set)")
+    parser.add_argument("--csv", default=DATA_PATH, help="Path to a dataset.py CSV")
+    parser.add_argument("--stats", default=STATS_PATH, help="Where to keep the accumulated statistics")
+    parser.add_argument("--ridge", type=float, default=0.0, help="L2 penalty on the expense weights")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--full", action="store_true", help="Discard saved statistics and retrain from scratch")
+    args = parser.parse_args()
+
+    trainer = StreamingTrainer(args.stats, args.source)
+    if args.full or args.source == "csv":
+        trainer.reset()
+
+    if args.source == "csv":
+        trainer.fit_chunks(iter_csv_chunks(args.csv, args.chunk_rows))
+        added = trainer.stats.n
+    else:
+        added = trainer.update_from_db(storage.from_env(args.db).paths(), args.chunk_rows)
+
+    if trainer.stats.n == 0:
+        print("[INFO] No training data found.")
+    else:
+        theta = trainer.solve(args.ridge)
+        trainer.save(theta, args.ridge)
+        print(f"[SUCCESS] Folded in {added} user-months ({trainer.stats.n} total) | "
+              f"Train MSE: {trainer.stats.mse(theta):.2f}")
@@ -1,15 +1,21 @@
 import pandas as pd
 import numpy as np
 
+# Default training data file produced by dataset.py
+DATA_PATH = 'synthetic_expense_data.csv'
+
+# Columns that represent expense categories, in model order
+EXPENSE_COLS = ['Food', 'Transport', 'Entertainment', 'Housing', 'Others']
+
 # Function to load the dataset
-def load_data():
-    df = pd.read_csv('synthetic_expense_data.csv')
+def load_data(path=DATA_PATH):
+    df = pd.read_csv(path)
     return df
 
 # Function to preprocess the data
 def preprocess_data(df):
     # Define which columns represent expense categories
-    expense_cols = ['Food', 'Transport', 'Entertainment', 'Housing', 'Others']
+    expense_cols = list(EXPENSE_COLS)
 
     # Compute Total_Expenses and Savings for consistency (even if already in the CSV)
     df['Total_Expenses'] = df[expense_cols].sum(axis=1)
@@ -28,9 +34,10 @@ def split_data(X_b, y):
     split_index = int(len(X_b) * 0.8)
     return X_b[:split_index], X_b[split_index:], y[:split_index], y[split_index:]
 
-# Train a linear regression model using the normal equation
+# Train a linear regression model by least squares
 def train_model(X_train, y_train):
-    theta = np.linalg.inv(X_train.T @ X_train) @ X_train.T @ y_train
+    # lstsq works on X directly instead of inverting XᵀX, which squares the condition number
+    theta = np.linalg.lstsq(X_train, y_train, rcond=None)[0]
     return theta
 
 # Make predictions using theta
@@ -41,27 +48,37 @@ def make_predictions(X, theta):
 def evaluate_model(y_pred, y_test):
     mse = np.mean((y_pred - y_test) ** 2)
     print(f" Lightweight Training Done | Test MSE: {mse:.2f}")
+    return float(mse)
 
-# Main training pipeline to return model parameters (theta) and column labels
-def train_and_return_theta():
-    df = load_data()
+# Training pipeline that also reports evaluation metrics (used by model_store)
+def train_and_evaluate(path=DATA_PATH):
+    df = load_data(path)
     X_b, y, expense_cols = preprocess_data(df)
     X_train, X_test, y_train, y_test = split_data(X_b, y)
     theta = train_model(X_train, y_train)
     y_pred = make_predictions(X_test, theta)
-    evaluate_model(y_pred, y_test)
+    mse = evaluate_model(y_pred, y_test)
+    metrics = {"test_mse": mse, "train_rows": len(X_train), "test_rows": len(X_test)}
+    return theta, expense_cols, metrics
+
+# Main training pipeline to return model parameters (theta) and column labels
+def train_and_return_theta():
+    theta, expense_cols, _ = train_and_evaluate()
     return theta, expense_cols
 
 # Function to predict savings given new user expense data
 def predict_savings(user_expenses, theta, expense_cols):
-    # Create a DataFrame for consistent ordering
-    df = pd.DataFrame([user_expenses], columns=expense_cols)
-
-    # Add bias (intercept) term
-    X = np.hstack([np.ones((df.shape[0], 1)), df.values])
+    # Order the inputs by the model's columns (missing categories count as 0)
+    x = np.fromiter((float(user_expenses.get(col, 0.0)) for col in expense_cols),
+                    dtype=float, count=len(expense_cols))
 
-    # Predict savings
-    predicted = X @ theta
+    # Intercept plus weighted expenses; return scalar float value safely
+    theta = np.ravel(theta)
+    return float(theta[0] + x @ theta[1:])
 
-    # Return scalar float value safely
-    return float(predicted[0])
\ No newline at end of file
+# Score many expense vectors at once: X is (n_rows, len(expense_cols)), returns (n_rows,)
+def predict_savings_batch(X, theta):
+    X = np.asarray(X, dtype=float)
+    theta = np.ravel(theta)
+    # Adding the intercept separately avoids building an (n, k + 1) copy of X
+    return X @ theta[1:] + theta[0]
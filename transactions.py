@@ -1,11 +1,28 @@
 # Import required modules
+import sqlite3
+import cache
 import database as db
 from datetime import datetime
 
 
+# view_transactions(): a user's transactions with the running net (received minus sent)
+RUNNING_BALANCE = dict(table_name="Transactions", columns="TransactionID, TransactionType, Amount, Date",
+                       amount_expression="CASE WHEN TransactionType = 'received' THEN Amount ELSE -Amount END",
+                       order_by="Date, TransactionID", where_clause="UserID = ?")
+
+
 class TransactionManager:
     def __init__(self, user_id):
         self.user_id = user_id  # Store user_id for use in methods
+        self._repo = None
+
+    # Resolved on every use, since moving the user to another shard changes
+    # their file; an open unit of work keeps its repository until it ends
+    @property
+    def repo(self):
+        if self._repo is None or not self._repo.in_unit_of_work:
+            self._repo = db.get_repository(self.user_id)
+        return self._repo
 
     # === Method to Add a New Transaction ===
     def add_transaction(self):
@@ -31,19 +48,19 @@ class TransactionManager:
         if not date:
             date = datetime.today().strftime('%Y-%m-%d')
 
-        # Prepare transaction record
-        transaction_data = {
-            "UserID": self.user_id,
-            "TransactionType": transaction_type,
-            "Amount": amount,
-            "Date": date
-        }
-
-        # Update the user's income based on the transaction type
-        self._update_income(transaction_type, amount)
-
-        # Insert the transaction into the Transactions table
-        db.insert_record("Transactions", transaction_data)
+        # The balance change and its transaction row commit together
+        try:
+            with self.repo.unit_of_work():
+                # Update the user's income based on the transaction type
+                if not self._update_income(transaction_type, amount):
+                    return
+
+                # Insert the transaction into the Transactions table
+                self.repo.add_transaction(self.user_id, transaction_type, amount, date)
+        except sqlite3.Error as e:
+            print(f"[ERROR] Transaction not saved: {e}")
+            return
+        cache.invalidate(self.user_id)
         print("[SUCCESS] Transaction added!")
 
     # === Private Method to Update User's Income ===
@@ -52,51 +69,44 @@ class TransactionManager:
         Update the user's income based on the transaction type.
         If the transaction is 'sent', subtract the amount.
         If the transaction is 'received', add the amount.
+        Only the transaction's own delta is applied; the current income is not re-read.
         """
-        # Fetch current income
-        user_record = db.get_records("User", "UserID = ?", (self.user_id,))
-        if not user_record:
-            print("[ERROR] User not found.")
-            return
-
-        current_income = user_record[0][3]  # Income is at index 3 in the User table
-
-        if transaction_type == "sent":
-            new_income = current_income - amount  # Subtract for sent transactions
-        elif transaction_type == "received":
-            new_income = current_income + amount  # Add for received transactions
+        delta = -amount if transaction_type == "sent" else amount
 
         # Update the income in the User table
-        db.update_record("User", {"Income": new_income}, "UserID = ?", (self.user_id,))
-        print(f"[SUCCESS] User's income updated to {new_income}.")
+        if not self.repo.adjust_income(self.user_id, delta):
+            print("[ERROR] User not found.")
+            return False
+        print(f"[SUCCESS] User's income adjusted by {delta:+}.")
+        return True
 
     # === Method to View All Transactions ===
     def view_transactions(self):
         print("\n=== Your Transactions ===")
 
         # Fetch the transactions for the user
-        transactions = db.get_records("Transactions", "UserID = ?", (self.user_id,))
+        # The running net (received minus sent) is computed by SQLite with a window function
+        transactions = db.running_balance(**RUNNING_BALANCE, where_values=(self.user_id,), user_id=self.user_id)
         if not transactions:
             print("No transactions found.")
             return
 
         # Fetch the current income for the user
-        user_record = db.get_records("User", "UserID = ?", (self.user_id,))
-        if not user_record:
+        current_income = self.repo.get_income(self.user_id)
+        if current_income is None:
             print("[ERROR] User not found.")
             return
 
-        current_income = user_record[0][3]  # Income is at index 3 in the User table
-
         # Display current income along with transactions
         print(f"Current Income: {current_income}")
 
         for i, txn in enumerate(transactions, 1):
             print(f"\nTransaction {i}")
-            print(f"ID            : {txn[0]}")
-            print(f"Type          : {txn[2]}")
-            print(f"Amount        : {txn[3]}")
-            print(f"Date          : {txn[4]}")
+            print(f"ID            : {txn['TransactionID']}")
+            print(f"Type          : {txn['TransactionType']}")
+            print(f"Amount        : {txn['Amount']}")
+            print(f"Date          : {txn['Date']}")
+            print(f"Running Net   : {txn['RunningBalance']:.2f}")
 
     # === Transaction Menu Loop ===
     def transaction_menu(self):
@@ -125,8 +135,7 @@ if __name__ == "__main__":
         user_id = input("Enter User ID to test: ")  # For testing purposes, you can replace this with a valid user_id
 
         # Check if the User ID exists in the database
-        user_record = db.get_records("User", "UserID = ?", (user_id,))
-        if not user_record:
+        if not db.get_repository(user_id).user_exists(user_id):
             print("[ERROR] User ID does not exist in the database. Please enter a valid User ID.")
         else:
             # If the user exists, proceed with Transaction Management
@@ -0,0 +1,177 @@
+# Group-commit writer: many concurrent units of work, one commit per batch
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import repository
+
+# Extra time the writer waits for more work before committing a batch. With 0
+# a batch is whatever queued up while the previous commit was running, which
+# already coalesces concurrent callers; a few milliseconds can help on disks
+# with slow fsync at the cost of added latency.
+DEFAULT_WINDOW = 0.0
+
+# Units of work coalesced into one commit at most
+DEFAULT_MAX_BATCH = 256
+
+# Seconds execute() waits for a job's commit before raising TimeoutError
+DEFAULT_TIMEOUT = 30.0
+
+
+class WriterError(Exception):
+    """The writer thread died; its queued jobs fail with this and new ones are refused"""
+
+
+class GroupCommitWriter:
+    """Run write jobs on one dedicated connection and commit them in batches.
+
+    A job is a callable taking a Repository (plus any extra arguments). Each
+    job runs inside its own SAVEPOINT, so a failing job is rolled back alone
+    while the rest of its batch commits. Futures resolve only after the
+    batch's COMMIT, so a caller never sees success for a write that was not
+    durable. Concurrent callers share one commit instead of paying for one
+    each. If the thread dies (e.g. the database cannot be opened), every
+    pending future fails with WriterError and later submits are refused.
+    """
+
+    def __init__(self, path=repository.DATABASE, window=DEFAULT_WINDOW, max_batch=DEFAULT_MAX_BATCH,
+                 timeout=DEFAULT_TIMEOUT):
+        self.path = path
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._error = None
+        self._metrics = {"jobs": 0, "failed": 0, "commits": 0, "commit_errors": 0, "commit_seconds": 0.0}
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(repo, *args, **kwargs); returns a Future for its result"""
+        future = Future()
+        with self._lock:
+            # Checked and queued under the lock so a dying thread drains every job it accepted
+            if self._error is not None:
+                raise WriterError(str(self._error)) from self._error.__cause__
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+            self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def execute(self, fn, *args, **kwargs):
+        """submit() and wait for the committed result.
+
+        Raises TimeoutError after self.timeout seconds; the job may still
+        commit later.
+        """
+        return self.submit(fn, *args, **kwargs).result(timeout=self.timeout)
+
+    def _next_batch(self):
+        """Block for one job, then take whatever else arrives within the window"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch and batch[-1] is not None:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        jobs = []
+        try:
+            conn = repository.connect(self.path)
+            try:
+                conn.execute("PRAGMA journal_mode = WAL;")
+                conn.execute("PRAGMA busy_timeout = 5000;")
+                repo = repository.Repository(conn)
+                while True:
+                    batch = self._next_batch()
+                    stop = batch[-1] is None
+                    jobs = [job for job in batch if job is not None]
+                    if jobs:
+                        self._commit(conn, repo, jobs)
+                    if stop:
+                        break
+            finally:
+                conn.close()
+        except BaseException as e:
+            self._fail(jobs, e)
+            raise
+
+    def _fail(self, jobs, cause):
+        """Refuse new jobs, then fail the unfinished batch and everything still queued"""
+        error = WriterError(f"Writer for {self.path} stopped: {cause!r}")
+        error.__cause__ = cause
+        with self._lock:
+            self._error = error
+        pending = list(jobs)
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for job in pending:
+            if job is not None and not job[3].done():
+                job[3].set_exception(error)
+
+    def _commit(self, conn, repo, jobs):
+        outcomes = []
+        started = time.perf_counter()
+        try:
+            with repo.unit_of_work():
+                for fn, args, kwargs, future in jobs:
+                    conn.execute("SAVEPOINT job")
+                    try:
+                        outcomes.append((future, fn(repo, *args, **kwargs), None))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO job")
+                        outcomes.append((future, None, e))
+                    conn.execute("RELEASE job")
+        except Exception as e:
+            # The COMMIT itself failed: nothing in the batch was written
+            with self._lock:
+                self._metrics["commit_errors"] += 1
+                self._metrics["failed"] += len(jobs)
+            for _, _, _, future in jobs:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self._metrics["jobs"] += len(jobs)
+            self._metrics["commits"] += 1
+            self._metrics["failed"] += sum(1 for _, _, error in outcomes if error is not None)
+            self._metrics["commit_seconds"] += time.perf_counter() - started
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def close(self):
+        """Finish queued work and stop the thread (a later submit() restarts it)"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
+
+    def stats(self):
+        with self._lock:
+            commits = self._metrics["commits"]
+            return {
+                **self._metrics,
+                "commit_seconds": round(self._metrics["commit_seconds"], 3),
+                "avg_batch": round(self._metrics["jobs"] / commits, 2) if commits else 0.0,
+                "pending": self._queue.qsize(),
+            }